@@ -0,0 +1,119 @@
+"""Compare the stdlib json with orjson on payloads like the ones our raw HTTP helpers handle.
+
+Usage: python bench_json.py [--repeat N]
+"""
+
+from nuclia_e2e import jsoncodec
+from tabulate import tabulate
+from timeit import repeat
+
+import argparse
+import json
+import random
+import string
+
+
+def _text(size: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " ", k=size))
+
+
+def activity_log_rows(count: int) -> list[bytes]:
+    """NDJSON lines of an activity log download, about 1 KB each."""
+    return [
+        json.dumps(
+            {
+                "id": i,
+                "date": "2025-01-01T00:00:00.000000",
+                "user_id": _text(32),
+                "user_type": "USER",
+                "client_type": "API",
+                "total_duration": random.random(),
+                "question": _text(120),
+                "answer": _text(600),
+                "retrieved_context": [{"text_block_id": _text(48), "text": _text(80)} for _ in range(2)],
+                "audit_metadata": {"key": "value"},
+            }
+        ).encode()
+        + b"\n"
+        for i in range(count)
+    ]
+
+
+def job_logs_page(count: int) -> str:
+    """A page of sync job logs."""
+    return json.dumps(
+        {
+            "logs": [
+                {
+                    "timestamp": "2025-01-01T00:00:00Z",
+                    "level": "INFO",
+                    "message": _text(200),
+                    "payload": {"file": _text(40), "status": "synced", "size": random.randint(0, 10**6)},
+                }
+                for _ in range(count)
+            ],
+            "next_page": _text(24),
+        }
+    )
+
+
+def small_response() -> str:
+    """A typical API response, e.g. a KB or a service account."""
+    return json.dumps({"id": _text(32), "slug": _text(20), "title": _text(40), "role": "SOWNER"})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if jsoncodec.orjson is None:
+        print("orjson is not installed, jsoncodec uses the stdlib json")
+        return
+
+    random.seed(0)
+    rows = activity_log_rows(10_000)
+    page = job_logs_page(1_000)
+    small = small_response()
+    body = json.loads(page)
+    cases = [
+        (
+            "decode activity log, 10k NDJSON lines",
+            lambda: [json.loads(r) for r in rows],
+            lambda: [jsoncodec.loads(r) for r in rows],
+            1,
+            sum(map(len, rows)),
+        ),
+        (
+            "decode job logs page, 1k entries",
+            lambda: json.loads(page),
+            lambda: jsoncodec.loads(page),
+            10,
+            len(page),
+        ),
+        (
+            "decode small response",
+            lambda: json.loads(small),
+            lambda: jsoncodec.loads(small),
+            10_000,
+            len(small),
+        ),
+        ("encode job logs page body", lambda: json.dumps(body), lambda: jsoncodec.dumps(body), 10, len(page)),
+    ]
+    table = []
+    for name, stdlib, fast, number, size in cases:
+        stdlib_time = min(repeat(stdlib, number=number, repeat=args.repeat)) / number
+        fast_time = min(repeat(fast, number=number, repeat=args.repeat)) / number
+        table.append(
+            [
+                name,
+                f"{size / 1024:.1f} KB",
+                f"{stdlib_time * 1e6:.1f}",
+                f"{fast_time * 1e6:.1f}",
+                f"{stdlib_time / fast_time:.1f}x",
+            ]
+        )
+    print(tabulate(table, headers=["payload", "size", "json (µs)", "orjson (µs)", "speedup"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,21 @@ import urllib.parse
 
 results_dir = Path("./results")
 timings_data = {}
+# Steps that retried, by env/zone, with their retry count, time lost to retries and time without them
+retried_steps = {}
+# Measured runs of the ingestion benchmark by env/zone, and whether a warm-up run preceded them
+timing_runs: dict[str, tuple[int, bool]] = {}
+# Statistics of the steps of env/zones that ran the ingestion benchmark more than once
+repeated_steps: dict[str, dict[str, dict]] = {}
 versions_data = {}
+# Preflight probes of each env/zone, run before the benchmark
+preflight_data = {}
+# Ingestion load benchmark results of each env/zone, by concurrency
+load_data = {}
+# Search benchmark latencies of each env/zone
+search_data = {}
+# Streaming benchmark medians of each env/zone, by model
+streaming_data: dict[str, dict[str, dict]] = {}
 descriptions = {}
 
 
@@ -51,8 +65,35 @@ if __name__ == "__main__":
             with Path(file).open() as f:
                 data = json.load(f)
                 timings_data[key] = {k: float(v["elapsed"]) for k, v in data.items()}
+                retried_steps[key] = {
+                    k: (int(v["retries"]), float(v["retry_time"]), float(v["request_time"]))
+                    for k, v in data.items()
+                    if int(v.get("retries", 0)) > 0
+                }
                 for k, v in data.items():
                     descriptions[k] = v["desc"]
+                # Files of single runs from before repetitions were supported have no "runs"
+                timing_runs[key] = (
+                    max((int(v.get("runs", 1)) for v in data.values()), default=1),
+                    any(v.get("warmup", False) for v in data.values()),
+                )
+                repeated_steps[key] = {k: v for k, v in data.items() if int(v.get("runs", 1)) > 1}
+        elif "__streaming" in name:
+            env_zone, model = name.replace("__streaming", "").rsplit("__", 1)
+            with Path(file).open() as f:
+                streaming_data.setdefault(env_zone, {})[model] = json.load(f)
+        elif "__search" in name:
+            key = name.replace("__search", "")
+            with Path(file).open() as f:
+                search_data[key] = json.load(f)
+        elif "__load" in name:
+            key = name.replace("__load", "")
+            with Path(file).open() as f:
+                load_data[key] = json.load(f)
+        elif "__preflight" in name:
+            key = name.replace("__preflight", "")
+            with Path(file).open() as f:
+                preflight_data[key] = json.load(f)
         elif "__versions" in name:
             key = name.replace(":versions", "")
             with Path(file).open() as f:
@@ -63,13 +104,159 @@ if __name__ == "__main__":
     timing_rows = []
 
     for env_zone in sorted(timings_data):
-        row = [env_zone] + [
-            f'{timings_data[env_zone].get(k, "-"):.3f}' if k in timings_data[env_zone] else "-"
+        runs, warmup = timing_runs[env_zone]
+        row = [env_zone, f"{runs}{' + warm-up' if warmup else ''}"] + [
+            (
+                f"{timings_data[env_zone][k]:.3f}{' ⚠️' if k in retried_steps[env_zone] else ''}"
+                if k in timings_data[env_zone]
+                else "-"
+            )
             for k in timing_keys
         ]
         timing_rows.append(row)
 
-    timing_table = tabulate(timing_rows, headers=["Env/Zone", *timing_keys], tablefmt="github")
+    timing_table = tabulate(timing_rows, headers=["Env/Zone", "Runs", *timing_keys], tablefmt="github")
+
+    # Build repeated runs table
+    repeated_rows = [
+        (
+            env_zone,
+            step,
+            stats["runs"],
+            stats["median"],
+            stats["p90"],
+            stats["min"],
+            stats["max"],
+            f"{stats['ci_low']} - {stats['ci_high']}",
+        )
+        for env_zone in sorted(repeated_steps)
+        for step, stats in sorted(repeated_steps[env_zone].items())
+    ]
+    repeated_table = tabulate(
+        repeated_rows,
+        headers=["Env/Zone", "Step", "Runs", "Median", "p90", "Min", "Max", "95% CI of the median"],
+        tablefmt="github",
+        disable_numparse=True,
+    )
+
+    # Build retried steps table
+    retry_rows = [
+        (env_zone, step, retries, f"{retry_time:.3f}", f"{request_time:.3f}")
+        for env_zone in sorted(retried_steps)
+        for step, (retries, retry_time, request_time) in sorted(retried_steps[env_zone].items())
+    ]
+    retry_table = tabulate(
+        retry_rows,
+        headers=["Env/Zone", "Step", "Retries", "Retry time", "Time without retries"],
+        tablefmt="github",
+    )
+
+    # Build ingestion load tables
+    load_rows = []
+    load_stage_rows: list[tuple[str, int, str, str, str, str, int]] = []
+    for env_zone in sorted(load_data):
+        for level in sorted(load_data[env_zone].values(), key=lambda level: level["concurrency"]):
+            load_rows.append(
+                (
+                    env_zone,
+                    level["concurrency"],
+                    level["documents"],
+                    level["elapsed"],
+                    level["files_per_second"],
+                    level["paragraphs_per_second"],
+                )
+            )
+            load_stage_rows.extend(
+                (
+                    env_zone,
+                    level["concurrency"],
+                    stage,
+                    quantiles["p50"],
+                    quantiles["p95"],
+                    quantiles["p99"],
+                    quantiles["retries"],
+                )
+                for stage, quantiles in level["stages"].items()
+            )
+    load_table = tabulate(
+        load_rows,
+        headers=["Env/Zone", "Concurrency", "Files", "Elapsed", "Files/s", "Paragraphs/s"],
+        tablefmt="github",
+    )
+    load_stage_table = tabulate(
+        load_stage_rows,
+        headers=["Env/Zone", "Concurrency", "Step", "p50", "p95", "p99", "Retries"],
+        tablefmt="github",
+    )
+
+    # Build search latency table
+    search_rows = [
+        (
+            env_zone,
+            search_data[env_zone]["concurrency"],
+            *step.split(":", 1),
+            latencies["requests"],
+            latencies["errors"],
+            latencies["p50"],
+            latencies["p95"],
+            latencies["p99"],
+        )
+        for env_zone in sorted(search_data)
+        for step, latencies in search_data[env_zone]["steps"].items()
+    ]
+    search_table = tabulate(
+        search_rows,
+        headers=[
+            "Env/Zone",
+            "Concurrency",
+            "Endpoint",
+            "Features",
+            "Requests",
+            "Errors",
+            "p50",
+            "p95",
+            "p99",
+        ],
+        tablefmt="github",
+    )
+
+    # Build streaming table
+    streaming_rows = [
+        (
+            env_zone,
+            model,
+            endpoint,
+            *(stream.get(metric, "-") for metric in ("ttfb", "ttft", "total", "tokens_per_second")),
+            f"{stream['errors']}/{stream['streams']}",
+        )
+        for env_zone in sorted(streaming_data)
+        for model in sorted(streaming_data[env_zone])
+        for endpoint, stream in streaming_data[env_zone][model].items()
+    ]
+    streaming_table = tabulate(
+        streaming_rows,
+        headers=["Env/Zone", "Model", "Endpoint", "TTFB", "TTFT", "Total", "Tokens/s", "Errors"],
+        tablefmt="github",
+    )
+
+    # Build preflight table
+    preflight_services = sorted({p["service"] for v in preflight_data.values() for p in v["probes"]})
+    preflight_rows = []
+    for env_zone in sorted(preflight_data):
+        probes = {p["service"]: p for p in preflight_data[env_zone]["probes"]}
+        row = [env_zone, "✅" if preflight_data[env_zone]["healthy"] else "❌"] + [
+            (
+                f"{probes[service]['latency']:.3f}{'' if probes[service]['ok'] else ' ❌'}"
+                if service in probes
+                else "-"
+            )
+            for service in preflight_services
+        ]
+        preflight_rows.append(row)
+
+    preflight_table = tabulate(
+        preflight_rows, headers=["Env/Zone", "Healthy", *preflight_services], tablefmt="github"
+    )
 
     # Build version table
     version_keys = sorted({k for v in versions_data.values() for k in v})
@@ -108,6 +295,49 @@ if __name__ == "__main__":
             f.write(f"- `{key}`: {descriptions.get(key, '')}\n")
         f.write("\n")
 
+        if repeated_rows:
+            f.write("#### 🔁 Repeated runs\n")
+            f.write(
+                "\nSpread of the steps of env/zones measured more than once, whose timings above are the"
+                " median of their runs\n"
+            )
+            f.write(repeated_table + "\n\n")
+
+        if retry_rows:
+            f.write("#### ⚠️ Steps with retries\n")
+            f.write(
+                "\nThese timings include time lost to retried requests, and shouldn't be compared with the"
+                " rest. The times of repeated steps are the medians of their runs, and their retries those of"
+                " all of them\n"
+            )
+            f.write(retry_table + "\n\n")
+
+        if search_rows:
+            f.write("### 🔎 Search latency\n")
+            f.write(
+                "\nLatency in seconds of find and ask by features, without retries (failures are errors)\n"
+            )
+            f.write(search_table + "\n\n")
+
+        if streaming_rows:
+            f.write("### 🌊 Streaming\n")
+            f.write(
+                "\nMedian seconds to first byte, to first answer token and in total, and output tokens/s\n"
+            )
+            f.write(streaming_table + "\n\n")
+
+        if load_rows:
+            f.write("### 🚚 Ingestion under load\n")
+            f.write("\nThroughput ingesting many files, keeping as many in flight as the concurrency\n")
+            f.write(load_table + "\n\n")
+            f.write("#### ⏱️ Step timings under load\n")
+            f.write(load_stage_table + "\n\n")
+
+        if preflight_rows:
+            f.write("#### 🩺 Preflight\n")
+            f.write("\nLatency in seconds of the probes of each service, before the benchmark started\n")
+            f.write(preflight_table + "\n\n")
+
         f.write("\n### 🔍 Trace Links\n")
         f.write(
             "\nThis traces correspond to the nucliadb call that sends to process the file."
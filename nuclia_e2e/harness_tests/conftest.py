@@ -0,0 +1,19 @@
+"""Tests of the e2e harness itself, run offline against local fakes (`make test-harness`).
+
+The settings are validated when first read, so they get placeholders: nothing here talks to a real zone.
+"""
+
+import os
+
+for name, value in {
+    "TEST_ENV": "stage",
+    "GRAFANA_URL": "http://grafana.invalid",
+    "STAGE_GLOBAL_RECAPTCHA": "-",
+    "STAGE_ROOT_PAT_TOKEN": "-",
+    "STAGE_PERMAMENT_ACCOUNT_OWNER_PAT_TOKEN": "-",
+    "TEST_GMAIL_APP_PASSWORD": "-",
+    "STAGE_GCP_EUROPE1_NUA": "-",
+}.items():
+    os.environ.setdefault(name, value)
+
+pytest_plugins = ["pytester"]
@@ -0,0 +1,27 @@
+from nuclia_e2e.clients import CONNECTION_STATS
+from nuclia_e2e.clients import ConnectionTracingTransport
+from uuid import uuid4
+
+import httpx
+import pytest
+
+
+class Connecting(httpx.AsyncBaseTransport):
+    """Transport tracing a new connection for every request, as httpcore does."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = request.extensions["trace"]
+        await trace("connection.connect_tcp.started", {})
+        await trace("connection.connect_tcp.complete", {})
+        return httpx.Response(200)
+
+
+@pytest.mark.asyncio_cooperative
+async def test_requests_sent_again_are_traced_once_per_send():
+    host = f"{uuid4()}.invalid"
+    transport = ConnectionTracingTransport(Connecting())
+    request = httpx.Request("GET", f"http://{host}/find")
+    await transport.handle_async_request(request)
+    await transport.handle_async_request(request)
+    assert CONNECTION_STATS[host].connections == 2
+    assert CONNECTION_STATS[host].requests == 2
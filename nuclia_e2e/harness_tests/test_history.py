@@ -0,0 +1,75 @@
+from nuclia_e2e.history import BenchmarkStore
+from pathlib import Path
+
+import json
+
+RESULTS = {
+    "prod__europe-1__timings.json": {"index_ready": {"elapsed": "12.500", "retries": 0}},
+    "prod__europe-1__versions.json": {"nucliadb": "6.4.0"},
+    "prod__europe-1__search.json": {
+        "concurrency": 8,
+        "steps": {"find:keyword": {"requests": 1500, "errors": 0, "p50": "0.120"}},
+    },
+    "prod__europe-1__chatgpt-azure-4o__streaming.json": {"ask": {"streams": 3, "errors": 1, "ttfb": "0.800"}},
+    "prod__europe-1__load.json": {
+        "8": {"files_per_second": "1.250", "stages": {"processing": {"p50": "40.000"}}}
+    },
+    "prod__europe-1__preflight.json": {
+        "healthy": True,
+        "probes": [{"service": "nua", "ok": True, "latency": 0.3, "error": None}],
+    },
+}
+
+
+def test_every_benchmark_is_recorded(tmp_path: Path):
+    for name, results in RESULTS.items():
+        (tmp_path / name).write_text(json.dumps(results))
+    with BenchmarkStore(tmp_path / "history.sqlite") as store:
+        recorded = store.record_results(tmp_path, "1234")
+
+        assert sorted(benchmark for _, _, benchmark in recorded) == [
+            "load",
+            "preflight",
+            "search",
+            "streaming",
+            "timings",
+        ]
+        assert [run.versions for run in store.runs()] == [{"nucliadb": "6.4.0"}]
+        assert [step.elapsed for step in store.step_history("index_ready", "europe-1")] == [12.5]
+        for benchmark, metric, value in [
+            ("search", "steps.find:keyword.p50", 0.12),
+            ("streaming", "chatgpt-azure-4o.ask.errors", 1),
+            ("load", "8.stages.processing.p50", 40),
+            ("preflight", "probes.nua.latency", 0.3),
+            ("preflight", "healthy", 1),
+        ]:
+            assert [record.value for record in store.metric_history(benchmark, metric, "europe-1")] == [value]
+
+
+def test_recording_a_run_again_keeps_its_metrics(tmp_path: Path):
+    for name in ("prod__europe-1__search.json", "prod__europe-1__timings.json"):
+        (tmp_path / name).write_text(json.dumps(RESULTS[name]))
+    with BenchmarkStore(tmp_path / "history.sqlite") as store:
+        store.record_results(tmp_path, "1234")
+        store.record_results(tmp_path, "1234")
+        assert len(store.runs()) == 1
+        assert len(store.metric_history("search", "steps.find:keyword.p50", "europe-1")) == 1
+
+
+def test_shards_of_a_run_are_merged(tmp_path: Path):
+    for shard, name in enumerate(("prod__europe-1__timings.json", "prod__europe-1__search.json")):
+        results_dir = tmp_path / f"shard-{shard}"
+        results_dir.mkdir()
+        (results_dir / name).write_text(json.dumps(RESULTS[name]))
+        with BenchmarkStore(tmp_path / f"shard-{shard}.sqlite") as store:
+            store.record_results(results_dir, "1234")
+
+    with BenchmarkStore(tmp_path / "history.sqlite") as store:
+        store.merge(tmp_path / "shard-0.sqlite")
+        store.merge(tmp_path / "shard-1.sqlite")
+
+        assert len(store.runs()) == 1
+        assert [step.elapsed for step in store.step_history("index_ready", "europe-1")] == [12.5]
+        assert [
+            record.value for record in store.metric_history("search", "steps.find:keyword.p50", "europe-1")
+        ] == [0.12]
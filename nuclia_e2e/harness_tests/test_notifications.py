@@ -0,0 +1,151 @@
+from collections.abc import AsyncIterator
+from nuclia.lib.kb import AsyncNucliaDBClient
+from nuclia.lib.kb import Environment
+from nuclia_e2e.notifications import NotificationWaiter
+from nuclia_e2e.polling import Fixed
+from nucliadb_models.notifications import NotificationType
+from typing import Any
+
+import asyncio
+import httpx
+import json
+import pytest
+
+KB_URL = "http://nucliadb.invalid/api/v1/kb/kbid"
+
+
+class FakeStream:
+    """Serves the notifications stream of a KB, sending the lines put in it. `None` closes the stream, an
+    exception drops it."""
+
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+        self.lines: asyncio.Queue[str | Exception | None] = asyncio.Queue()
+
+    def notify(self, event_type: NotificationType, rid: str, seqid: int) -> None:
+        data = {"resource_uuid": rid, "resource_title": "title", "seqid": seqid}
+        self.lines.put_nowait(json.dumps({"type": event_type.value, "data": data}))
+
+    async def _body(self) -> AsyncIterator[bytes]:
+        while (line := await self.lines.get()) is not None:
+            if isinstance(line, Exception):
+                raise line
+            yield f"{line}\n".encode()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith("/notifications")
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, json={"detail": "unavailable"})
+        return httpx.Response(200, content=self._body())
+
+    def client(self) -> AsyncNucliaDBClient:
+        ndb = AsyncNucliaDBClient(environment=Environment.OSS, url=KB_URL)
+        ndb.reader_session = httpx.AsyncClient(transport=httpx.MockTransport(self.handle), base_url=KB_URL)
+        return ndb
+
+
+class Condition:
+    """Polling condition that succeeds from its `succeed_at`-th check on."""
+
+    def __init__(self, succeed_at: int | None = None):
+        self.succeed_at = succeed_at
+        self.checks = 0
+
+    async def __call__(self) -> tuple[bool, Any]:
+        self.checks += 1
+        return self.succeed_at is not None and self.checks >= self.succeed_at, None
+
+    @property
+    def __name__(self) -> str:
+        return "condition"
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_returns_the_event_when_it_arrives():
+    stream = FakeStream()
+    condition = Condition()
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        assert waiter.connected
+        asyncio.get_running_loop().call_later(
+            0.05, stream.notify, NotificationType.RESOURCE_PROCESSED, "rid", 1
+        )
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED, "rid", max_wait=5, fallback=condition
+        )
+    assert success
+    assert event is not None
+    assert (event.resource_uuid, event.seqid) == ("rid", 1)
+    assert condition.checks == 0
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_ignores_other_events():
+    stream = FakeStream()
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        stream.notify(NotificationType.RESOURCE_INDEXED, "rid", 1)
+        stream.notify(NotificationType.RESOURCE_PROCESSED, "other", 1)
+        stream.notify(NotificationType.RESOURCE_PROCESSED, "rid", 1)
+        stream.notify(NotificationType.RESOURCE_PROCESSED, "rid", 2)
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED, "rid", min_seqid=2, max_wait=5
+        )
+    assert success
+    assert event is not None
+    assert event.seqid == 2
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_checks_the_fallback_when_the_event_never_arrives():
+    stream = FakeStream()
+    condition = Condition(succeed_at=2)
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED, "rid", max_wait=5, fallback=condition, check_interval=0.05
+        )
+        assert waiter.connected
+    assert (success, event) == (True, None)
+    assert condition.checks == 2
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_checks_the_fallback_at_the_deadline():
+    stream = FakeStream()
+    condition = Condition()
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED, "rid", max_wait=0.2, fallback=condition, check_interval=10
+        )
+    assert (success, event) == (False, None)
+    assert condition.checks == 1
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_polls_when_the_stream_drops():
+    stream = FakeStream()
+    condition = Condition(succeed_at=3)
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        stream.lines.put_nowait(httpx.ReadError("connection lost"))
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED,
+            "rid",
+            max_wait=5,
+            fallback=condition,
+            schedule=Fixed(0.01),
+            check_interval=10,
+        )
+        assert not waiter.connected
+    assert (success, event) == (True, None)
+    assert condition.checks == 3
+
+
+@pytest.mark.asyncio_cooperative
+async def test_wait_polls_when_the_stream_is_not_available():
+    stream = FakeStream(status_code=503)
+    condition = Condition(succeed_at=2)
+    async with NotificationWaiter(stream.client(), logger=lambda msg: None) as waiter:
+        assert not waiter.connected
+        success, event = await waiter.wait(
+            NotificationType.RESOURCE_PROCESSED, "rid", max_wait=5, fallback=condition, schedule=Fixed(0.01)
+        )
+    assert (success, event) == (True, None)
+    assert condition.checks == 2
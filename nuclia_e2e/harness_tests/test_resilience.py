@@ -0,0 +1,141 @@
+from collections.abc import Iterator
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.resilience import call_with_policy
+from nuclia_e2e.resilience import call_with_policy_sync
+from nuclia_e2e.resilience import CallOutcome
+from nuclia_e2e.resilience import circuit_breaker
+from nuclia_e2e.resilience import CIRCUIT_BREAKERS
+from nuclia_e2e.resilience import CircuitBreaker
+from nuclia_e2e.resilience import CircuitBreakerTransport
+from nuclia_e2e.resilience import CircuitState
+from nuclia_e2e.resilience import is_transient
+from nuclia_e2e.resilience import observe_calls
+from nuclia_e2e.resilience import RETRY_BUDGETS
+from nuclia_e2e.resilience import RetryBudget
+from nuclia_e2e.resilience import RetryBudgetExhaustedError
+from nuclia_e2e.resilience import RetryPolicy
+from nuclia_e2e.resilience import status_code_of
+from nuclia_e2e.resilience import was_not_processed
+from uuid import uuid4
+
+import asyncio
+import httpx
+import nucliadb_sdk
+import pytest
+
+POLICY = RetryPolicy("harness", retry_on=(ValueError,), max_attempts=3, schedule=Fixed(0))
+
+
+def fail() -> None:
+    err_msg = "flaky"
+    raise ValueError(err_msg)
+
+
+async def fail_async() -> None:
+    fail()
+
+
+@pytest.fixture
+def empty_budget() -> Iterator[str]:
+    zone = "harness-empty-budget"
+    RETRY_BUDGETS[zone] = RetryBudget(ratio=0, per_second=0, capacity=0)
+    yield zone
+    del RETRY_BUDGETS[zone]
+
+
+def test_retries_denied_by_the_budget_are_failures(empty_budget: str):
+    outcomes: list[CallOutcome] = []
+    with observe_calls(outcomes.append), pytest.raises(RetryBudgetExhaustedError):
+        call_with_policy_sync(POLICY, empty_budget, "fail", fail)
+    assert [outcome.outcome for outcome in outcomes if outcome.policy == POLICY.name] == ["failure"]
+
+
+@pytest.mark.asyncio_cooperative
+async def test_async_retries_denied_by_the_budget_are_failures(empty_budget: str):
+    outcomes: list[CallOutcome] = []
+    with observe_calls(outcomes.append), pytest.raises(RetryBudgetExhaustedError):
+        await call_with_policy(POLICY, empty_budget, "fail", fail_async)
+    assert [outcome.outcome for outcome in outcomes if outcome.policy == POLICY.name] == ["failure"]
+
+
+class Endpoint:
+    """Transport answering with the responses, or raising the errors, queued in `results`."""
+
+    def __init__(self, *results: int | BaseException):
+        self.results = list(results)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        result = self.results.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return httpx.Response(result)
+
+    def client(self, zone: str) -> httpx.AsyncClient:
+        transport = CircuitBreakerTransport(httpx.MockTransport(self.handle))
+        return httpx.AsyncClient(transport=transport, base_url=f"http://{zone}")
+
+
+@pytest.fixture
+def open_circuit() -> Iterator[CircuitBreaker]:
+    """The circuit of the find endpoint of a zone of its own (tests run concurrently), open and ready to be
+    probed."""
+    breaker = circuit_breaker(f"harness-{uuid4().hex}", "/kb/*/find")
+    breaker.record_failure("HTTP 503", None)
+    breaker.state = CircuitState.OPEN
+    breaker.reset_after = 0
+    yield breaker
+    del CIRCUIT_BREAKERS[(breaker.zone, breaker.family)]
+
+
+@pytest.mark.asyncio_cooperative
+@pytest.mark.parametrize(
+    "error", [asyncio.CancelledError(), httpx.WriteError("broken pipe"), RuntimeError("bug")], ids=type
+)
+async def test_probes_ending_without_an_answer_let_the_next_call_probe(
+    open_circuit: CircuitBreaker, error: BaseException
+):
+    endpoint = Endpoint(error, 200)
+    async with endpoint.client(open_circuit.zone) as client:
+        with pytest.raises(type(error)):
+            await client.get("/api/v1/kb/kbid/find")
+        assert open_circuit.state == CircuitState.HALF_OPEN
+        response = await client.get("/api/v1/kb/kbid/find")
+    assert response.status_code == 200
+    assert open_circuit.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio_cooperative
+async def test_timeouts_open_the_circuit(open_circuit: CircuitBreaker):
+    endpoint = Endpoint(httpx.ReadTimeout("hung"))
+    async with endpoint.client(open_circuit.zone) as client:
+        with pytest.raises(httpx.ReadTimeout):
+            await client.get("/api/v1/kb/kbid/find")
+        assert open_circuit.state == CircuitState.OPEN
+
+
+@pytest.mark.parametrize(
+    ("exc", "status_code"),
+    [
+        (
+            httpx.HTTPStatusError(
+                "Server error", request=httpx.Request("GET", "http://kb"), response=httpx.Response(503)
+            ),
+            503,
+        ),
+        (nucliadb_sdk.v2.exceptions.RateLimitError("Rate limited"), 429),
+        (nucliadb_sdk.v2.exceptions.UnknownError("Unknown error connecting to API: 502: Bad Gateway"), 502),
+        (RuntimeError("Stream request failed with status 504: upstream timed out"), 504),
+        (RuntimeError("Timed out after 503 attempts"), None),
+        (nucliadb_sdk.v2.exceptions.NotFoundError("Resource 429 not found"), None),
+    ],
+)
+def test_status_code_of(exc: BaseException, status_code: int | None):
+    assert status_code_of(exc) == status_code
+    assert is_transient(exc) is (status_code in {429, 502, 503, 504})
+
+
+@pytest.mark.parametrize("exc_type", [httpx.ConnectTimeout, httpx.PoolTimeout])
+def test_requests_not_sent_in_time_are_retried(exc_type: type[httpx.TimeoutException]):
+    exc = exc_type("timed out", request=httpx.Request("POST", "http://kb/resources"))
+    assert is_transient(exc)
+    assert was_not_processed(exc)
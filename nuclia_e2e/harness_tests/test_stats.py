@@ -0,0 +1,21 @@
+from nuclia_e2e.stats import percentile
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    ("values", "p", "expected"),
+    [
+        (range(1, 11), 90, 9),
+        (range(1, 11), 50, 5),
+        (range(1, 11), 100, 10),
+        (range(1, 11), 0, 1),
+        (range(1, 21), 95, 19),
+        (range(1, 101), 99, 99),
+        ([2, 1], 50, 1),
+        ([3], 99, 3),
+        ([], 50, 0),
+    ],
+)
+def test_percentile_is_the_nearest_rank(values: range | list[int], p: float, expected: float):
+    assert percentile(values, p) == expected
@@ -0,0 +1,71 @@
+from nuclia_e2e.telemetry import RunTelemetry
+from prometheus_client import CollectorRegistry
+from typing import Any
+
+import prometheus_client
+import pytest
+
+CONFTEST = """
+from nuclia_e2e.telemetry import attribute_to_tests
+
+
+def pytest_collection_modifyitems(items):
+    attribute_to_tests(items)
+"""
+
+TESTS = """
+from nuclia_e2e.telemetry import current_test
+
+import asyncio
+import pytest
+
+
+@pytest.fixture
+async def zone():
+    yield "europe-1"
+
+
+@pytest.fixture
+def kbid():
+    return "kbid"
+
+
+@pytest.mark.asyncio_cooperative
+async def test_first(zone, kbid):
+    await asyncio.sleep(0.01)
+    assert current_test.get() == "test_cooperative.py::test_first"
+
+
+@pytest.mark.asyncio_cooperative
+async def test_second(zone):
+    await asyncio.sleep(0.01)
+    assert current_test.get() == "test_cooperative.py::test_second"
+
+
+def test_sync(kbid):
+    assert current_test.get() == "test_cooperative.py::test_sync"
+"""
+
+
+def test_cooperative_tests_are_attributed_to_themselves(pytester: pytest.Pytester):
+    pytester.makeconftest(CONFTEST)
+    pytester.makepyfile(test_cooperative=TESTS)
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=3)
+
+
+def test_gauges_with_and_without_labels_are_pushed(monkeypatch: pytest.MonkeyPatch):
+    pushed: list[CollectorRegistry] = []
+
+    def push_to_gateway(gateway: str, job: str, registry: CollectorRegistry, **kwargs: Any) -> None:
+        pushed.append(registry)
+
+    monkeypatch.setattr(prometheus_client, "push_to_gateway", push_to_gateway)
+    telemetry = RunTelemetry()
+    telemetry.set_gauge("e2e_collection_seconds", "Collection time", 2.5)
+    telemetry.set_gauge("e2e_preflight_healthy", "Healthy zones", 1, zone="europe-1")
+    telemetry.push("http://pushgateway.invalid", job="e2e", instance="1234")
+
+    [registry] = pushed
+    assert registry.get_sample_value("e2e_collection_seconds") == 2.5
+    assert registry.get_sample_value("e2e_preflight_healthy", {"zone": "europe-1"}) == 1
@@ -0,0 +1,367 @@
+"""Measurements of the benchmarks, and where they are reported to.
+
+Benchmarks time their steps with `Timer`, write their results as JSON files next to the test run (collected
+by `generate_summary.py`) and push them to the Prometheus pushgateway with `push_timings_to_prometheus`.
+"""
+
+from collections.abc import Mapping
+from contextlib import AbstractContextManager
+from datetime import datetime
+from datetime import timezone
+from nuclia_e2e.resilience import CallOutcome
+from nuclia_e2e.resilience import observe_calls
+from nuclia_e2e.settings import settings
+from nuclia_e2e.stats import bootstrap_interval
+from nuclia_e2e.stats import percentile
+from pathlib import Path
+from typing import Any
+
+import bisect
+import dataclasses
+import statistics
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Timer:
+    """Measures a benchmark step, and the time lost to retries of the calls made while observing them.
+
+    Retries aren't reflected in the step start and end times, so a step that retried is still measured as a
+    whole in `elapsed`, `request_time` being an estimate of how long it would have taken without them.
+    """
+
+    def __init__(self, desc: str):
+        self.desc = desc
+        self.start_time: datetime | None = None
+        self.end_time: datetime | None = None
+        self.retries = 0
+        # Seconds spent on failed attempts and waiting between attempts
+        self.retry_time = 0.0
+
+    @property
+    def elapsed(self):
+        delta = self.end_time - self.start_time
+        return delta.total_seconds()
+
+    @property
+    def request_time(self) -> float:
+        return max(self.elapsed - self.retry_time, 0.0)
+
+    @property
+    def retried(self) -> bool:
+        return self.retries > 0
+
+    def start(self, dt: datetime | None = None):
+        self.start_time = dt if dt is not None else datetime.now(timezone.utc)
+        return self.start_time
+
+    def stop(self, dt: datetime | None = None):
+        self.end_time = dt if dt is not None else datetime.now(timezone.utc)
+        return self.end_time
+
+    def _record(self, outcome: CallOutcome) -> None:
+        if outcome.outcome == "retry":
+            self.retries += 1
+            self.retry_time += outcome.duration + outcome.delay
+
+    def observe_retries(self) -> AbstractContextManager[None]:
+        """Account the retries of the calls made by this task inside the block to this step."""
+        return observe_calls(self._record)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "elapsed": f"{self.elapsed:.3f}",
+            "desc": self.desc,
+            "request_time": f"{self.request_time:.3f}",
+            "retry_time": f"{self.retry_time:.3f}",
+            "retries": self.retries,
+        }
+
+
+@dataclasses.dataclass
+class StepRuns:
+    """The `Timer`s of the same step over repeated runs of a benchmark, summarized.
+
+    Quacks like a `Timer` whose `elapsed`, `request_time` and `retry_time` are the medians of the runs, and
+    whose `retries` are those of all of them, so repeated and single runs are reported the same way.
+    """
+
+    desc: str
+    timers: list[Timer]
+    # Whether a discarded run warmed up the caches before the measured ones
+    warmup: bool = False
+
+    @property
+    def samples(self) -> list[float]:
+        return [timer.elapsed for timer in self.timers]
+
+    @property
+    def elapsed(self) -> float:
+        return statistics.median(self.samples)
+
+    @property
+    def request_time(self) -> float:
+        return statistics.median(timer.request_time for timer in self.timers)
+
+    @property
+    def retry_time(self) -> float:
+        return statistics.median(timer.retry_time for timer in self.timers)
+
+    @property
+    def retries(self) -> int:
+        return sum(timer.retries for timer in self.timers)
+
+    @property
+    def retried(self) -> bool:
+        return self.retries > 0
+
+    def stats(self) -> dict[str, float]:
+        """Median, p90, min, max and the bounds of the 95% bootstrap confidence interval of the median."""
+        samples = self.samples
+        ci_low, ci_high = bootstrap_interval(samples)
+        return {
+            "median": self.elapsed,
+            "p90": percentile(samples, 90),
+            "min": min(samples),
+            "max": max(samples),
+            "ci_low": ci_low,
+            "ci_high": ci_high,
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        """`Timer.to_json`, plus the number of runs and their statistics."""
+        return {
+            "elapsed": f"{self.elapsed:.3f}",
+            "desc": self.desc,
+            "request_time": f"{self.request_time:.3f}",
+            "retry_time": f"{self.retry_time:.3f}",
+            "retries": self.retries,
+            "runs": len(self.timers),
+            "warmup": self.warmup,
+            **{stat: f"{value:.3f}" for stat, value in self.stats().items()},
+            "samples": [f"{sample:.3f}" for sample in self.samples],
+        }
+
+
+@dataclasses.dataclass
+class LatencySamples:
+    """Latencies of the successful calls to an endpoint, without retries, and how many calls failed."""
+
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    errors: int = 0
+
+    def quantiles(self) -> dict[str, float]:
+        return {f"p{p}": percentile(self.latencies, p) for p in (50, 95, 99)}
+
+    def histogram(self) -> dict[str, int]:
+        """Calls by latency bucket, named after their upper bound."""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        return dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], counts, strict=True))
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "requests": len(self.latencies) + self.errors,
+            "errors": self.errors,
+            **{quantile: f"{value:.3f}" for quantile, value in self.quantiles().items()},
+            "histogram": self.histogram(),
+        }
+
+
+@dataclasses.dataclass
+class StreamTiming:
+    """Seconds since a streamed request was sent until the response headers arrived (`ttfb`), the first
+    token of the answer did and the stream ended, and the tokens generated, if the stream said."""
+
+    ttfb: float
+    ttft: float | None
+    total: float
+    output_tokens: int | None
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        """Generation speed once the answer started."""
+        if self.ttft is None or self.output_tokens is None or self.total <= self.ttft:
+            return None
+        return self.output_tokens / (self.total - self.ttft)
+
+
+@dataclasses.dataclass
+class StreamSamples:
+    """Timings of the streams of an endpoint, and how many of them failed."""
+
+    timings: list[StreamTiming] = dataclasses.field(default_factory=list)
+    errors: int = 0
+
+    def medians(self) -> dict[str, float]:
+        """Median of each metric, over the streams that reported it."""
+        metrics = {
+            "ttfb": [timing.ttfb for timing in self.timings],
+            "ttft": [timing.ttft for timing in self.timings if timing.ttft is not None],
+            "total": [timing.total for timing in self.timings],
+            "tokens_per_second": [
+                tps for timing in self.timings if (tps := timing.tokens_per_second) is not None
+            ],
+        }
+        return {metric: percentile(values, 50) for metric, values in metrics.items() if values}
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "streams": len(self.timings) + self.errors,
+            "errors": self.errors,
+            **{metric: f"{value:.3f}" for metric, value in self.medians().items()},
+        }
+
+
+def push_timings_to_prometheus(
+    timings: Mapping[str, Timer | StepRuns],
+    job_name: str,
+    instance: str,
+    benchmark_type: str,
+    cluster: str,
+    extra_labels: dict[str, str] | None = None,
+    gateway_url: str | None = None,
+    grouping_key: dict[str, str] | None = None,
+    quantiles: dict[str, dict[str, float]] | None = None,
+    throughput: dict[str, float] | None = None,
+    histograms: dict[str, list[float]] | None = None,
+):
+    """Push the duration of each step in `timings` and, for benchmarks measuring many runs of the steps,
+    their `quantiles` (by step and quantile name), `throughput` (by unit) and the `histograms` of their
+    durations (by step). Pushes replace the metrics of the same job and `grouping_key` (on top of the
+    instance)."""
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+    from prometheus_client import push_to_gateway
+
+    registry = CollectorRegistry()
+
+    base_labels = {
+        "benchmark_type": benchmark_type,
+        "k8s_cluster": cluster,
+        "step": "",  # Placeholder, set dynamically below
+    }
+    if extra_labels:
+        base_labels.update(extra_labels)
+
+    # Create a gauge with dynamic label names. Samples of steps that retried are labelled with retried="true",
+    # so they can be filtered out.
+    label_names = [*base_labels.keys(), "retried"]
+    g = Gauge(
+        name="benchmark_step_duration_seconds",
+        documentation="Elapsed time for each step in benchmark (in seconds)",
+        labelnames=label_names,
+        registry=registry,
+    )
+    request_gauge = Gauge(
+        name="benchmark_step_request_seconds",
+        documentation="Elapsed time for each step in benchmark without retries (in seconds)",
+        labelnames=label_names,
+        registry=registry,
+    )
+    retry_time_gauge = Gauge(
+        name="benchmark_step_retry_seconds",
+        documentation="Time lost to retries in each step in benchmark (in seconds)",
+        labelnames=label_names,
+        registry=registry,
+    )
+    retries_gauge = Gauge(
+        name="benchmark_step_retries",
+        documentation="Number of retries in each step in benchmark",
+        labelnames=label_names,
+        registry=registry,
+    )
+
+    for step_name, timer in timings.items():
+        labels = base_labels.copy()
+        labels["step"] = step_name
+        labels["retried"] = str(timer.retried).lower()
+        g.labels(**labels).set(timer.elapsed)
+        request_gauge.labels(**labels).set(timer.request_time)
+        retry_time_gauge.labels(**labels).set(timer.retry_time)
+        retries_gauge.labels(**labels).set(timer.retries)
+
+    _add_aggregates(registry, base_labels, quantiles, throughput, histograms)
+
+    # Push to Pushgateway
+    push_to_gateway(
+        gateway_url or settings.prometheus_pushgateway,
+        job=job_name,
+        grouping_key={"instance": instance, **(grouping_key or {})},
+        registry=registry,
+    )
+
+
+def _add_aggregates(
+    registry: Any,
+    base_labels: dict[str, str],
+    quantiles: dict[str, dict[str, float]] | None,
+    throughput: dict[str, float] | None,
+    histograms: dict[str, list[float]] | None,
+):
+    from prometheus_client import Gauge
+    from prometheus_client import Histogram
+
+    if quantiles:
+        quantile_gauge = Gauge(
+            name="benchmark_step_duration_quantile_seconds",
+            documentation="Quantiles of the elapsed time for each step in benchmark (in seconds)",
+            labelnames=[*base_labels.keys(), "quantile"],
+            registry=registry,
+        )
+        for step_name, step_quantiles in quantiles.items():
+            for quantile, value in step_quantiles.items():
+                quantile_gauge.labels(**{**base_labels, "step": step_name, "quantile": quantile}).set(value)
+
+    if throughput:
+        throughput_labels = {k: v for k, v in base_labels.items() if k != "step"}
+        throughput_gauge = Gauge(
+            name="benchmark_throughput",
+            documentation="Items completed per second in benchmark",
+            labelnames=[*throughput_labels.keys(), "unit"],
+            registry=registry,
+        )
+        for unit, value in throughput.items():
+            throughput_gauge.labels(**throughput_labels, unit=unit).set(value)
+
+    if histograms:
+        histogram = Histogram(
+            name="benchmark_step_latency_seconds",
+            documentation="Distribution of the elapsed time for each step in benchmark (in seconds)",
+            labelnames=list(base_labels.keys()),
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        for step_name, durations in histograms.items():
+            step_histogram = histogram.labels(**{**base_labels, "step": step_name})
+            for duration in durations:
+                step_histogram.observe(duration)
+
+
+def get_application_set_version(file_path, cluster):
+    import yaml
+
+    try:
+        with Path(file_path).open() as file:
+            yaml_data = yaml.safe_load(file)
+            versions = {
+                item["cluster"]: item["app_chart_version"]
+                for item in yaml_data["spec"]["generators"][0]["list"]["elements"]
+            }
+            if cluster not in versions:
+                raise RuntimeError(f"Cluster {cluster} not defined in {file_path}")
+            return versions[cluster]
+    except FileNotFoundError as exc:
+        err_msg = f"ApplicationSet not found at {file_path}, refresh local repos"
+        raise RuntimeError(err_msg) from exc
+
+
+def extract_versions(components, cluster):
+    versions = {}
+    for component_name in components:
+        app_set_file = f"{settings.core_apps_repo_path}/apps/{component_name}.applicationSet.yaml"
+        label_component_name = component_name.replace("-", "_")
+        versions[label_component_name] = get_application_set_version(app_set_file, cluster)
+    return versions
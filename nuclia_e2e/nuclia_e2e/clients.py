@@ -0,0 +1,181 @@
+"""Clients shared by all the tests of the session, so they reuse pooled keep-alive connections.
+
+Building a client per test (or per helper call) means a new connection pool, and new TLS handshakes, every
+time. `ClientPool` hands out a single client per key, for instance (zone, kbid, credential) for NucliaDB
+clients, and closes all of them at the end of the session.
+
+Clients hold connections bound to the event loop they were first used in, so the pool is keyed by event
+loop too: tests run again in their own loop (e.g. by retry plugins) get their own clients.
+
+`ConnectionTracingTransport` measures, by host, the connections opened by the httpx clients, the time spent
+on TCP and TLS handshakes and the latency of the requests, to compare HTTP/1.1 with HTTP/2.
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia_e2e.jsoncodec import dumps
+from nuclia_e2e.resilience import Retriable
+from nuclia_e2e.settings import settings
+from nuclia_e2e.stats import percentile
+from time import monotonic
+from typing import Any
+from typing import TypeVar
+
+import aiohttp
+import asyncio
+import copy
+import dataclasses
+import httpx
+
+T = TypeVar("T")
+
+
+def _httpx_clients(client: Any) -> list[httpx.AsyncClient]:
+    """httpx clients held by an SDK client, or by the clients it holds (e.g. `AsyncNucliaDBClient.ndb`)."""
+    found = []
+    for value in vars(client).values():
+        if isinstance(value, httpx.AsyncClient):
+            found.append(value)
+        elif hasattr(value, "__dict__") and not isinstance(value, type):
+            found.extend(item for item in vars(value).values() if isinstance(item, httpx.AsyncClient))
+    return found
+
+
+class ClientPool:
+    def __init__(self) -> None:
+        self._clients: dict[tuple[asyncio.AbstractEventLoop | None, tuple[Any, ...]], Any] = {}
+        self.created = 0
+        self.reused = 0
+
+    def get(self, key: tuple[Any, ...], factory: Callable[[], T]) -> T:
+        """The client for `key`, built with `factory` the first time it's asked for in the running loop."""
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync clients are not bound to any loop
+            loop = None
+        full_key = (loop, key)
+        if full_key in self._clients:
+            self.reused += 1
+        else:
+            self._clients[full_key] = factory()
+            self.created += 1
+        return self._clients[full_key]
+
+    def aiohttp_session(self) -> aiohttp.ClientSession:
+        def build() -> aiohttp.ClientSession:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=settings.client_max_connections,
+                keepalive_timeout=settings.client_keepalive_expiry,
+            )
+            return aiohttp.ClientSession(connector=connector, json_serialize=dumps)
+
+        return self.get(("aiohttp",), build)
+
+    async def aclose(self) -> None:
+        """Close the clients used in the running loop, others are left to the garbage collector."""
+        loop = asyncio.get_running_loop()
+        for full_key in [full_key for full_key in self._clients if full_key[0] is loop]:
+            client = self._clients.pop(full_key)
+            if isinstance(client, Retriable):
+                client = client._client
+            if isinstance(client, aiohttp.ClientSession):
+                await client.close()
+                continue
+            for session in _httpx_clients(client):
+                await session.aclose()
+
+    def __str__(self) -> str:
+        return f"clients created={self.created}, reused={self.reused}"
+
+
+CLIENT_POOL = ClientPool()
+
+
+@dataclasses.dataclass
+class ConnectionStats:
+    connections: int = 0
+    # Seconds spent opening TCP connections and on TLS handshakes
+    connect_time: float = 0.0
+    tls_time: float = 0.0
+    requests: int = 0
+    # Seconds until the response headers were received, by request
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    # Requests by HTTP version of the response
+    http_versions: dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "connect_time": round(self.connect_time, 3),
+            "tls_time": round(self.tls_time, 3),
+            "requests": self.requests,
+            "latency_p50": round(percentile(self.latencies, 50), 3),
+            "latency_p95": round(percentile(self.latencies, 95), 3),
+            "http_versions": self.http_versions,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"connections={self.connections}, handshakes={self.connect_time + self.tls_time:.1f}s,"
+            f" requests={self.requests}, p50={percentile(self.latencies, 50):.3f}s,"
+            f" p95={percentile(self.latencies, 95):.3f}s, versions={self.http_versions}"
+        )
+
+
+# Stats of the connections opened by the httpx clients, by host
+CONNECTION_STATS: dict[str, ConnectionStats] = {}
+
+# httpcore trace events that time each handshake, by the field of `ConnectionStats` they add up to
+_HANDSHAKE_EVENTS = {"connection.connect_tcp": "connect_time", "connection.start_tls": "tls_time"}
+
+
+def connection_report() -> dict[str, dict[str, Any]]:
+    return {host: stats.to_json() for host, stats in sorted(CONNECTION_STATS.items())}
+
+
+class ConnectionTracingTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport to measure the connections it opens and the latency of its requests."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = CONNECTION_STATS.setdefault(request.url.host, ConnectionStats())
+        # The same request can be sent more than once (e.g. hedged), so its own tracer is not replaced
+        traced = copy.copy(request)
+        traced.extensions = {
+            **request.extensions,
+            "trace": self._tracer(stats, request.extensions.get("trace")),
+        }
+        start = monotonic()
+        response = await self._transport.handle_async_request(traced)
+        stats.requests += 1
+        stats.latencies.append(monotonic() - start)
+        version = response.extensions.get("http_version", b"").decode() or "unknown"
+        stats.http_versions[version] = stats.http_versions.get(version, 0) + 1
+        return response
+
+    @staticmethod
+    def _tracer(
+        stats: ConnectionStats, trace: Callable[[str, dict[str, Any]], Awaitable[None]] | None
+    ) -> Callable[[str, dict[str, Any]], Awaitable[None]]:
+        started: dict[str, float] = {}
+
+        async def tracer(event_name: str, info: dict[str, Any]) -> None:
+            name, _, stage = event_name.rpartition(".")
+            if name in _HANDSHAKE_EVENTS:
+                if stage == "started":
+                    started[name] = monotonic()
+                elif stage == "complete" and name in started:
+                    field = _HANDSHAKE_EVENTS[name]
+                    setattr(stats, field, getattr(stats, field) + monotonic() - started.pop(name))
+                    if name == "connection.connect_tcp":
+                        stats.connections += 1
+            if trace is not None:
+                await trace(event_name, info)
+
+        return tracer
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,442 @@
+"""Historical store of the benchmark results, to track them over time.
+
+Benchmarks write their results of a run as `<env>__<cluster>__timings.json` (with `__versions.json` and
+`__ids.json` next to them). `BenchmarkStore.record_results` appends them to a SQLite file, keyed by run id,
+env, cluster, step and the versions of the components that ran, so they can be queried later, e.g. with
+`BenchmarkStore.step_history`. The results of the load, search, streaming and preflight benchmarks
+(`<env>__<cluster>[__<model>]__<benchmark>.json`) are not timings of steps: their numbers are stored as
+metrics named after their path in the JSON, e.g. `steps.find:keyword.p50` of `search`, and queried with
+`BenchmarkStore.metric_history`. Each shard of a run can record into its own file, and merge them with
+`BenchmarkStore.merge`.
+
+Usage:
+    python -m nuclia_e2e.history record benchmark_history.sqlite ./results --run-id 1234
+    python -m nuclia_e2e.history merge benchmark_history.sqlite shard-0.sqlite shard-1.sqlite
+    python -m nuclia_e2e.history history benchmark_history.sqlite --step index_ready --cluster europe-1
+    python -m nuclia_e2e.history metrics benchmark_history.sqlite --benchmark search \
+        --metric steps.find:keyword.p50 --cluster europe-1
+"""
+
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+import argparse
+import dataclasses
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT NOT NULL,
+    env TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    ids TEXT NOT NULL,
+    PRIMARY KEY (run_id, env, cluster)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    run_id TEXT NOT NULL,
+    env TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    component TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (run_id, env, cluster, component)
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id TEXT NOT NULL,
+    env TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    step TEXT NOT NULL,
+    elapsed REAL NOT NULL,
+    request_time REAL,
+    retry_time REAL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (run_id, env, cluster, step)
+);
+CREATE INDEX IF NOT EXISTS steps_by_cluster ON steps (cluster, step);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL,
+    env TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, env, cluster, benchmark, metric)
+);
+CREATE INDEX IF NOT EXISTS metrics_by_cluster ON metrics (cluster, benchmark, metric);
+"""
+TABLES = ("runs", "versions", "steps", "metrics")
+# Tables replaced by recording the timings of a run
+TIMINGS_TABLES = ("runs", "versions", "steps")
+# Benchmarks whose results are recorded as metrics, by the suffix of their files
+METRICS_BENCHMARKS = ("load", "search", "streaming", "preflight")
+
+
+@dataclasses.dataclass
+class RunRecord:
+    run_id: str
+    env: str
+    cluster: str
+    recorded_at: datetime
+    # Versions of the components that ran, by component
+    versions: dict[str, str]
+    # Ids of what the run created (KB, resource) and where its traces are
+    ids: dict[str, Any]
+
+
+@dataclasses.dataclass
+class StepRecord:
+    run_id: str
+    env: str
+    cluster: str
+    step: str
+    recorded_at: datetime
+    elapsed: float
+    request_time: float | None
+    retry_time: float | None
+    retries: int
+    # Repetitions of the benchmark in the run, `elapsed` being their median when more than one
+    runs: int
+    versions: dict[str, str]
+
+
+@dataclasses.dataclass
+class MetricRecord:
+    run_id: str
+    env: str
+    cluster: str
+    benchmark: str
+    metric: str
+    recorded_at: datetime
+    value: float
+
+
+class BenchmarkStore:
+    """Benchmark results of past runs, in the SQLite file at `path` (created if missing)."""
+
+    def __init__(self, path: Path):
+        # Shards sharing a file wait for each other's writes
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "BenchmarkStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def record(
+        self,
+        run_id: str,
+        env: str,
+        cluster: str,
+        timings: dict[str, dict[str, Any]],
+        versions: dict[str, str] | None = None,
+        ids: dict[str, Any] | None = None,
+        recorded_at: datetime | None = None,
+    ) -> None:
+        """Store the `timings` of a run on a cluster, as written to `__timings.json`. Recording the same run
+        again replaces it."""
+        recorded_at = recorded_at or datetime.now(timezone.utc)
+        with self.connection:
+            for table in TIMINGS_TABLES:
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE run_id = ? AND env = ? AND cluster = ?",
+                    (run_id, env, cluster),
+                )
+            self.connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                (run_id, env, cluster, recorded_at.isoformat(), json.dumps(ids or {})),
+            )
+            self.connection.executemany(
+                "INSERT INTO versions VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, env, cluster, component, version)
+                    for component, version in (versions or {}).items()
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        env,
+                        cluster,
+                        step,
+                        float(timing["elapsed"]),
+                        _optional_float(timing.get("request_time")),
+                        _optional_float(timing.get("retry_time")),
+                        int(timing.get("retries", 0)),
+                        int(timing.get("runs", 1)),
+                    )
+                    for step, timing in timings.items()
+                ],
+            )
+
+    def record_metrics(
+        self,
+        run_id: str,
+        env: str,
+        cluster: str,
+        benchmark: str,
+        metrics: dict[str, float],
+        recorded_at: datetime | None = None,
+    ) -> None:
+        """Store the `metrics` of a benchmark of a run on a cluster, by name. Recording the same metrics of
+        the run again replaces them."""
+        recorded_at = recorded_at or datetime.now(timezone.utc)
+        with self.connection:
+            # The timings of the run, if recorded, have its ids
+            self.connection.execute(
+                "INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (run_id, env, cluster, recorded_at.isoformat(), "{}"),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, env, cluster, benchmark, metric, value) for metric, value in metrics.items()],
+            )
+
+    def record_results(
+        self,
+        results_dir: Path,
+        run_id: str,
+        recorded_at: datetime | None = None,
+        since: float | None = None,
+        *,
+        recursive: bool = True,
+    ) -> list[tuple[str, str, str]]:
+        """Record every `<env>__<cluster>__timings.json` in `results_dir` (modified after the `since`
+        timestamp, if given) as `run_id`, with the versions and ids next to it, and the metrics of the other
+        benchmarks. Returns the (env, cluster, benchmark) recorded."""
+        recorded = []
+        for results_file in sorted((results_dir.rglob if recursive else results_dir.glob)("*__*.json")):
+            if since is not None and results_file.stat().st_mtime < since:
+                continue
+            parts = results_file.stem.split("__")
+            if len(parts) < 3:
+                continue
+            env, cluster, *qualifiers, benchmark = parts
+            if benchmark == "timings" and not qualifiers:
+                prefix = f"{env}__{cluster}"
+                self.record(
+                    run_id,
+                    env,
+                    cluster,
+                    json.loads(results_file.read_text()),
+                    versions=_load_sibling(results_file, f"{prefix}__versions.json"),
+                    ids=_load_sibling(results_file, f"{prefix}__ids.json"),
+                    recorded_at=recorded_at,
+                )
+            elif benchmark in METRICS_BENCHMARKS:
+                results = json.loads(results_file.read_text())
+                if benchmark == "preflight":
+                    # Probes by service, rather than by their position
+                    results = {**results, "probes": {probe["service"]: probe for probe in results["probes"]}}
+                # e.g. the model of the streaming results
+                prefix = "".join(f"{qualifier}." for qualifier in qualifiers)
+                self.record_metrics(
+                    run_id, env, cluster, benchmark, _numbers(results, prefix), recorded_at=recorded_at
+                )
+            else:
+                continue
+            recorded.append((env, cluster, benchmark))
+        return recorded
+
+    def merge(self, other: Path) -> None:
+        """Copy the results of the store at `other` (e.g. of a shard) into this one, replacing the same steps,
+        metrics and versions. Shards of the same run keep each other's results."""
+        self.connection.execute("ATTACH DATABASE ? AS other", (str(other),))
+        try:
+            with self.connection:
+                # Shards that only recorded metrics don't know the ids of the run
+                self.connection.execute(
+                    "INSERT INTO runs SELECT * FROM other.runs WHERE true"
+                    " ON CONFLICT (run_id, env, cluster) DO UPDATE SET ids = excluded.ids"
+                    " WHERE excluded.ids != '{}'"
+                )
+                for table in TABLES:
+                    if table != "runs":
+                        self.connection.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM other.{table}")
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+
+    def runs(self, env: str | None = None, cluster: str | None = None, limit: int = 30) -> list[RunRecord]:
+        """The last `limit` runs, newest first, optionally of an env and cluster."""
+        rows = self.connection.execute(
+            "SELECT run_id, env, cluster, recorded_at, ids FROM runs"
+            " WHERE (:env IS NULL OR env = :env) AND (:cluster IS NULL OR cluster = :cluster)"
+            " ORDER BY recorded_at DESC LIMIT :limit",
+            {"env": env, "cluster": cluster, "limit": limit},
+        ).fetchall()
+        return [
+            RunRecord(
+                run_id,
+                env,
+                cluster,
+                datetime.fromisoformat(recorded_at),
+                self._versions(run_id, env, cluster),
+                json.loads(ids),
+            )
+            for run_id, env, cluster, recorded_at, ids in rows
+        ]
+
+    def step_history(
+        self,
+        step: str,
+        cluster: str,
+        env: str | None = None,
+        limit: int = 30,
+        versions: dict[str, str] | None = None,
+    ) -> list[StepRecord]:
+        """The timings of `step` on `cluster` in its last `limit` runs, newest first, optionally only those of
+        an env and running the given component `versions`."""
+        query = (
+            "SELECT s.run_id, s.env, s.cluster, s.step, r.recorded_at, s.elapsed, s.request_time,"
+            " s.retry_time, s.retries, s.runs FROM steps s JOIN runs r USING (run_id, env, cluster)"
+            " WHERE s.step = ? AND s.cluster = ? AND (? IS NULL OR s.env = ?)"
+        )
+        params: list[Any] = [step, cluster, env, env]
+        for component, version in (versions or {}).items():
+            query += (
+                " AND EXISTS (SELECT 1 FROM versions v WHERE v.run_id = s.run_id AND v.env = s.env"
+                " AND v.cluster = s.cluster AND v.component = ? AND v.version = ?)"
+            )
+            params += [component, version]
+        query += " ORDER BY r.recorded_at DESC LIMIT ?"
+        params.append(limit)
+        return [
+            StepRecord(
+                run_id=row[0],
+                env=row[1],
+                cluster=row[2],
+                step=row[3],
+                recorded_at=datetime.fromisoformat(row[4]),
+                elapsed=row[5],
+                request_time=row[6],
+                retry_time=row[7],
+                retries=row[8],
+                runs=row[9],
+                versions=self._versions(row[0], row[1], row[2]),
+            )
+            for row in self.connection.execute(query, params).fetchall()
+        ]
+
+    def metric_history(
+        self, benchmark: str, metric: str, cluster: str, env: str | None = None, limit: int = 30
+    ) -> list[MetricRecord]:
+        """The values of `metric` of `benchmark` on `cluster` in its last `limit` runs, newest first,
+        optionally only those of an env."""
+        rows = self.connection.execute(
+            "SELECT m.run_id, m.env, m.cluster, m.benchmark, m.metric, r.recorded_at, m.value FROM metrics m"
+            " JOIN runs r USING (run_id, env, cluster)"
+            " WHERE m.benchmark = ? AND m.metric = ? AND m.cluster = ? AND (? IS NULL OR m.env = ?)"
+            " ORDER BY r.recorded_at DESC LIMIT ?",
+            (benchmark, metric, cluster, env, env, limit),
+        ).fetchall()
+        return [
+            MetricRecord(run_id, env, cluster, benchmark, metric, datetime.fromisoformat(recorded_at), value)
+            for run_id, env, cluster, benchmark, metric, recorded_at, value in rows
+        ]
+
+    def _versions(self, run_id: str, env: str, cluster: str) -> dict[str, str]:
+        return dict(
+            self.connection.execute(
+                "SELECT component, version FROM versions WHERE run_id = ? AND env = ? AND cluster = ?",
+                (run_id, env, cluster),
+            ).fetchall()
+        )
+
+
+def _optional_float(value: Any) -> float | None:
+    return None if value is None else float(value)
+
+
+def _numbers(value: Any, prefix: str = "") -> dict[str, float]:
+    """The numbers in `value`, as written by the benchmarks (strings included), by their dotted path in it.
+    Lists, e.g. of raw samples, are left out."""
+    if isinstance(value, dict):
+        return {
+            name: number
+            for key, item in value.items()
+            for name, number in _numbers(item, f"{prefix}{key}.").items()
+        }
+    if isinstance(value, bool | int | float):
+        return {prefix.removesuffix("."): float(value)}
+    if isinstance(value, str):
+        try:
+            return {prefix.removesuffix("."): float(value)}
+        except ValueError:
+            return {}
+    return {}
+
+
+def _load_sibling(file: Path, name: str) -> Any:
+    sibling = file.with_name(name)
+    return json.loads(sibling.read_text()) if sibling.exists() else None
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_command = commands.add_parser("record", help="Record the benchmark results of a run")
+    record_command.add_argument("store", type=Path)
+    record_command.add_argument("results", type=Path, help="Directory with the results, searched recursively")
+    record_command.add_argument("--run-id", required=True)
+    merge_command = commands.add_parser("merge", help="Merge the stores of shards into one")
+    merge_command.add_argument("store", type=Path)
+    merge_command.add_argument("others", type=Path, nargs="+")
+    history_command = commands.add_parser("history", help="Timings of a step in the last runs")
+    history_command.add_argument("store", type=Path)
+    history_command.add_argument("--step", required=True)
+    history_command.add_argument("--cluster", required=True)
+    history_command.add_argument("--env")
+    history_command.add_argument("--limit", type=int, default=30)
+    metrics_command = commands.add_parser("metrics", help="Values of a benchmark metric in the last runs")
+    metrics_command.add_argument("store", type=Path)
+    metrics_command.add_argument("--benchmark", required=True, choices=METRICS_BENCHMARKS)
+    metrics_command.add_argument("--metric", required=True)
+    metrics_command.add_argument("--cluster", required=True)
+    metrics_command.add_argument("--env")
+    metrics_command.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    with BenchmarkStore(args.store) as store:
+        if args.command == "record":
+            for env, cluster, benchmark in store.record_results(args.results, args.run_id):
+                print(f"Recorded the {benchmark} of {env}/{cluster} as run {args.run_id}")
+        elif args.command == "merge":
+            for other in args.others:
+                store.merge(other)
+        elif args.command == "metrics":
+            for metric in store.metric_history(
+                args.benchmark, args.metric, args.cluster, env=args.env, limit=args.limit
+            ):
+                print(
+                    f"{metric.recorded_at:%Y-%m-%d %H:%M} {metric.run_id} {metric.env}/{metric.cluster}"
+                    f" {metric.value:.3f}"
+                )
+        else:
+            for record in store.step_history(args.step, args.cluster, env=args.env, limit=args.limit):
+                retries = f" ({record.retries} retries)" if record.retries else ""
+                print(
+                    f"{record.recorded_at:%Y-%m-%d %H:%M} {record.run_id} {record.env}/{record.cluster}"
+                    f" {record.elapsed:.3f}s{retries}"
+                )
+
+
+if __name__ == "__main__":
+    main()
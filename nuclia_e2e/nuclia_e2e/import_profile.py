@@ -0,0 +1,114 @@
+"""pytest plugin that measures how long the e2e suite takes to start.
+
+Short shards spend a visible share of their time importing and collecting, so the collection wall-time is
+always recorded in the run report (and pushed with it, see `nuclia_e2e.telemetry`). With
+`--e2e-import-profile`, the time spent loading `conftest.py` and importing each test module, and the
+packages each of them pulled in first, are printed too.
+
+It's loaded with `-p nuclia_e2e.import_profile` (see `pytest.ini`), so it starts timing before any
+`conftest.py` is imported.
+"""
+
+from collections.abc import Generator
+from time import perf_counter
+from typing import Any
+
+import dataclasses
+import pytest
+import sys
+
+_STARTED = perf_counter()
+
+
+@dataclasses.dataclass
+class ImportCost:
+    name: str
+    seconds: float
+    # Modules imported for the first time, by top level package
+    packages: dict[str, int]
+
+    def to_json(self) -> dict[str, Any]:
+        return {"name": self.name, "seconds": round(self.seconds, 3), "packages": self.packages}
+
+    def __str__(self) -> str:
+        packages = ", ".join(f"{package} ({count})" for package, count in self.packages.items())
+        return f"{self.seconds:.3f}s {self.name}" + (f": {packages}" if packages else "")
+
+
+@dataclasses.dataclass
+class StartupProfile:
+    # Seconds from this plugin being loaded until collection finished
+    collection: float = 0.0
+    costs: list[ImportCost] = dataclasses.field(default_factory=list)
+
+    def to_json(self) -> dict[str, Any]:
+        return {"collection": round(self.collection, 3), "imports": [cost.to_json() for cost in self.costs]}
+
+
+STARTUP_PROFILE = StartupProfile()
+
+
+class _Measure:
+    """Time a block, and the modules imported during it for the first time."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> None:
+        self._modules = set(sys.modules)
+        self._start = perf_counter()
+
+    def __exit__(self, *exc_info: object) -> None:
+        seconds = perf_counter() - self._start
+        packages: dict[str, int] = {}
+        for module in set(sys.modules) - self._modules:
+            package = module.partition(".")[0]
+            packages[package] = packages.get(package, 0) + 1
+        by_count = dict(sorted(packages.items(), key=lambda item: -item[1]))
+        STARTUP_PROFILE.costs.append(ImportCost(self.name, seconds, by_count))
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--e2e-import-profile",
+        action="store_true",
+        default=False,
+        help="print the time spent importing conftest.py and each test module, and the packages they import",
+    )
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_load_initial_conftests(
+    early_config: pytest.Config, parser: pytest.Parser, args: list[str]
+) -> Generator[None, Any, Any]:
+    with _Measure("conftest.py"):
+        return (yield)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_make_collect_report(collector: pytest.Collector) -> Generator[None, Any, Any]:
+    # Test modules are imported when they're collected
+    if not isinstance(collector, pytest.Module):
+        return (yield)
+    with _Measure(collector.nodeid):
+        return (yield)
+
+
+def pytest_collection_finish(session: pytest.Session) -> None:
+    from nuclia_e2e.telemetry import RUN_TELEMETRY
+
+    STARTUP_PROFILE.collection = perf_counter() - _STARTED
+    RUN_TELEMETRY.sections["startup"] = STARTUP_PROFILE.to_json()
+    RUN_TELEMETRY.set_gauge(
+        "e2e_collection_seconds",
+        "Seconds from pytest start until all tests were collected",
+        STARTUP_PROFILE.collection,
+    )
+
+
+def pytest_terminal_summary(terminalreporter: Any, exitstatus: int, config: pytest.Config) -> None:
+    if not config.getoption("e2e_import_profile"):
+        return
+    terminalreporter.section(f"startup ({STARTUP_PROFILE.collection:.3f}s until collected)")
+    for cost in sorted(STARTUP_PROFILE.costs, key=lambda cost: -cost.seconds):
+        terminalreporter.write_line(str(cost))
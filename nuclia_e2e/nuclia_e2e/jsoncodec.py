@@ -0,0 +1,32 @@
+"""JSON encoding and decoding for the helpers that talk HTTP through aiohttp.
+
+aiohttp uses the stdlib `json` by default, which dominates the time of large responses such as activity
+log downloads and paginated job logs. These functions use orjson when it's installed (it comes with
+nucliadb-sdk), and the stdlib otherwise, and are what the shared aiohttp session (see
+`nuclia_e2e.clients`) serializes request bodies with. Decode responses with `response.json(loads=loads)`.
+
+`bench_json.py` compares both on payloads like ours.
+"""
+
+from typing import Any
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,204 @@
+"""Event-driven waits on the NucliaDB notifications stream of a KB.
+
+`NotificationWaiter` subscribes to the KB notifications stream and keeps every resource event it receives,
+timestamped as soon as it arrives, so waits for things like "resource X processed" resolve when the event
+is pushed instead of when the next poll happens to see it. If the stream can't be opened or drops, waits
+fall back to polling with `nuclia_e2e.utils.wait_for`, and events that never arrive are caught by checking
+the polling condition now and then.
+
+The waiter only needs a NucliaDB client pointing to a KB url, so it can be pointed to any server speaking
+the same NDJSON protocol.
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from datetime import datetime
+from datetime import timezone
+from nuclia.lib.kb import AsyncNucliaDBClient
+from nuclia.lib.kb import NOTIFICATIONS
+from nuclia_e2e.polling import PollSchedule
+from nuclia_e2e.polling import PollStats
+from nuclia_e2e.polling import record_poll_stats
+from nuclia_e2e.polling import resolve_deadline
+from nuclia_e2e.utils import Logger
+from nuclia_e2e.utils import wait_for
+from nucliadb_models.notifications import Notification
+from nucliadb_models.notifications import NotificationType
+from pydantic import ValidationError
+from time import monotonic
+from types import TracebackType
+from typing import Any
+
+import asyncio
+import dataclasses
+import httpx
+
+# The stream may stay idle for long, the wait deadlines take care of not waiting forever
+STREAM_TIMEOUT = httpx.Timeout(30, read=None)
+
+
+@dataclasses.dataclass(frozen=True)
+class ResourceEvent:
+    type: NotificationType
+    resource_uuid: str
+    seqid: int
+    # Wall clock time the event was read from the stream
+    received_at: datetime
+    data: dict[str, Any]
+
+
+class NotificationWaiter:
+    def __init__(self, ndb: AsyncNucliaDBClient, logger: Logger = print):
+        self.ndb = ndb
+        self.logger = logger
+        self._events: dict[str, list[ResourceEvent]] = {}
+        self._arrived = asyncio.Condition()
+        self._response: httpx.Response | None = None
+        self._reader: asyncio.Task | None = None
+        self._dropped = False
+
+    @property
+    def connected(self) -> bool:
+        return self._reader is not None and not self._dropped
+
+    async def start(self) -> None:
+        try:
+            self._response = await self._subscribe()
+        except Exception as exc:
+            self.logger(f"Could not subscribe to notifications, waits will poll instead: {exc!r}")
+            self._dropped = True
+            return
+        self._reader = asyncio.create_task(self._read())
+
+    async def stop(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self._response is not None:
+            await self._response.aclose()
+
+    async def __aenter__(self) -> "NotificationWaiter":
+        await self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        await self.stop()
+
+    def events(self, rid: str) -> list[ResourceEvent]:
+        return list(self._events.get(rid, []))
+
+    async def wait(
+        self,
+        event_type: NotificationType,
+        rid: str,
+        *,
+        min_seqid: int = 0,
+        max_wait: float = 60,
+        fallback: Callable[[], Awaitable[tuple[bool, Any]]] | None = None,
+        schedule: PollSchedule | None = None,
+        check_interval: float = 10,
+    ) -> tuple[bool, ResourceEvent | None]:
+        """Wait until an event of `event_type` with a seqid >= `min_seqid` is received for resource `rid`.
+
+        Returns the event as soon as it arrives (or right away if it already did). Events can be missed (e.g.
+        sent before subscribing), so while waiting `fallback` is also checked every `check_interval` seconds
+        and once more at the deadline. If the stream is not available, or drops while waiting, the rest of the
+        wait polls `fallback` with `wait_for` instead. No event is returned when `fallback` succeeded.
+        """
+        name = f"{event_type.value}:{rid}"
+        start = monotonic()
+        deadline = resolve_deadline(max_wait)
+        while True:
+            check_at = min(deadline, monotonic() + check_interval)
+            event = await self._wait_event(event_type, rid, min_seqid, until=check_at)
+            if event is not None:
+                record_poll_stats(event_type.value, PollStats(waits=1, elapsed=monotonic() - start))
+                self.logger(f"event '{name}' received in {monotonic() - start} seconds (seqid={event.seqid})")
+                return True, event
+            if self._dropped:
+                break
+            if fallback is not None and (await fallback())[0]:
+                self.logger(f"event '{name}' not received, condition met in {monotonic() - start} seconds")
+                return True, None
+            if monotonic() >= deadline:
+                self.logger(f"event '{name}' not received in {monotonic() - start} seconds")
+                return False, None
+        if fallback is None:
+            self.logger(f"notifications stream not available, can't wait for '{name}'")
+            return False, None
+        self.logger(f"notifications stream not available, polling for '{name}'")
+        success, _ = await wait_for(
+            fallback, max_wait=max(deadline - monotonic(), 0), schedule=schedule, logger=self.logger
+        )
+        return success, None
+
+    async def _wait_event(
+        self, event_type: NotificationType, rid: str, min_seqid: int, *, until: float
+    ) -> ResourceEvent | None:
+        """The matching event, once received or already there, or None if `until` (monotonic) is reached or
+        the stream drops first."""
+        async with self._arrived:
+            try:
+                await asyncio.wait_for(
+                    self._arrived.wait_for(lambda: self._dropped or self._match(event_type, rid, min_seqid)),
+                    timeout=max(until - monotonic(), 0),
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self._match(event_type, rid, min_seqid)
+
+    async def _subscribe(self) -> httpx.Response:
+        # `AsyncNucliaDBClient.notifications` reads the whole body to check for errors before returning it,
+        # which never happens on a live stream, so open it on the same session without consuming it.
+        session = self.ndb.reader_session
+        if self.ndb.url is None or session is None:
+            err_msg = "KB not configured"
+            raise RuntimeError(err_msg)
+        request = session.build_request("GET", f"{self.ndb.url}{NOTIFICATIONS}", timeout=STREAM_TIMEOUT)
+        response = await session.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    def _match(self, event_type: NotificationType, rid: str, min_seqid: int) -> ResourceEvent | None:
+        for event in self._events.get(rid, []):
+            if event.type == event_type and event.seqid >= min_seqid:
+                return event
+        return None
+
+    async def _read(self) -> None:
+        assert self._response is not None
+        try:
+            async for line in self._response.aiter_lines():
+                received_at = datetime.now(timezone.utc)
+                if not line.strip():
+                    continue
+                try:
+                    notification = Notification.model_validate_json(line)
+                    event = ResourceEvent(
+                        type=notification.type,
+                        resource_uuid=notification.data["resource_uuid"],
+                        seqid=notification.data["seqid"],
+                        received_at=received_at,
+                        data=notification.data,
+                    )
+                except (ValidationError, KeyError, TypeError):
+                    # Unknown notification types are not interesting here
+                    continue
+                async with self._arrived:
+                    self._events.setdefault(event.resource_uuid, []).append(event)
+                    self._arrived.notify_all()
+            self.logger("notifications stream closed by the server")
+        except httpx.HTTPError as exc:
+            self.logger(f"notifications stream dropped: {exc!r}")
+        finally:
+            async with self._arrived:
+                self._dropped = True
+                self._arrived.notify_all()
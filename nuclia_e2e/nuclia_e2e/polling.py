@@ -0,0 +1,170 @@
+"""Polling schedules, deadlines and stats used by `nuclia_e2e.utils.wait_for`.
+
+A schedule decides how long to sleep between two polls of the same condition. The deadline is stored in a
+context variable so any `wait_for` started while another one is running (or inside a `poll_deadline` block)
+never waits longer than its parent is willing to.
+"""
+
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from statistics import median
+from time import monotonic
+from typing import Protocol
+
+import dataclasses
+import json
+import random
+
+# Absolute monotonic() timestamp after which no wait should keep polling
+_deadline: ContextVar[float | None] = ContextVar("nuclia_e2e_poll_deadline", default=None)
+
+
+class PollSchedule(Protocol):
+    def next_delay(self, attempt: int, elapsed: float) -> float:
+        """Seconds to sleep after the `attempt`-th failed poll, `elapsed` seconds after the wait started."""
+        ...
+
+
+@dataclasses.dataclass(frozen=True)
+class Fixed:
+    interval: float = 5
+
+    def next_delay(self, attempt: int, elapsed: float) -> float:
+        return self.interval
+
+
+@dataclasses.dataclass(frozen=True)
+class ExponentialJitter:
+    initial: float = 0.5
+    factor: float = 2.0
+    max_interval: float = 20.0
+    jitter: float = 0.2
+
+    def next_delay(self, attempt: int, elapsed: float) -> float:
+        delay = min(self.max_interval, self.initial * self.factor ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+@dataclasses.dataclass(frozen=True)
+class FastThenSlow:
+    fast_interval: float = 0.5
+    fast_for: float = 10.0
+    slow_interval: float = 10.0
+
+    def next_delay(self, attempt: int, elapsed: float) -> float:
+        return self.fast_interval if elapsed < self.fast_for else self.slow_interval
+
+
+class DurationHistory:
+    """Durations it took past waits of the same condition to succeed, keyed by condition name."""
+
+    def __init__(self, max_samples: int = 50):
+        self.max_samples = max_samples
+        self._durations: dict[str, list[float]] = {}
+
+    def record(self, key: str, duration: float) -> None:
+        samples = self._durations.setdefault(key, [])
+        samples.append(duration)
+        del samples[: -self.max_samples]
+
+    def expected(self, key: str) -> float | None:
+        samples = self._durations.get(key)
+        return median(samples) if samples else None
+
+    def load(self, path: Path) -> None:
+        if path.exists():
+            with path.open() as f:
+                for key, samples in json.load(f).items():
+                    for duration in samples:
+                        self.record(key, duration)
+
+    def dump(self, path: Path) -> None:
+        with path.open("w") as f:
+            json.dump(self._durations, f)
+
+
+POLL_HISTORY = DurationHistory()
+DEFAULT_SCHEDULE = ExponentialJitter()
+
+
+@dataclasses.dataclass(frozen=True)
+class Learned:
+    """Sleeps through most of the expected duration of `key`, then polls densely around it.
+
+    Falls back to `fallback` when the condition has never succeeded before or when it takes much longer
+    than it used to.
+    """
+
+    key: str
+    fallback: PollSchedule = DEFAULT_SCHEDULE
+    dense_interval: float = 0.5
+    history: DurationHistory = POLL_HISTORY
+
+    def next_delay(self, attempt: int, elapsed: float) -> float:
+        expected = self.history.expected(self.key)
+        if expected is None or elapsed > expected * 1.5:
+            return self.fallback.next_delay(attempt, elapsed)
+        if elapsed < expected * 0.75:
+            return expected * 0.75 - elapsed
+        return max(self.dense_interval, expected * 0.05)
+
+
+@dataclasses.dataclass
+class PollStats:
+    waits: int = 0
+    polls: int = 0
+    slept: float = 0.0
+    elapsed: float = 0.0
+
+    def add(self, other: "PollStats") -> None:
+        self.waits += other.waits
+        self.polls += other.polls
+        self.slept += other.slept
+        self.elapsed += other.elapsed
+
+    def __str__(self) -> str:
+        return f"polls={self.polls}, slept={self.slept:.1f}s"
+
+
+# Aggregated stats of all waits for the whole run, keyed by condition name
+POLL_STATS: dict[str, PollStats] = {}
+# Called with the stats of every wait, from the task that waited
+POLL_STATS_HOOKS: list[Callable[[str, PollStats], None]] = []
+
+
+def record_poll_stats(key: str, stats: PollStats) -> None:
+    POLL_STATS.setdefault(key, PollStats()).add(stats)
+    for hook in POLL_STATS_HOOKS:
+        hook(key, stats)
+
+
+def poll_report() -> list[str]:
+    return [
+        f"{key}: waits={stats.waits}, {stats}, waited={stats.elapsed:.1f}s"
+        for key, stats in sorted(POLL_STATS.items(), key=lambda item: -item[1].slept)
+    ]
+
+
+def current_deadline() -> float | None:
+    return _deadline.get()
+
+
+def resolve_deadline(max_wait: float) -> float:
+    """Deadline of a wait of `max_wait` seconds, never past the one inherited from the enclosing wait."""
+    deadline = monotonic() + max_wait
+    inherited = _deadline.get()
+    return deadline if inherited is None else min(deadline, inherited)
+
+
+@contextmanager
+def poll_deadline(max_wait: float) -> Iterator[float]:
+    """Bounds every wait started inside this block (including nested ones) to `max_wait` seconds."""
+    deadline = resolve_deadline(max_wait)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
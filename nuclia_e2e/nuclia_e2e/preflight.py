@@ -0,0 +1,119 @@
+"""Health check of every zone before the tests start.
+
+When a zone is degraded, every test on it retries until its budget is gone before failing, which makes the
+run both slow and noisy. `check_zone` probes the services of a zone the tests depend on, all of them
+concurrently and only once, and the tests of zones that fail are skipped, or failed right away, with the
+reason (see `E2ESettings.preflight`).
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia.lib.nua import STATUS_PROCESS
+from nuclia.lib.nua import TOKENS_PREDICT
+from nuclia_e2e.settings import settings
+from nuclia_e2e.transport import TRANSPORT_FACTORY
+from time import monotonic
+from typing import Any
+
+import asyncio
+import dataclasses
+import httpx
+
+
+@dataclasses.dataclass
+class ProbeResult:
+    service: str
+    ok: bool
+    # Seconds until the response, or until it failed
+    latency: float
+    error: str | None = None
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "service": self.service,
+            "ok": self.ok,
+            "latency": round(self.latency, 3),
+            "error": self.error,
+        }
+
+
+@dataclasses.dataclass
+class ZoneHealth:
+    zone: str
+    probes: list[ProbeResult]
+
+    @property
+    def healthy(self) -> bool:
+        return all(probe.ok for probe in self.probes)
+
+    @property
+    def reason(self) -> str:
+        return "; ".join(f"{probe.service}: {probe.error}" for probe in self.probes if not probe.ok)
+
+    def to_json(self) -> dict[str, Any]:
+        return {"healthy": self.healthy, "probes": [probe.to_json() for probe in self.probes]}
+
+
+async def probe(service: str, send: Callable[[], Awaitable[httpx.Response]]) -> ProbeResult:
+    """Whether `send` gets a successful response within `settings.preflight_timeout`."""
+    start = monotonic()
+    try:
+        response = await asyncio.wait_for(send(), settings.preflight_timeout)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+        return ProbeResult(service, ok=False, latency=monotonic() - start, error=error)
+    latency = monotonic() - start
+    if response.is_success:
+        return ProbeResult(service, ok=True, latency=latency)
+    return ProbeResult(service, ok=False, latency=latency, error=f"HTTP {response.status_code}")
+
+
+async def check_zone(
+    zone: str,
+    regional_url: str,
+    account_id: str,
+    user_token: str,
+    nua_key: str,
+    kbid: Callable[[], Awaitable[str | None]],
+) -> ZoneHealth:
+    """Probe the regional API, a find on the permanent KB (whose id is resolved with `kbid`), NUA predict and
+    the processing status of `zone`, concurrently."""
+    client = TRANSPORT_FACTORY.async_client(base_url=regional_url)
+    user_headers = {"Authorization": f"Bearer {user_token}"}
+    nua_headers = {"X-STF-NUAKEY": f"Bearer {nua_key}"}
+
+    async def find() -> httpx.Response:
+        permanent_kbid = await kbid()
+        if permanent_kbid is None:
+            err_msg = "permanent KB not found"
+            raise LookupError(err_msg)
+        return await client.get(
+            f"/api/v1/kb/{permanent_kbid}/find", params={"query": "health", "top_k": 1}, headers=user_headers
+        )
+
+    probes = await asyncio.gather(
+        probe("regional_api", lambda: client.get(f"/api/v1/account/{account_id}/kbs", headers=user_headers)),
+        probe("nucliadb_find", find),
+        probe(
+            "nua_predict", lambda: client.get(TOKENS_PREDICT, params={"text": "ping"}, headers=nua_headers)
+        ),
+        probe("processing_status", lambda: client.get(STATUS_PROCESS, headers=nua_headers)),
+    )
+    # Connections are kept in the shared pools, the client itself holds none
+    await client.aclose()
+    return ZoneHealth(zone, list(probes))
+
+
+# Health of every zone checked this session, by zone name
+ZONE_HEALTH: dict[str, ZoneHealth] = {}
+
+
+def preflight_report() -> list[str]:
+    lines = []
+    for zone, health in ZONE_HEALTH.items():
+        probes = ", ".join(
+            f"{probe.service}={probe.latency:.3f}s" + ("" if probe.ok else f" ({probe.error})")
+            for probe in health.probes
+        )
+        lines.append(f"{zone}: {'healthy' if health.healthy else 'UNHEALTHY'}, {probes}")
+    return lines
@@ -0,0 +1,98 @@
+"""Open warm connections to every host the tests talk to before they start.
+
+The first requests to a host pay DNS resolution, TCP connect and TLS handshakes, which would otherwise land
+on the first poll of many waits and on benchmark timings. `prewarm_zones` resolves every host and opens
+connections on the shared httpx pools (see `nuclia_e2e.transport`) and on the shared aiohttp session (see
+`nuclia_e2e.clients`) in parallel, and measures what it cost so it's reported on its own.
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia_e2e.clients import CLIENT_POOL
+from nuclia_e2e.clients import CONNECTION_STATS
+from nuclia_e2e.clients import ConnectionStats
+from nuclia_e2e.transport import TRANSPORT_FACTORY
+from time import monotonic
+from typing import Any
+
+import asyncio
+import dataclasses
+import httpx
+
+# Any response means the connection is open, so a cheap path that exists in all hosts is enough
+PREWARM_PATH = "/"
+
+
+@dataclasses.dataclass
+class HostPrewarm:
+    url: str
+    # Seconds to resolve the host name
+    dns: float = 0.0
+    # Connections opened by the httpx pool and seconds spent on their TCP and TLS handshakes
+    connections: int = 0
+    handshake: float = 0.0
+    # Seconds until all the connections of both the httpx pool and the aiohttp session were ready
+    elapsed: float = 0.0
+    errors: list[str] = dataclasses.field(default_factory=list)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "url": self.url,
+            "dns": round(self.dns, 3),
+            "connections": self.connections,
+            "handshake": round(self.handshake, 3),
+            "elapsed": round(self.elapsed, 3),
+            "errors": self.errors,
+        }
+
+
+async def _warm(send: Callable[[], Awaitable[None]], connections: int, errors: list[str]) -> None:
+    results = await asyncio.gather(*(send() for _ in range(connections)), return_exceptions=True)
+    errors.extend(f"{type(result).__name__}: {result}" for result in results if isinstance(result, Exception))
+
+
+async def prewarm_host(url: str, connections: int) -> HostPrewarm:
+    result = HostPrewarm(url=url)
+    target = httpx.URL(url).join(PREWARM_PATH)
+    host = target.host
+    start = monotonic()
+    try:
+        await asyncio.get_running_loop().getaddrinfo(host, target.port or 443)
+    except OSError as exc:
+        result.errors.append(f"DNS: {exc}")
+        return result
+    result.dns = monotonic() - start
+
+    before = dataclasses.replace(CONNECTION_STATS.setdefault(host, ConnectionStats()))
+    client = TRANSPORT_FACTORY.async_client()
+    session = CLIENT_POOL.aiohttp_session()
+
+    async def send_httpx() -> None:
+        await client.get(target)
+
+    async def send_aiohttp() -> None:
+        async with session.get(str(target)) as response:
+            await response.read()
+
+    await asyncio.gather(
+        _warm(send_httpx, connections, result.errors), _warm(send_aiohttp, connections, result.errors)
+    )
+    result.elapsed = monotonic() - start
+    after = CONNECTION_STATS[host]
+    result.connections = after.connections - before.connections
+    result.handshake = after.connect_time + after.tls_time - before.connect_time - before.tls_time
+    # Connections are kept in the shared pools, the client itself holds none
+    await client.aclose()
+    return result
+
+
+async def prewarm_zones(urls_by_zone: dict[str, list[str]], connections: int) -> dict[str, list[HostPrewarm]]:
+    """Warm up `connections` connections to each url of each zone, all of them in parallel.
+
+    Handshakes are measured by host, so each host must only be in one of the urls.
+    """
+    zones = list(urls_by_zone)
+    results = await asyncio.gather(
+        *(asyncio.gather(*(prewarm_host(url, connections) for url in urls_by_zone[zone])) for zone in zones)
+    )
+    return dict(zip(zones, results, strict=True))
@@ -0,0 +1,878 @@
+"""Declarative policies on how the e2e deals with failing calls.
+
+All retries go through `RetryPolicy`, either decorating a function with `with_policy` or wrapping a client
+with `Retriable`, which picks the policy of each method from `METHOD_POLICIES`. On top of the policies:
+- every retry draws from a per-zone retry budget, so that under a partial outage retries stay a bounded
+  fraction of the first attempts instead of multiplying across all the cooperative tests;
+- calls to endpoints that keep failing go through a circuit breaker per zone and endpoint family, that
+  makes them fail right away until the endpoint is probed again;
+- idempotent reads can be hedged: sent again when they take longer than most of the recent ones;
+- every outcome (success, retry, failure...) is reported to the `OUTCOME_HOOKS`.
+"""
+
+from collections import Counter
+from collections import deque
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from functools import partial
+from functools import wraps
+from nuclia.exceptions import NuaAPIException
+from nuclia.exceptions import RateLimitError
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.polling import PollSchedule
+from nuclia_e2e.settings import settings
+from nuclia_e2e.stats import percentile
+from time import monotonic
+from typing import Any
+from typing import cast
+from typing import ClassVar
+from typing import Generic
+from typing import ParamSpec
+from typing import TypeVar
+
+import asyncio
+import dataclasses
+import httpx
+import inspect
+import json
+import nucliadb_sdk
+import re
+import requests
+import time
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# Budget used by calls not bound to any zone
+GLOBAL_ZONE = "global"
+
+# Server retry hints longer than this are not honored
+MAX_RETRY_HINT = 60
+
+
+@dataclasses.dataclass(frozen=True)
+class CallOutcome:
+    policy: str
+    target: str
+    zone: str | None
+    # success, retry, failure, budget_exhausted, short_circuited, circuit_opened, hedged or hedge_won
+    outcome: str
+    attempt: int = 1
+    # Seconds since the first attempt of the call started
+    elapsed: float = 0.0
+    exception: BaseException | None = None
+    # Seconds taken by the attempt this outcome is about
+    duration: float = 0.0
+    # Seconds waited before the next attempt, on retries
+    delay: float = 0.0
+
+
+# Instrumentation hook: every function here is called with each outcome of every call made with a policy
+OUTCOME_HOOKS: list[Callable[[CallOutcome], None]] = []
+OUTCOME_COUNTS: Counter[tuple[str, str]] = Counter()
+
+
+def _count_outcome(outcome: CallOutcome) -> None:
+    OUTCOME_COUNTS[(outcome.policy, outcome.outcome)] += 1
+
+
+# Observers of the outcomes of the calls made by the current task, and the tasks it creates
+_CALL_OBSERVERS: ContextVar[tuple[Callable[[CallOutcome], None], ...]] = ContextVar(
+    "call_observers", default=()
+)
+
+
+def _notify_observers(outcome: CallOutcome) -> None:
+    for observer in _CALL_OBSERVERS.get():
+        observer(outcome)
+
+
+OUTCOME_HOOKS.append(_count_outcome)
+OUTCOME_HOOKS.append(_notify_observers)
+
+
+@contextmanager
+def observe_calls(observer: Callable[[CallOutcome], None]) -> Iterator[None]:
+    """Report to `observer` the outcomes of the calls made inside the block, but not those of other tasks."""
+    token = _CALL_OBSERVERS.set((*_CALL_OBSERVERS.get(), observer))
+    try:
+        yield
+    finally:
+        _CALL_OBSERVERS.reset(token)
+
+
+def instrument(outcome: CallOutcome) -> None:
+    for hook in OUTCOME_HOOKS:
+        hook(outcome)
+
+
+def outcome_report() -> list[str]:
+    policies = sorted({policy for policy, _ in OUTCOME_COUNTS})
+    return [
+        f"{policy}: "
+        + ", ".join(
+            f"{outcome}={count}"
+            for (name, outcome), count in sorted(OUTCOME_COUNTS.items())
+            if name == policy
+        )
+        for policy in policies
+    ]
+
+
+class RetryBudgetExhaustedError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class RetryBudget:
+    """Token bucket of retries.
+
+    Each first attempt earns `ratio` tokens, and `per_second` tokens are added over time regardless of the
+    traffic so low-traffic zones can still retry. Each retry spends a token.
+    """
+
+    ratio: float
+    per_second: float
+    capacity: float
+    tokens: float = dataclasses.field(init=False)
+    attempts: int = 0
+    retries: int = 0
+    rejected: int = 0
+    _refilled_at: float = dataclasses.field(init=False, default_factory=monotonic)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def record_attempt(self) -> None:
+        self._refill()
+        self.attempts += 1
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            self.rejected += 1
+            return False
+        self.tokens -= 1
+        self.retries += 1
+        return True
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.per_second)
+        self._refilled_at = now
+
+    def __str__(self) -> str:
+        return f"attempts={self.attempts}, retries={self.retries}, rejected={self.rejected}"
+
+
+RETRY_BUDGETS: dict[str, RetryBudget] = {}
+
+
+def retry_budget(zone: str | None) -> RetryBudget:
+    zone = zone or GLOBAL_ZONE
+    if zone not in RETRY_BUDGETS:
+        RETRY_BUDGETS[zone] = RetryBudget(
+            ratio=settings.retry_budget_ratio,
+            per_second=settings.retry_budget_per_second,
+            capacity=settings.retry_budget_capacity,
+        )
+    return RETRY_BUDGETS[zone]
+
+
+def retry_budget_report() -> list[str]:
+    return [f"{zone}: {budget}" for zone, budget in sorted(RETRY_BUDGETS.items())]
+
+
+def record_attempt(zone: str | None) -> None:
+    retry_budget(zone).record_attempt()
+
+
+def spend_retry(zone: str | None, func_name: str, exc: BaseException | None = None) -> None:
+    """Take a retry from the budget of `zone`, or fail fast if there are none left."""
+    budget = retry_budget(zone)
+    if not budget.try_spend():
+        instrument(CallOutcome("retry_budget", func_name, zone, "budget_exhausted", exception=exc))
+        msg = (
+            f"Retry budget of zone '{zone or GLOBAL_ZONE}' exhausted ({budget}), not retrying '{func_name}'"
+            f" after {type(exc).__name__}: {exc}"
+        )
+        raise RetryBudgetExhaustedError(msg) from exc
+
+
+def zone_of_call(args: tuple[Any, ...], kwargs: Mapping[str, Any]) -> str | None:
+    """Best guess of the zone a call is made to, from the zone configs or clients it receives."""
+    if isinstance(zone := kwargs.get("zone"), str):
+        return zone
+    for arg in (*args, *kwargs.values()):
+        if isinstance(zone := getattr(arg, "zone_slug", None), str):
+            return zone
+        if isinstance(zone := getattr(arg, "zone", None), str):
+            return zone
+        # NucliaDB clients keep the zone as region, NUA clients keep the regional url
+        if isinstance(zone := getattr(arg, "region", None), str) and "://" not in zone:
+            return zone
+    return None
+
+
+# Response headers used by servers to tell when to retry, in order of preference, and whether they hold
+# milliseconds instead of seconds
+RETRY_AFTER_HEADERS: list[tuple[str, bool]] = [
+    ("retry-after-ms", True),
+    ("retry-after", False),
+    ("x-ratelimit-reset-after", False),
+    ("ratelimit-reset", False),
+    ("x-ratelimit-reset", False),
+]
+# Values above this are unix timestamps instead of a number of seconds
+_EPOCH_THRESHOLD = 1_000_000_000
+
+
+def _seconds_until(value: float) -> float:
+    if value > _EPOCH_THRESHOLD:
+        value -= time.time()
+    return max(value, 0.0)
+
+
+def _parse_retry_after(value: str) -> float | None:
+    try:
+        return _seconds_until(float(value))
+    except ValueError:
+        pass
+    # Retry-After can also be an http date
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_hint_from_headers(headers: Mapping[str, str]) -> float | None:
+    for header, in_ms in RETRY_AFTER_HEADERS:
+        value = headers.get(header)
+        if value is not None and (seconds := _parse_retry_after(value)) is not None:
+            return seconds / 1000 if in_ms else seconds
+    return None
+
+
+def _retry_hint_from_body(body: str) -> float | None:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and isinstance(data.get("detail"), dict):
+        data = data["detail"]
+    if not isinstance(data, dict):
+        return None
+    for key in ("try_after", "retry_after"):
+        value = data.get(key)
+        if isinstance(value, int | float):
+            return _seconds_until(value)
+    return None
+
+
+def retry_after_hint(exc: BaseException | None) -> float | None:
+    """Seconds the server asked us to wait before retrying, if the error (or its cause) carries a hint."""
+    while exc is not None:
+        if isinstance(exc, httpx.HTTPStatusError | requests.HTTPError) and exc.response is not None:
+            if (hint := _retry_hint_from_headers(exc.response.headers)) is not None:
+                return hint
+        if isinstance(exc, nucliadb_sdk.v2.exceptions.RateLimitError) and exc.try_after is not None:
+            return _seconds_until(exc.try_after)
+        if isinstance(exc, NuaAPIException) and (hint := _retry_hint_from_body(exc.detail)) is not None:
+            return hint
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+TRANSIENT_STATUS_CODES = {429, 502, 503, 504, 512}
+# Status codes meaning the request was not processed, so even non idempotent calls can be retried
+UNPROCESSED_STATUS_CODES = {429, 503}
+# Errors the SDKs raise with the status code of the response only in their message, with the exact format of
+# the message: nucliadb_sdk for status codes it has no exception for, and nuclia.py for failed NUA streams.
+_STATUS_CODE_IN_MESSAGE: tuple[tuple[type[BaseException], re.Pattern[str]], ...] = (
+    (nucliadb_sdk.v2.exceptions.UnknownError, re.compile(r"Unknown error connecting to API: (\d{3}):")),
+    (RuntimeError, re.compile(r"Stream request failed with status (\d{3}):")),
+)
+
+
+def status_code_of(exc: BaseException) -> int | None:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code
+    if isinstance(exc, NuaAPIException):
+        return exc.code
+    if isinstance(exc, RateLimitError | nucliadb_sdk.v2.exceptions.RateLimitError):
+        return 429
+    for exc_type, message in _STATUS_CODE_IN_MESSAGE:
+        if type(exc) is exc_type and (match := message.match(str(exc))) is not None:
+            return int(match.group(1))
+    return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, RetryBudgetExhaustedError | CircuitOpenError):
+        return False
+    # Maybe this is not transient, but as we cannot see for sure the source of this errors, probably always
+    # some networking, we'll retry anyway, if it does all retries, then probably there's something pretty
+    # broken
+    if isinstance(
+        exc,
+        httpx.ReadError
+        | httpx.RemoteProtocolError
+        | httpx.ConnectError
+        | asyncio.TimeoutError
+        # Connects fail fast (see `HttpTimeouts`), and waiting for a pooled connection does too, to be retried
+        | httpx.ConnectTimeout
+        | httpx.PoolTimeout,
+    ):
+        return True
+    return status_code_of(exc) in TRANSIENT_STATUS_CODES
+
+
+def was_not_processed(exc: BaseException) -> bool:
+    """Whether the request surely didn't reach the server, or was rejected before doing anything."""
+    if isinstance(exc, httpx.ConnectError | httpx.ConnectTimeout | httpx.PoolTimeout):
+        return True
+    return status_code_of(exc) in UNPROCESSED_STATUS_CODES
+
+
+DEFAULT_RETRY_SCHEDULE = Fixed(5)
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    """How to call something that may fail.
+
+    - `retry_on`: exception types, or a predicate, of the errors worth retrying.
+    - `max_attempts` and `max_delay`: stop retrying after that many attempts or seconds since the first one.
+    - `schedule`: time to wait between attempts, unless the error carries a retry hint from the server.
+    - `timeout`: seconds each attempt is given (async calls only).
+    - `idempotent`: when False, only errors that guarantee nothing was done are retried.
+    """
+
+    name: str
+    retry_on: tuple[type[BaseException], ...] | Callable[[BaseException], bool] = is_transient
+    max_attempts: int = 1
+    max_delay: float | None = None
+    schedule: PollSchedule = DEFAULT_RETRY_SCHEDULE
+    timeout: float | None = None
+    idempotent: bool = True
+
+    def should_retry(self, exc: BaseException) -> bool:
+        if isinstance(exc, RetryBudgetExhaustedError | CircuitOpenError):
+            return False
+        if isinstance(self.retry_on, tuple) and not isinstance(exc, self.retry_on):
+            return False
+        if callable(self.retry_on) and not self.retry_on(exc):
+            return False
+        return self.idempotent or was_not_processed(exc)
+
+    def next_delay(self, exc: BaseException, attempt: int, elapsed: float) -> float | None:
+        """Seconds to wait before the next attempt, or None if there must not be one."""
+        if attempt >= self.max_attempts or not self.should_retry(exc):
+            return None
+        hint = retry_after_hint(exc)
+        delay = min(hint, MAX_RETRY_HINT) if hint is not None else self.schedule.next_delay(attempt, elapsed)
+        if self.max_delay is not None and elapsed + delay > self.max_delay:
+            return None
+        return delay
+
+
+def _log_retry(policy: RetryPolicy, target: str, attempt: int, delay: float, exc: BaseException) -> None:
+    print(
+        f"[Retry #{attempt}/{policy.max_attempts}] "
+        f"Retrying '{target}' in {delay:.1f}s due to {type(exc).__name__}: {exc}"
+    )
+
+
+async def call_with_policy(
+    policy: RetryPolicy,
+    zone: str | None,
+    target: str,
+    func: Callable[..., Awaitable[T]],
+    *args: Any,
+    **kwargs: Any,
+) -> T:
+    record_attempt(zone)
+    start = monotonic()
+    attempt = 1
+    while True:
+        attempt_start = monotonic()
+        try:
+            if policy.timeout is None:
+                result = await func(*args, **kwargs)
+            else:
+                result = await asyncio.wait_for(func(*args, **kwargs), policy.timeout)
+        except Exception as exc:
+            elapsed = monotonic() - start
+            duration = monotonic() - attempt_start
+            delay = policy.next_delay(exc, attempt, elapsed)
+            if delay is None:
+                instrument(CallOutcome(policy.name, target, zone, "failure", attempt, elapsed, exc, duration))
+                raise
+            # Only retries that happen are instrumented, with their sleeps
+            try:
+                spend_retry(zone, target, exc)
+            except RetryBudgetExhaustedError:
+                instrument(CallOutcome(policy.name, target, zone, "failure", attempt, elapsed, exc, duration))
+                raise
+            instrument(
+                CallOutcome(policy.name, target, zone, "retry", attempt, elapsed, exc, duration, delay)
+            )
+            _log_retry(policy, target, attempt, delay, exc)
+            await asyncio.sleep(delay)
+            attempt += 1
+        else:
+            now = monotonic()
+            instrument(
+                CallOutcome(
+                    policy.name, target, zone, "success", attempt, now - start, duration=now - attempt_start
+                )
+            )
+            return result
+
+
+def call_with_policy_sync(
+    policy: RetryPolicy,
+    zone: str | None,
+    target: str,
+    func: Callable[..., T],
+    *args: Any,
+    **kwargs: Any,
+) -> T:
+    record_attempt(zone)
+    start = monotonic()
+    attempt = 1
+    while True:
+        attempt_start = monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            elapsed = monotonic() - start
+            duration = monotonic() - attempt_start
+            delay = policy.next_delay(exc, attempt, elapsed)
+            if delay is None:
+                instrument(CallOutcome(policy.name, target, zone, "failure", attempt, elapsed, exc, duration))
+                raise
+            # Only retries that happen are instrumented, with their sleeps
+            try:
+                spend_retry(zone, target, exc)
+            except RetryBudgetExhaustedError:
+                instrument(CallOutcome(policy.name, target, zone, "failure", attempt, elapsed, exc, duration))
+                raise
+            instrument(
+                CallOutcome(policy.name, target, zone, "retry", attempt, elapsed, exc, duration, delay)
+            )
+            _log_retry(policy, target, attempt, delay, exc)
+            time.sleep(delay)
+            attempt += 1
+        else:
+            now = monotonic()
+            instrument(
+                CallOutcome(
+                    policy.name, target, zone, "success", attempt, now - start, duration=now - attempt_start
+                )
+            )
+            return result
+
+
+def with_policy(
+    policy: RetryPolicy, zone: str | None = None
+) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """Decorate an async function so it's called with `policy`.
+
+    Retries are drawn from the budget of `zone`, or of the zone guessed from the arguments of each call.
+    """
+
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            call_zone = zone or zone_of_call(args, kwargs)
+            return await call_with_policy(policy, call_zone, func.__name__, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Policies used by `Retriable`
+# Wait as long as the server asks to, otherwise back off exponentially up to 5s between attempts, which adds
+# up to around 2 minutes
+CLIENT_POLICY = RetryPolicy(
+    "client",
+    max_attempts=24,
+    schedule=ExponentialJitter(initial=0.5, factor=2, max_interval=5, jitter=0.5),
+)
+# Calls that create or change things
+CLIENT_WRITE_POLICY = dataclasses.replace(CLIENT_POLICY, name="client_write", idempotent=False)
+# Client methods with their own policy, by method name or by `ClientType.method`. Any other public
+# method uses CLIENT_POLICY.
+METHOD_POLICIES: dict[str, RetryPolicy] = {
+    "process_file": CLIENT_WRITE_POLICY,
+    "process_link": CLIENT_WRITE_POLICY,
+    "add_config_predict": CLIENT_WRITE_POLICY,
+    "update_config_predict": CLIENT_WRITE_POLICY,
+    "del_config_predict": CLIENT_WRITE_POLICY,
+}
+
+# Policies for the checks made against freshly written data, that may not be visible yet
+EVENTUAL_CONSISTENCY_POLICY = RetryPolicy(
+    "eventual_consistency",
+    retry_on=(AssertionError, nucliadb_sdk.v2.exceptions.ClientError),
+    max_attempts=5,
+    schedule=Fixed(5),
+)
+
+
+def policy_for(client_type: type, name: str) -> RetryPolicy:
+    return METHOD_POLICIES.get(f"{client_type.__name__}.{name}", METHOD_POLICIES.get(name, CLIENT_POLICY))
+
+
+class Retriable(Generic[T]):
+    """Proxy calling every public method of a client with its `RetryPolicy`.
+
+    Wrappers are built once per client type and method, and bound to each proxy the first time they're
+    looked up on it.
+    """
+
+    # Unbound wrapper by (client type, method name, is async), or None for attributes left untouched
+    _wrappers: ClassVar[dict[tuple[type, str, bool], Callable[..., Any] | None]] = {}
+
+    def __init__(self, client: T, is_async: bool, zone: str | None = None):  # noqa: FBT001
+        self._client = client
+        self._is_async = is_async
+        # Zone whose retry budget is used, guessed from the client if not given
+        self._zone = zone or zone_of_call((client,), {})
+
+    def __getattr__(self, name: str):
+        key = (type(self._client), name, self._is_async)
+        if key not in self._wrappers:
+            self._wrappers[key] = self._build_wrapper(*key)
+        wrapper = self._wrappers[key]
+        if wrapper is None:
+            return getattr(self._client, name)
+        method = partial(wrapper, self)
+        # Next lookups will find it in the instance and won't reach __getattr__
+        self.__dict__[name] = method
+        return method
+
+    @staticmethod
+    def _build_wrapper(client_type: type, name: str, is_async: bool) -> Callable[..., Any] | None:  # noqa: FBT001
+        attr = getattr(client_type, name, None)
+        if name.startswith("_") or not callable(attr) or inspect.iscoroutinefunction(attr) != is_async:
+            return None
+        policy = policy_for(client_type, name)
+
+        if is_async:
+
+            async def async_wrapper(proxy: "Retriable", *args, **kwargs):
+                method = getattr(proxy._client, name)
+                return await call_with_policy(policy, proxy._zone, name, method, *args, **kwargs)
+
+            return async_wrapper
+
+        def sync_wrapper(proxy: "Retriable", *args, **kwargs):
+            method = getattr(proxy._client, name)
+            return call_with_policy_sync(policy, proxy._zone, name, method, *args, **kwargs)
+
+        return sync_wrapper
+
+    @classmethod
+    def wrap_sync(cls, client: T, zone: str | None = None) -> T:
+        return cast("T", cls(client, is_async=False, zone=zone))
+
+    @classmethod
+    def wrap_async(cls, client: T, zone: str | None = None) -> T:
+        return cast("T", cls(client, is_async=True, zone=zone))
+
+
+# Endpoint families guarded by a circuit breaker, matched against the url path. Calls to any other
+# endpoint are never short-circuited.
+ENDPOINT_FAMILIES: list[tuple[str, re.Pattern[str]]] = [
+    ("/predict", re.compile(r"^/api/v\d+/predict/")),
+    ("/processing", re.compile(r"^/api/v\d+/processing/")),
+    ("/kb/*/find", re.compile(r"^/api/v\d+/kb/[^/]+/find$")),
+    ("/kb/*/search", re.compile(r"^/api/v\d+/kb/[^/]+/search$")),
+    ("/kb/*/ask", re.compile(r"^/api/v\d+/kb/[^/]+/ask$")),
+]
+# Responses that mean the endpoint is down, not that the request was wrong or rate limited
+CIRCUIT_BREAKING_STATUS_CODES = {502, 503, 504, 512}
+CIRCUIT_BREAKING_ERRORS = (
+    httpx.ConnectError,
+    # Connect, read, write and pool timeouts: a hung endpoint must open the circuit too
+    httpx.TimeoutException,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+)
+
+
+def endpoint_family(path: str) -> str | None:
+    for family, pattern in ENDPOINT_FAMILIES:
+        if pattern.match(path):
+            return family
+    return None
+
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclasses.dataclass
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, and lets a single call through to probe the
+    endpoint once `reset_after` seconds have passed. The circuit closes again when a probe succeeds."""
+
+    zone: str
+    family: str
+    failure_threshold: int
+    reset_after: float
+    state: CircuitState = CircuitState.CLOSED
+    failures: int = 0
+    opened: int = 0
+    short_circuited: int = 0
+    last_failure: str = ""
+    last_exception: BaseException | None = None
+    _opened_at: float = 0.0
+    _probing: bool = False
+
+    def before_call(self, request: httpx.Request) -> bool:
+        """Raise `CircuitOpenError` if the call must not be made. Returns whether the call is the probe."""
+        if self.state == CircuitState.OPEN and monotonic() - self._opened_at >= self.reset_after:
+            self.state = CircuitState.HALF_OPEN
+        if self.state == CircuitState.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        if self.state != CircuitState.CLOSED:
+            self.short_circuited += 1
+            instrument(CallOutcome("circuit_breaker", self.family, self.zone, "short_circuited"))
+            msg = (
+                f"Circuit of '{self.family}' on {self.zone} is open after {self.failures} consecutive"
+                f" failures, last one: {self.last_failure}"
+            )
+            raise CircuitOpenError(msg, request=request) from self.last_exception
+        return False
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Let the next call probe the endpoint, when the probe ended without telling whether it's healthy."""
+        self._probing = False
+
+    def record_failure(self, description: str, exc: BaseException | None = None) -> None:
+        self.failures += 1
+        self.last_failure = description
+        self.last_exception = exc
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                self.opened += 1
+                instrument(
+                    CallOutcome("circuit_breaker", self.family, self.zone, "circuit_opened", exception=exc)
+                )
+            self.state = CircuitState.OPEN
+            self._opened_at = monotonic()
+            self._probing = False
+
+    def __str__(self) -> str:
+        return (
+            f"state={self.state.value}, opened={self.opened}, short_circuited={self.short_circuited},"
+            f" last_failure={self.last_failure or '-'}"
+        )
+
+
+CIRCUIT_BREAKERS: dict[tuple[str, str], CircuitBreaker] = {}
+
+
+def circuit_breaker(zone: str, family: str) -> CircuitBreaker:
+    key = (zone, family)
+    if key not in CIRCUIT_BREAKERS:
+        CIRCUIT_BREAKERS[key] = CircuitBreaker(
+            zone=zone,
+            family=family,
+            failure_threshold=settings.circuit_breaker_failures,
+            reset_after=settings.circuit_breaker_reset_after,
+        )
+    return CIRCUIT_BREAKERS[key]
+
+
+def circuit_breaker_report() -> list[str]:
+    return [
+        f"{zone} {family}: {breaker}"
+        for (zone, family), breaker in sorted(CIRCUIT_BREAKERS.items())
+        if breaker.opened > 0
+    ]
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport so calls to the guarded endpoint families go through their breaker."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        family = endpoint_family(request.url.path)
+        if family is None or settings.circuit_breaker_failures <= 0:
+            return await self._transport.handle_async_request(request)
+        # Regional hosts are one per zone
+        breaker = circuit_breaker(request.url.host, family)
+        probe = breaker.before_call(request)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except CIRCUIT_BREAKING_ERRORS as exc:
+            breaker.record_failure(f"{type(exc).__name__}: {exc}", exc)
+            raise
+        except BaseException:
+            # E.g. cancelled (a discarded hedge, a policy timeout) or failed to send the request
+            if probe:
+                breaker.release_probe()
+            raise
+        if response.status_code in CIRCUIT_BREAKING_STATUS_CODES:
+            breaker.record_failure(f"HTTP {response.status_code} on {request.method} {request.url.path}")
+        else:
+            breaker.record_success()
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# Idempotent reads that can be hedged, by (method, path pattern)
+HEDGED_ENDPOINTS: list[tuple[str, str, re.Pattern[str]]] = [
+    ("/kb/*/find", "GET", re.compile(r"^/api/v\d+/kb/[^/]+/find$")),
+    ("/kb/*/find", "POST", re.compile(r"^/api/v\d+/kb/[^/]+/find$")),
+    ("/kb/*/resource/*", "GET", re.compile(r"^/api/v\d+/kb/[^/]+/(resource|slug)/[^/]+$")),
+    ("/processing/status/*", "GET", re.compile(r"^/api/v\d+/processing/status/[^/]+$")),
+]
+
+
+def hedged_endpoint(request: httpx.Request) -> str | None:
+    for endpoint, method, pattern in HEDGED_ENDPOINTS:
+        if request.method == method and pattern.match(request.url.path):
+            # The body is sent twice, so it must be in memory
+            return endpoint if isinstance(request.stream, httpx.ByteStream) else None
+    return None
+
+
+@dataclasses.dataclass
+class HedgeStats:
+    """Latencies of the last `window` calls to an endpoint, and how many of them were hedged."""
+
+    zone: str
+    endpoint: str
+    window: int
+    requests: int = 0
+    issued: int = 0
+    won: int = 0
+    latencies: deque[float] = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.latencies = deque(maxlen=self.window)
+
+    def hedge_delay(self, p: float, min_samples: int) -> float | None:
+        """Seconds to wait for a response before hedging, or None while there aren't enough samples."""
+        if len(self.latencies) < min_samples:
+            return None
+        return percentile(self.latencies, p)
+
+    def __str__(self) -> str:
+        return f"requests={self.requests}, hedged={self.issued}, hedge_won={self.won}"
+
+
+HEDGE_STATS: dict[tuple[str, str], HedgeStats] = {}
+
+
+def hedge_stats(zone: str, endpoint: str) -> HedgeStats:
+    key = (zone, endpoint)
+    if key not in HEDGE_STATS:
+        HEDGE_STATS[key] = HedgeStats(zone=zone, endpoint=endpoint, window=settings.hedge_window)
+    return HEDGE_STATS[key]
+
+
+def hedge_report() -> list[str]:
+    return [f"{zone} {endpoint}: {stats}" for (zone, endpoint), stats in sorted(HEDGE_STATS.items())]
+
+
+async def _discard(task: asyncio.Task[httpx.Response]) -> None:
+    if not task.done():
+        task.cancel()
+    results = await asyncio.gather(task, return_exceptions=True)
+    if isinstance(results[0], httpx.Response):
+        await results[0].aclose()
+
+
+class HedgingTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport so idempotent reads that take longer than `settings.hedge_percentile` of
+    their recent latencies are sent again. The first response wins and the other request is cancelled.
+
+    Disabled unless `settings.hedge_percentile` is set.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = hedged_endpoint(request) if settings.hedge_percentile is not None else None
+        if endpoint is None:
+            return await self._transport.handle_async_request(request)
+        stats = hedge_stats(request.url.host, endpoint)
+        stats.requests += 1
+        start = monotonic()
+        response = await self._hedged(request, stats)
+        stats.latencies.append(monotonic() - start)
+        return response
+
+    async def _hedged(self, request: httpx.Request, stats: HedgeStats) -> httpx.Response:
+        assert settings.hedge_percentile is not None
+        delay = stats.hedge_delay(settings.hedge_percentile, settings.hedge_min_samples)
+        if delay is None:
+            return await self._transport.handle_async_request(request)
+        primary = asyncio.create_task(self._transport.handle_async_request(request))
+        tasks = [primary]
+        winner: asyncio.Task[httpx.Response] | None = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                stats.issued += 1
+                instrument(CallOutcome("hedge", stats.endpoint, stats.zone, "hedged", 2, delay))
+                tasks.append(asyncio.create_task(self._transport.handle_async_request(request)))
+            winner = await self._first_response(tasks)
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    await _discard(task)
+        if winner is not primary:
+            stats.won += 1
+            instrument(CallOutcome("hedge", stats.endpoint, stats.zone, "hedge_won", 2))
+        return winner.result()
+
+    @staticmethod
+    async def _first_response(tasks: list[asyncio.Task[httpx.Response]]) -> asyncio.Task[httpx.Response]:
+        """The first task that got a response, or the original request if all of them failed."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done and task.exception() is None:
+                    return task
+        return tasks[0]
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -1,14 +1,31 @@
+from functools import cache
+from pydantic import BaseModel
 from pydantic import model_validator
 from pydantic_settings import BaseSettings
+from pydantic_settings import SettingsConfigDict
+from typing import Any
+from typing import Literal
 from typing_extensions import Self
 
 
+class HttpTimeouts(BaseModel):
+    """Seconds to wait to connect, for data to be read or written, and for a connection from the pool."""
+
+    connect: float = 10
+    read: float = 120
+    write: float = 120
+    pool: float = 60
+
+
 class E2ESettings(BaseSettings):
     """Pydantic settings for the E2E test suite.
 
-    Per-environment variables are optional and validated based on TEST_ENV.
+    Per-environment variables are optional and validated based on TEST_ENV. Nested values are set with `__`,
+    e.g. HTTP_TIMEOUT_STREAM__READ=900.
     """
 
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
+
     # Common
     test_env: str
     grafana_url: str
@@ -40,10 +57,103 @@ class E2ESettings(BaseSettings):
 
     # Benchmarking
     benchmark: str = ""
+    # Times the ingestion benchmark ingests its file, each run measured and summarized by step (median, p90,
+    # min/max and a bootstrap confidence interval), after one discarded run if `benchmark_warmup`
+    benchmark_repetitions: int = 1
+    benchmark_warmup: bool = False
+    # Ingestion load benchmark: files are ingested into a fresh KB at each of the concurrency levels (files in
+    # flight at a time), `benchmark_load_documents` of them, or as many as the concurrency if it's higher.
+    # The whole benchmark must fit in the `asyncio_task_timeout` of pytest.ini.
+    benchmark_load: str = ""
+    benchmark_load_concurrency: list[int] = [1, 8, 32, 128]
+    benchmark_load_documents: int = 16
+    # Search benchmark: each query is sent `benchmark_find_rounds` times to find, and `benchmark_ask_rounds`
+    # times to ask, for each combination of features, `benchmark_search_concurrency` requests at a time
+    benchmark_search: str = ""
+    benchmark_search_concurrency: int = 8
+    benchmark_find_rounds: int = 300
+    benchmark_ask_rounds: int = 30
+    # Streaming benchmark: streamed asks and generations timed for each model, `benchmark_streaming_rounds`
+    # times each, with up to `benchmark_streaming_concurrency` models streaming at the same time
+    benchmark_streaming: str = ""
+    benchmark_streaming_rounds: int = 3
+    benchmark_streaming_concurrency: int = 4
+    # SQLite file where the benchmark results written by the run are appended to, as run `gha_run_id` (see
+    # `nuclia_e2e.history`). Shards can each record to their own file and merge them. Empty to not record.
+    benchmark_history_path: str = ""
     gha_run_id: str = "unknown"
     prometheus_pushgateway: str = "http://prometheus-cloud-pushgateway-prometheus-pushgateway:9091"
     core_apps_repo_path: str = "/tmp/core-apps"
 
+    # Polling
+    # JSON file where the durations of past waits are loaded from and saved to, so `Learned` poll
+    # schedules can use them across runs. Empty to keep them only in memory.
+    poll_history_path: str = ""
+
+    # Retries
+    # Each zone has a budget of retries shared by all the retry sites: every first attempt earns
+    # `retry_budget_ratio` retries, plus `retry_budget_per_second` retries/s, up to `retry_budget_capacity`.
+    # Retrying with an empty budget fails fast.
+    retry_budget_ratio: float = 0.2
+    retry_budget_per_second: float = 1.0
+    retry_budget_capacity: float = 100
+    # Calls to an endpoint family of a zone fail right away after this many consecutive failures (0 disables
+    # it), until a call is let through to probe it `circuit_breaker_reset_after` seconds later.
+    circuit_breaker_failures: int = 5
+    circuit_breaker_reset_after: float = 30
+    # Idempotent reads (find, resource get, processing status) still waiting for a response after this
+    # percentile of the latencies of the last `hedge_window` calls to the same endpoint are sent again, and
+    # the first response wins. Hedging starts after `hedge_min_samples` calls. Unset to disable it.
+    hedge_percentile: float | None = None
+    hedge_window: int = 200
+    hedge_min_samples: int = 20
+
+    # HTTP clients
+    # Timeouts of the httpx requests by operation class, see `nuclia_e2e.transport`. Connects fail fast so
+    # they're retried soon, reads wait as long as the slowest requests of each class need.
+    http_timeout_default: HttpTimeouts = HttpTimeouts()
+    http_timeout_search: HttpTimeouts = HttpTimeouts(read=60, write=30, pool=30)
+    http_timeout_upload: HttpTimeouts = HttpTimeouts(read=120, write=300)
+    http_timeout_stream: HttpTimeouts = HttpTimeouts(read=600, write=60)
+    http_timeout_poll: HttpTimeouts = HttpTimeouts(read=30, write=30, pool=30)
+    # Connections the aiohttp session, and each httpx client with a transport of its own, may open, and keep
+    # alive, to a host, and seconds idle connections are kept alive
+    client_max_connections: int = 50
+    client_max_keepalive_connections: int = 20
+    client_keepalive_expiry: float = 30
+    # Connections the pool of a host, shared by all the other httpx clients, may open and keep alive to it.
+    # Every request of the session to a regional host goes through it, long streams included. When the load
+    # benchmark runs, it fits its highest `benchmark_load_concurrency` plus `client_max_connections`.
+    shared_pool_max_connections: int = 400
+    shared_pool_max_keepalive_connections: int = 100
+    # Use HTTP/2 in the httpx clients, so concurrent requests to a host share one connection. Needs the http2
+    # extra. aiohttp, used by GlobalAPI, RegionalAPI and the CSS helpers, only speaks HTTP/1.1.
+    http2: bool = False
+    # Connections opened to each host, by each of the httpx pools and the aiohttp session, before tests start
+    prewarm_connections: int = 4
+
+    # Temporary service account keys
+    # Seconds keys last when they don't say when they expire, and seconds before they expire to mint a new
+    # one in the background. New keys are probed for up to `temp_key_propagation_timeout` seconds until
+    # they're accepted.
+    temp_key_ttl: float = 10
+    temp_key_refresh_margin: float = 3
+    temp_key_propagation_timeout: float = 5
+
+    # Preflight
+    # Before the tests start, the regional API, a find on the permanent KB, NUA predict and the processing
+    # status of every zone are probed, each for up to `preflight_timeout` seconds. The tests of zones that
+    # fail any of them are skipped ("skip") or failed right away ("fail"), or run anyway ("off").
+    preflight: Literal["skip", "fail", "off"] = "skip"
+    preflight_timeout: float = 15
+
+    # Run report
+    # JSON file where the attempts, retries and sleeps of every retry and polling site are written at the end
+    # of the run. Empty to not write it. With `run_report_push`, the totals by endpoint are also pushed to
+    # `prometheus_pushgateway`.
+    run_report_path: str = "e2e_run_report.json"
+    run_report_push: bool = False
+
     # Cloud Storage Sync
     google_drive_client_id: str = "212524434512-rj4vke2c755iqt44b46k5m6v1lsl8s88.apps.googleusercontent.com"
     google_drive_client_secret: str = ""
@@ -108,5 +218,18 @@ class E2ESettings(BaseSettings):
         return self
 
 
-# Singleton instance — import this from other modules
-settings = E2ESettings()  # type: ignore[call-arg]
+@cache
+def get_settings() -> E2ESettings:
+    return E2ESettings()  # type: ignore[call-arg]
+
+
+# Singleton instance — import this from other modules. It's read from the environment and validated the first
+# time it's imported from somewhere, not when this module is, so the settings models can be used without it.
+settings: E2ESettings
+
+
+def __getattr__(name: str) -> Any:
+    if name == "settings":
+        return get_settings()
+    err_msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(err_msg)
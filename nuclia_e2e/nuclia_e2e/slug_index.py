@@ -0,0 +1,85 @@
+"""Ids of the KBs and agents of each account and zone, by slug, shared by the whole session.
+
+Finding a KB or agent by slug means listing all of them, and tests do it before and after creating and
+deleting their own, so `SlugIndex` lists them once per zone and account and answers from memory from then
+on. Our create and delete helpers (see `nuclia_e2e.utils`) write their changes through to it, anything else
+changing KBs or agents must `invalidate` it. The reads verifying a create or delete are the only ones that
+go to the API.
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia.data import get_async_auth
+
+import asyncio
+
+
+class SlugIndex:
+    def __init__(self, kind: str, load: Callable[[str, str], Awaitable[dict[str, str]]]):
+        self.kind = kind
+        self._load = load
+        # Ids by slug, by zone and account
+        self._entries: dict[tuple[str, str], dict[str, str]] = {}
+        # Concurrent lookups of a zone and account that is not loaded yet wait for a single list call
+        self._locks: dict[tuple[asyncio.AbstractEventLoop, str, str], asyncio.Lock] = {}
+        self.hits = 0
+        self.loads = 0
+
+    async def fetch(self, zone: str, account: str) -> dict[str, str]:
+        """Ids by slug, straight from the API."""
+        self.loads += 1
+        return await self._load(zone, account)
+
+    async def get(self, zone: str, account: str, slug: str) -> str | None:
+        key = (zone, account)
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key].get(slug)
+        lock = self._locks.setdefault((asyncio.get_running_loop(), zone, account), asyncio.Lock())
+        async with lock:
+            if key in self._entries:
+                self.hits += 1
+            else:
+                ids = await self.fetch(zone, account)
+                # An empty list may as well be a zone that failed to answer, so it's not kept
+                if not ids:
+                    return None
+                self._entries[key] = ids
+        return self._entries[key].get(slug)
+
+    def put(self, zone: str, account: str, slug: str, id: str) -> None:
+        if (zone, account) in self._entries:
+            self._entries[(zone, account)][slug] = id
+
+    def discard(self, zone: str, account: str, slug: str) -> None:
+        if (zone, account) in self._entries:
+            self._entries[(zone, account)].pop(slug, None)
+
+    def invalidate(self, zone: str | None = None, account: str | None = None) -> None:
+        """Forget the ids of a zone and/or account, or all of them, to list them again when next needed."""
+        for key in list(self._entries):
+            if zone in (None, key[0]) and account in (None, key[1]):
+                del self._entries[key]
+
+    def __str__(self) -> str:
+        return f"{self.kind}: lists={self.loads}, hits={self.hits}"
+
+
+async def _list_kbs(zone: str, account: str) -> dict[str, str]:
+    auth = get_async_auth()
+    knowledge_boxes = await auth.kbs(account, cached=False, zone=zone)
+    return {kb.slug: kb.id for kb in knowledge_boxes if kb.slug is not None}
+
+
+async def _list_agents(zone: str, account: str) -> dict[str, str]:
+    auth = get_async_auth()
+    agents = await auth.agents(account, cached=False, zone=zone)
+    return {agent.slug: agent.id for agent in agents if agent.slug is not None}
+
+
+KB_INDEX = SlugIndex("kbs", _list_kbs)
+AGENT_INDEX = SlugIndex("agents", _list_agents)
+
+
+def slug_index_report() -> list[str]:
+    return [str(index) for index in (KB_INDEX, AGENT_INDEX) if index.loads or index.hits]
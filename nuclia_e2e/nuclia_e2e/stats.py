@@ -0,0 +1,38 @@
+"""Summary statistics of the latencies and durations measured by the e2e."""
+
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Sequence
+
+import math
+import random
+import statistics
+
+
+def percentile(values: Iterable[float], p: float) -> float:
+    """The `p`-th percentile (0-100) of `values`, by the nearest rank. 0 if there are no values."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(len(ordered) * p / 100) - 1, 0)]
+
+
+def bootstrap_interval(
+    values: Sequence[float],
+    statistic: Callable[[Sequence[float]], float] = statistics.median,
+    confidence: float = 0.95,
+    resamples: int = 2000,
+    seed: int = 0,
+) -> tuple[float, float]:
+    """Percentile bootstrap confidence interval of `statistic` over `values`.
+
+    Seeded, so the same samples always get the same interval. Degenerates to the statistic itself with less
+    than two values.
+    """
+    if len(values) < 2:
+        value = statistic(values) if values else 0.0
+        return value, value
+    rng = random.Random(seed)
+    estimates = [statistic(rng.choices(values, k=len(values))) for _ in range(resamples)]
+    tail = (1 - confidence) / 2 * 100
+    return percentile(estimates, tail), percentile(estimates, 100 - tail)
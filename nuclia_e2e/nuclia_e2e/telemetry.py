@@ -0,0 +1,211 @@
+"""Where the time of the e2e run goes: attempts, retries and sleeps of every retry and polling site.
+
+The outcomes of all the calls made with a `RetryPolicy` and the stats of every `wait_for` are aggregated by
+test, site (the policy, or "wait_for") and endpoint (the method or condition name), into a report that is
+written as JSON at the end of the run and can be pushed to the Prometheus pushgateway.
+"""
+
+from collections import Counter
+from collections.abc import Callable
+from contextvars import ContextVar
+from contextvars import copy_context
+from nuclia_e2e.polling import POLL_STATS_HOOKS
+from nuclia_e2e.polling import PollStats
+from nuclia_e2e.resilience import CallOutcome
+from nuclia_e2e.resilience import OUTCOME_HOOKS
+from nuclia_e2e.resilience import status_code_of
+from pathlib import Path
+from typing import Any
+
+import dataclasses
+import functools
+import inspect
+import json
+import pytest
+
+# Node id of the test running in the current task. Calls made outside tests (e.g. by session fixtures) are
+# reported under SESSION.
+SESSION = "session"
+current_test: ContextVar[str] = ContextVar("nuclia_e2e_current_test", default=SESSION)
+
+WAIT_FOR_SITE = "wait_for"
+
+
+class AttributedToTest:
+    """Test function that sets `current_test` to the test while it runs.
+
+    pytest-asyncio-cooperative sets each fixture up in a task of its own, so only what runs in the test itself
+    can set it for the test. Coroutine tests set it in the task they run in, that is never reused, and the
+    others in a copy of the context. The code, defaults and annotations of the function are kept, so plugins
+    still see its arguments and whether it's a coroutine function.
+    """
+
+    def __init__(self, function: Callable[..., Any], nodeid: str):
+        functools.update_wrapper(
+            self,
+            function,
+            assigned=(*functools.WRAPPER_ASSIGNMENTS, "__code__", "__defaults__", "__kwdefaults__"),
+        )
+        self.function = function
+        self.nodeid = nodeid
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if inspect.iscoroutinefunction(self.function):
+            return self._call_async(*args, **kwargs)
+        return copy_context().run(self._call, *args, **kwargs)
+
+    def _call(self, *args: Any, **kwargs: Any) -> Any:
+        current_test.set(self.nodeid)
+        return self.function(*args, **kwargs)
+
+    async def _call_async(self, *args: Any, **kwargs: Any) -> Any:
+        current_test.set(self.nodeid)
+        return await self.function(*args, **kwargs)
+
+
+def attribute_to_tests(items: list[pytest.Item]) -> None:
+    """Report the calls made by the collected tests as theirs."""
+    for item in items:
+        if isinstance(item, pytest.Function) and inspect.isfunction(item.obj):
+            item.obj = AttributedToTest(item.obj, item.nodeid)
+
+
+@dataclasses.dataclass
+class SiteStats:
+    attempts: int = 0
+    retries: int = 0
+    failures: int = 0
+    # Seconds slept between attempts or polls
+    slept: float = 0.0
+    # Seconds spent on attempts or polls that had to be done again, sleeps included
+    wasted: float = 0.0
+    # Retried errors by exception type and status code
+    causes: Counter[str] = dataclasses.field(default_factory=Counter)
+
+    def add(self, other: "SiteStats") -> None:
+        self.attempts += other.attempts
+        self.retries += other.retries
+        self.failures += other.failures
+        self.slept += other.slept
+        self.wasted += other.wasted
+        self.causes.update(other.causes)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "slept": round(self.slept, 3),
+            "wasted": round(self.wasted, 3),
+            "causes": dict(self.causes.most_common()),
+        }
+
+
+def _cause(exc: BaseException | None) -> str:
+    if exc is None:
+        return "unknown"
+    status_code = status_code_of(exc)
+    return type(exc).__name__ if status_code is None else f"{type(exc).__name__} {status_code}"
+
+
+@dataclasses.dataclass
+class RunTelemetry:
+    # Stats by (test, site, endpoint, zone)
+    stats: dict[tuple[str, str, str, str], SiteStats] = dataclasses.field(default_factory=dict)
+    # Extra sections of the report, by name
+    sections: dict[str, Any] = dataclasses.field(default_factory=dict)
+    # Extra gauges pushed with the report, by name: their documentation and values by labels
+    gauges: dict[str, tuple[str, dict[tuple[tuple[str, str], ...], float]]] = dataclasses.field(
+        default_factory=dict
+    )
+
+    def set_gauge(self, name: str, documentation: str, value: float, **labels: str) -> None:
+        self.gauges.setdefault(name, (documentation, {}))[1][tuple(sorted(labels.items()))] = value
+
+    def _stats(self, site: str, endpoint: str, zone: str | None) -> SiteStats:
+        key = (current_test.get(), site, endpoint, zone or "-")
+        return self.stats.setdefault(key, SiteStats())
+
+    def record_outcome(self, outcome: CallOutcome) -> None:
+        if outcome.outcome not in ("success", "retry", "failure"):
+            return
+        stats = self._stats(outcome.policy, outcome.target, outcome.zone)
+        stats.attempts += 1
+        if outcome.outcome == "retry":
+            stats.retries += 1
+            stats.slept += outcome.delay
+            stats.wasted += outcome.duration + outcome.delay
+            stats.causes[_cause(outcome.exception)] += 1
+        elif outcome.outcome == "failure":
+            stats.failures += 1
+
+    def record_poll(self, condition: str, poll: PollStats) -> None:
+        stats = self._stats(WAIT_FOR_SITE, condition, None)
+        stats.attempts += poll.polls
+        stats.retries += max(poll.polls - 1, 0)
+        stats.slept += poll.slept
+        if poll.polls > 1:
+            # Only the last poll was useful, and polls are assumed to take the same time
+            stats.wasted += poll.slept + (poll.elapsed - poll.slept) * (poll.polls - 1) / poll.polls
+
+    def by_endpoint(self) -> dict[tuple[str, str, str], SiteStats]:
+        totals: dict[tuple[str, str, str], SiteStats] = {}
+        for (_, site, endpoint, zone), stats in self.stats.items():
+            totals.setdefault((site, endpoint, zone), SiteStats()).add(stats)
+        return totals
+
+    def report(self) -> dict[str, Any]:
+        by_endpoint = sorted(self.by_endpoint().items(), key=lambda item: -item[1].wasted)
+        tests: dict[str, list[dict[str, Any]]] = {}
+        for (test, site, endpoint, zone), stats in sorted(self.stats.items()):
+            tests.setdefault(test, []).append(
+                {"site": site, "endpoint": endpoint, "zone": zone, **stats.to_json()}
+            )
+        return {
+            "endpoints": [
+                {"site": site, "endpoint": endpoint, "zone": zone, **stats.to_json()}
+                for (site, endpoint, zone), stats in by_endpoint
+            ],
+            "tests": tests,
+            **self.sections,
+        }
+
+    def write(self, path: Path) -> None:
+        with path.open("w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def push(self, gateway_url: str, job: str, instance: str) -> None:
+        """Push the totals by endpoint and the extra gauges. Tests are left out to keep the number of series
+        bounded."""
+        # Only needed at the end of the run, so it's not imported at collection time
+        from prometheus_client import CollectorRegistry
+        from prometheus_client import Gauge
+        from prometheus_client import push_to_gateway
+
+        registry = CollectorRegistry()
+        labelnames = ["site", "endpoint", "zone"]
+        gauges = {
+            field: Gauge(f"e2e_{field}{suffix}", documentation, labelnames=labelnames, registry=registry)
+            for field, suffix, documentation in (
+                ("attempts", "", "Attempts or polls made by the e2e run"),
+                ("retries", "", "Attempts or polls made again by the e2e run"),
+                ("slept", "_seconds", "Time slept between attempts or polls by the e2e run"),
+                ("wasted", "_seconds", "Time spent on attempts or polls that had to be made again"),
+            )
+        }
+        for (site, endpoint, zone), stats in self.by_endpoint().items():
+            for field, gauge in gauges.items():
+                gauge.labels(site=site, endpoint=endpoint, zone=zone).set(getattr(stats, field))
+        for name, (documentation, values) in self.gauges.items():
+            extra = Gauge(
+                name, documentation, labelnames=[label for label, _ in next(iter(values))], registry=registry
+            )
+            for labels, value in values.items():
+                # Gauges without labels, e.g. of the whole run, have no children to set
+                (extra.labels(**dict(labels)) if labels else extra).set(value)
+        push_to_gateway(gateway_url, job=job, grouping_key={"instance": instance}, registry=registry)
+
+
+RUN_TELEMETRY = RunTelemetry()
+OUTCOME_HOOKS.append(RUN_TELEMETRY.record_outcome)
+POLL_STATS_HOOKS.append(RUN_TELEMETRY.record_poll)
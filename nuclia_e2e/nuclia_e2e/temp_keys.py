@@ -0,0 +1,193 @@
+"""Temporary service account keys, minted ahead of time so tests don't wait for them.
+
+Temporary keys only last a few seconds, so tests used to mint a new one right before each use. The
+`TempKeyProvider` keeps the last key of each service account and security groups, and mints the next one in
+the background shortly before it expires, as long as it was used. Minting latency and how long new keys
+take to be accepted (propagation) are measured on their own, so a slow auth path doesn't show up as slow
+asks.
+"""
+
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.settings import settings
+from nuclia_e2e.stats import percentile
+from nuclia_e2e.utils import wait_for
+from time import monotonic
+from time import time
+from typing import Any
+
+import asyncio
+import base64
+import dataclasses
+import json
+
+# Mints a temporary key from a service account key, restricted to some security groups (None for all)
+Mint = Callable[[str, list[str] | None], Awaitable[str]]
+# Whether a temporary key is accepted yet
+Probe = Callable[[str], Awaitable[bool]]
+
+
+def _expires_in(token: str) -> float | None:
+    """Seconds until a JWT expires, from its `exp` claim, or None if it doesn't have one."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"]) - time()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+@dataclasses.dataclass
+class TempKey:
+    token: str
+    # `monotonic` time after which the key is no longer valid
+    expires_at: float
+    used: bool = False
+
+
+@dataclasses.dataclass
+class TempKeyStats:
+    minted: int = 0
+    # Keys minted in the background, before the previous one expired
+    refreshed: int = 0
+    # Times a key was handed out, and how many of them had to be minted right then
+    served: int = 0
+    waited: int = 0
+    mint_latencies: list[float] = dataclasses.field(default_factory=list)
+    # Seconds from minting a key until it was accepted, and keys that weren't within the timeout
+    propagation_delays: list[float] = dataclasses.field(default_factory=list)
+    unpropagated: int = 0
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "minted": self.minted,
+            "refreshed": self.refreshed,
+            "served": self.served,
+            "waited": self.waited,
+            "mint_p50": round(percentile(self.mint_latencies, 50), 3),
+            "mint_p95": round(percentile(self.mint_latencies, 95), 3),
+            "propagation_p50": round(percentile(self.propagation_delays, 50), 3),
+            "propagation_p95": round(percentile(self.propagation_delays, 95), 3),
+            "unpropagated": self.unpropagated,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"minted={self.minted} (refreshed={self.refreshed}), served={self.served} (waited={self.waited}),"
+            f" mint p50={percentile(self.mint_latencies, 50):.3f}s"
+            f" p95={percentile(self.mint_latencies, 95):.3f}s,"
+            f" propagation p50={percentile(self.propagation_delays, 50):.3f}s"
+            f" p95={percentile(self.propagation_delays, 95):.3f}s, unpropagated={self.unpropagated}"
+        )
+
+
+@dataclasses.dataclass
+class _Entry:
+    sa_token: str
+    security_groups: list[str] | None
+    mint: Mint
+    probe: Probe | None
+    key: TempKey | None = None
+    # Key being minted, shared by everyone needing a new one meanwhile
+    pending: asyncio.Task[TempKey] | None = None
+    # Seconds the last key took to be minted and accepted, to start refreshing that much earlier
+    lead: float = 0.0
+    refresh: asyncio.Task[None] | None = None
+
+
+class TempKeyProvider:
+    def __init__(self) -> None:
+        # By event loop, service account key and security groups
+        self._entries: dict[tuple[asyncio.AbstractEventLoop, str, tuple[str, ...] | None], _Entry] = {}
+        self.stats = TempKeyStats()
+
+    async def get(
+        self, sa_token: str, security_groups: list[str] | None, mint: Mint, probe: Probe | None = None
+    ) -> str:
+        """A temporary key of `sa_token` for `security_groups`, minted with `mint` if there's no valid one.
+
+        With `probe`, new keys are only handed out once it accepts them.
+        """
+        groups = tuple(sorted(security_groups)) if security_groups is not None else None
+        loop = asyncio.get_running_loop()
+        entry = self._entries.setdefault(
+            (loop, sa_token, groups), _Entry(sa_token, security_groups, mint, probe)
+        )
+        if not self._is_fresh(entry.key):
+            self.stats.waited += 1
+            entry.key = await self._next_key(entry)
+        assert entry.key is not None
+        entry.key.used = True
+        self.stats.served += 1
+        if entry.refresh is None or entry.refresh.done():
+            entry.refresh = asyncio.create_task(self._refresh(entry))
+        return entry.key.token
+
+    @staticmethod
+    def _is_fresh(key: TempKey | None) -> bool:
+        # Keys about to expire could do so before the request using them is authorized
+        return key is not None and key.expires_at - monotonic() > settings.temp_key_refresh_margin / 2
+
+    async def _next_key(self, entry: _Entry) -> TempKey:
+        if entry.pending is None or entry.pending.done():
+            entry.pending = asyncio.create_task(self._mint(entry))
+        return await asyncio.shield(entry.pending)
+
+    async def _mint(self, entry: _Entry) -> TempKey:
+        start = monotonic()
+        token = await entry.mint(entry.sa_token, entry.security_groups)
+        minted_at = monotonic()
+        self.stats.minted += 1
+        self.stats.mint_latencies.append(minted_at - start)
+        expires_in = _expires_in(token)
+        key = TempKey(token, minted_at + (expires_in if expires_in is not None else settings.temp_key_ttl))
+        if entry.probe is not None:
+            await self._wait_propagated(entry.probe, token, minted_at)
+        entry.lead = monotonic() - start
+        return key
+
+    async def _wait_propagated(self, probe: Probe, token: str, minted_at: float) -> None:
+        async def temp_key_propagated() -> tuple[bool, None]:
+            return await probe(token), None
+
+        propagated, _ = await wait_for(
+            temp_key_propagated,
+            max_wait=settings.temp_key_propagation_timeout,
+            schedule=Fixed(0.2),
+            logger=lambda msg: None,
+        )
+        if propagated:
+            self.stats.propagation_delays.append(monotonic() - minted_at)
+        else:
+            self.stats.unpropagated += 1
+
+    async def _refresh(self, entry: _Entry) -> None:
+        """Have the next key of `entry` ready before the current one expires, while they keep being used."""
+        while entry.key is not None and entry.key.used:
+            refresh_at = entry.key.expires_at - settings.temp_key_refresh_margin - entry.lead
+            await asyncio.sleep(max(refresh_at - monotonic(), 0))
+            try:
+                entry.key = await self._next_key(entry)
+            except Exception as exc:
+                # The next `get` will mint one itself
+                print(f"Could not refresh a temporary service account key: {exc!r}")
+                return
+            self.stats.refreshed += 1
+
+    async def aclose(self) -> None:
+        """Stop refreshing the keys of the running loop."""
+        loop = asyncio.get_running_loop()
+        for full_key in [full_key for full_key in self._entries if full_key[0] is loop]:
+            entry = self._entries.pop(full_key)
+            tasks = [task for task in (entry.refresh, entry.pending) if task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+TEMP_KEYS = TempKeyProvider()
+
+
+def temp_key_report() -> list[str]:
+    return [str(TEMP_KEYS.stats)] if TEMP_KEYS.stats.minted else []
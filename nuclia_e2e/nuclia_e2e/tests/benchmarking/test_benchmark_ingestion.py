@@ -1,42 +1,44 @@
 from collections.abc import Callable
-from datetime import datetime
-from datetime import timezone
 from functools import wraps
 from nuclia.data import get_auth
 from nuclia.lib.kb import AsyncNucliaDBClient
 from nuclia.sdk.kb import AsyncNucliaKB
-from nuclia.sdk.kbs import AsyncNucliaKBS
+from nuclia_e2e.benchmark import extract_versions
+from nuclia_e2e.benchmark import push_timings_to_prometheus
+from nuclia_e2e.benchmark import StepRuns
+from nuclia_e2e.benchmark import Timer
+from nuclia_e2e.notifications import NotificationWaiter
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.polling import Learned
+from nuclia_e2e.resilience import EVENTUAL_CONSISTENCY_POLICY
+from nuclia_e2e.resilience import with_policy
 from nuclia_e2e.settings import settings
+from nuclia_e2e.stats import percentile
 from nuclia_e2e.utils import ASSETS_FILE_PATH
 from nuclia_e2e.utils import create_test_kb
+from nuclia_e2e.utils import delete_kb_if_exists
 from nuclia_e2e.utils import delete_test_kb
 from nuclia_e2e.utils import get_async_kb_ndb_client
-from nuclia_e2e.utils import get_kbid_from_slug
-from nuclia_e2e.utils import wait_for
 from nucliadb_models.metadata import ResourceProcessingStatus
-from nucliadb_sdk.v2.exceptions import ClientError
+from nucliadb_models.notifications import NotificationType
 from pathlib import Path
-from prometheus_client import CollectorRegistry
-from prometheus_client import Gauge
-from prometheus_client import push_to_gateway
 from textwrap import dedent
+from time import monotonic
 from typing import Any
 
-import backoff
+import asyncio
+import dataclasses
 import json
 import pytest
-import yaml
 
 Logger = Callable[[str], None]
 
 TEST_CHOCO_QUESTION = "why are cocoa prices high?"
 TEST_CHOCO_ASK_MORE = "When did they start being high?"
 GHA_RUN_ID = settings.gha_run_id
-PROMETHEUS_PUSHGATEWAY = settings.prometheus_pushgateway
-CORE_APPS_REPO_PATH = settings.core_apps_repo_path
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_find(regional_api_config, ndb: AsyncNucliaDBClient, logger: Logger):
     kb = AsyncNucliaKB()
 
@@ -54,7 +56,7 @@ async def run_test_find(regional_api_config, ndb: AsyncNucliaDBClient, logger: L
     assert first_resource.slug == "chocolatier"
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_ask(regional_api_config, ndb: AsyncNucliaDBClient, logger: Logger, model):
     kb = AsyncNucliaKB()
 
@@ -100,96 +102,9 @@ async def run_test_ask(regional_api_config, ndb: AsyncNucliaDBClient, logger: Lo
     assert "earlier" in ask_more_result.answer.decode().lower()
 
 
-class Timer:
-    def __init__(self, desc: str):
-        self.desc = desc
-        self.start_time: datetime | None = None
-        self.end_time: datetime | None = None
-
-    @property
-    def elapsed(self):
-        delta = self.end_time - self.start_time
-        return delta.total_seconds()
-
-    def start(self, dt: datetime | None = None):
-        self.start_time = dt if dt is not None else datetime.now(timezone.utc)
-        return self.start_time
-
-    def stop(self, dt: datetime | None = None):
-        self.end_time = dt if dt is not None else datetime.now(timezone.utc)
-        return self.end_time
-
-
-def push_timings_to_prometheus(
-    timings: dict[str, Timer],
-    job_name: str,
-    instance: str,
-    benchmark_type: str,
-    cluster: str,
-    extra_labels: dict[str, str] | None = None,
-    gateway_url: str = PROMETHEUS_PUSHGATEWAY,
-):
-    registry = CollectorRegistry()
-
-    base_labels = {
-        "benchmark_type": benchmark_type,
-        "k8s_cluster": cluster,
-        "step": "",  # Placeholder, set dynamically below
-    }
-    if extra_labels:
-        base_labels.update(extra_labels)
-
-    # Create a gauge with dynamic label names
-    label_names = list(base_labels.keys())
-    g = Gauge(
-        name="benchmark_step_duration_seconds",
-        documentation="Elapsed time for each step in benchmark (in seconds)",
-        labelnames=label_names,
-        registry=registry,
-    )
-
-    for step_name, timer in timings.items():
-        labels = base_labels.copy()
-        labels["step"] = step_name
-        g.labels(**labels).set(timer.elapsed)
-
-    # Push to Pushgateway
-    push_to_gateway(gateway_url, job=job_name, grouping_key={"instance": instance}, registry=registry)
-
-
-def get_application_set_version(file_path, cluster):
-    try:
-        with Path(file_path).open() as file:
-            yaml_data = yaml.safe_load(file)
-            versions = {
-                item["cluster"]: item["app_chart_version"]
-                for item in yaml_data["spec"]["generators"][0]["list"]["elements"]
-            }
-            if cluster not in versions:
-                raise RuntimeError(f"Cluster {cluster} not defined in {file_path}")
-            return versions[cluster]
-    except FileNotFoundError as exc:
-        err_msg = f"ApplicationSet not found at {file_path}, refresh local repos"
-        raise RuntimeError(err_msg) from exc
-
-
-def extract_versions(components, cluster):
-    versions = {}
-    for component_name in components:
-        app_set_file = f"{CORE_APPS_REPO_PATH}/apps/{component_name}.applicationSet.yaml"
-        label_component_name = component_name.replace("-", "_")
-        versions[label_component_name] = get_application_set_version(app_set_file, cluster)
-    return versions
-
-
-@pytest.mark.skipif(settings.benchmark != "1", reason="Benchmark not enabled")
-@pytest.mark.asyncio_cooperative
-async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_api_config):
-    """
-    This test ferforms the minimal operations too upload a file and validate that is indexed
-    with the purpose of benchmarking the ingestion process
-    """
-    timings = {
+def ingestion_timings() -> dict[str, Timer]:
+    """Timers of the stages a file goes through since it's uploaded until it can be searched."""
+    return {
         "upload": Timer("Client perceived upload time"),
         "process_delay": Timer(
             "Time elapsed  since upload finished to processing-slow start. This is a rough metric as the"
@@ -203,36 +118,35 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
         ),
         "index_ready": Timer("Elapsed time since NucliaDB stored the processed BM until is ready for search"),
     }
-    benchmark_env = regional_api_config.global_config.name
-    benchmark_cluster = regional_api_config.name
 
-    def logger(msg):
-        print(f"{request.node.name} ::: {msg}")
 
-    zone = regional_api_config.zone_slug
-    auth = get_auth()
-    kb_slug = f"{regional_api_config.test_kb_slug}-benchmark"
+@dataclasses.dataclass
+class IngestedFile:
+    rid: str
+    timings: dict[str, Timer]
+    # Paragraphs extracted from the file
+    paragraphs: int
 
-    # Make sure the kb used for this test is deleted, as the slug is reused:
-    old_kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
-    if old_kbid is not None:
-        await AsyncNucliaKBS().delete(zone=regional_api_config.zone_slug, id=old_kbid)
 
-    # Creates a brand new kb that will be used troughout this test
-    kbid = await create_test_kb(regional_api_config, kb_slug, logger)
+async def ingest_file(
+    kb: AsyncNucliaKB,
+    ndb: AsyncNucliaDBClient,
+    notifications: NotificationWaiter,
+    path: Path,
+    indexed_query: str,
+    schedule_key: str = "",
+) -> IngestedFile:
+    """Upload the file at `path` and time its stages until a find of `indexed_query` matches it.
 
-    # Configures a nucliadb client defaulting to a specific kb, to be used
-    # to override all the sdk endpoints that automagically creates the client
-    # as this is incompatible with the cooperative tests
-
-    async_ndb = get_async_kb_ndb_client(zone, kbid, user_token=auth._config.token)
-
-    # Upload a new resource and validate that is correctly processed and stored in nuclia
-    # Also check that its index are available, by checking the amount of extracted paragraphs
-    kb = AsyncNucliaKB()
-    timings["upload"].start()
-    await kb.upload.file(path=f"{ASSETS_FILE_PATH}/chocolatier.html", field="file", ndb=async_ndb)
-    timings["upload"].stop()
+    Readiness is taken from the time the KB notifications arrive, the polling conditions are only used if
+    the notifications stream is not available. Polls learn their schedule by `schedule_key`, as the stages
+    don't take the same time under load.
+    """
+    timings = ingestion_timings()
+    with timings["upload"].observe_retries():
+        timings["upload"].start()
+        rid = await kb.upload.file(path=str(path), field="file", ndb=ndb)
+        timings["upload"].stop()
     timings["process_delay"].start(timings["upload"].stop())
 
     # Wait for resource to be processed
@@ -240,26 +154,36 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
         @wraps(first_resource_is_processed)
         async def condition() -> tuple[bool, Any]:
             timings["ingest"].stop()
-            resources = await kb.list(ndb=async_ndb)
-            if len(resources.resources) > 0:
-                if resources.resources[0].metadata.status == ResourceProcessingStatus.PROCESSED:
-                    resource = await kb.resource.get(
-                        rid=resources.resources[0].id, ndb=async_ndb, show=["basic", "extracted"]
-                    )
-                    return (True, resource)
-            return False, None
+            resource = await kb.resource.get(rid=rid, ndb=ndb)
+            return resource.metadata.status == ResourceProcessingStatus.PROCESSED, None
 
         return condition
 
-    success, resource = await wait_for(
-        first_resource_is_processed(), max_wait=180, interval=0.5, logger=logger
-    )
+    # When polling, the poll interval bounds the precision of the "ingest" timing, so poll densely around
+    # the duration seen in previous runs and back off otherwise
+    with timings["ingest"].observe_retries():
+        success, processed = await notifications.wait(
+            NotificationType.RESOURCE_PROCESSED,
+            rid,
+            max_wait=180,
+            fallback=first_resource_is_processed(),
+            schedule=Learned(
+                f"first_resource_is_processed{schedule_key}",
+                fallback=ExponentialJitter(initial=0.5, factor=1.5, max_interval=2),
+                dense_interval=0.25,
+            ),
+        )
     assert success, "File was not processed in time, PROCESSED status not found in resource"
+    if processed is not None:
+        timings["ingest"].stop(processed.received_at)
+
+    resource = await kb.resource.get(rid=rid, ndb=ndb, show=["basic", "extracted"])
 
     # Read timings of processing steps, provided by the processor and stored in extracted metadata
-    # last_understanding is the timestamp of the last thing done just before sending the BrokerMessage to NDB
-    processing_started = resource.data.files["file"].extracted.metadata.metadata.last_processing_start
-    processing_finished = resource.data.files["file"].extracted.metadata.metadata.last_understanding
+    # last_understanding is the timestamp of the last thing done just before sending the BrokerMessage
+    file_metadata = resource.data.files["file"].extracted.metadata.metadata
+    processing_started = file_metadata.last_processing_start
+    processing_finished = file_metadata.last_understanding
 
     timings["process"].start(processing_started)
     timings["process"].stop(processing_finished)
@@ -273,19 +197,87 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
     def resource_is_indexed(rid):
         @wraps(resource_is_indexed)
         async def condition() -> tuple[bool, Any]:
-            # Considering that if the index is ready, it was before the request started, so keep updating this
-            # until is actually true. This will be probably more accurate than waiting for the request to end.
+            # Considering that if the index is ready, it was before the request started, so keep updating
+            # this until is actually true. This will be probably more accurate than waiting for the
+            # request to end.
             timings["index_ready"].stop()
             result = await kb.search.find(
-                ndb=async_ndb, features=["keyword"], reranker="noop", query="Michiko"
+                ndb=ndb, features=["keyword"], reranker="noop", query=indexed_query, resource_filters=[rid]
             )
-            print(len(result.resources))
             return len(result.resources) > 0, None
 
         return condition
 
-    success, _ = await wait_for(resource_is_indexed(resource.id), logger=logger, max_wait=60, interval=0.1)
+    # The resource is also indexed right after the upload, only the indexing of the processed data
+    # (same or later seqid than the processed notification) counts
+    with timings["index_ready"].observe_retries():
+        success, indexed = await notifications.wait(
+            NotificationType.RESOURCE_INDEXED,
+            rid,
+            min_seqid=processed.seqid if processed is not None else 0,
+            max_wait=60,
+            fallback=resource_is_indexed(rid),
+            schedule=Learned(
+                f"resource_is_indexed{schedule_key}",
+                fallback=ExponentialJitter(initial=0.1, factor=1.5, max_interval=1, jitter=0.1),
+                dense_interval=0.1,
+            ),
+        )
     assert success, "File was not indexed in time, not enough paragraphs found on resource"
+    if indexed is not None:
+        timings["index_ready"].stop(indexed.received_at)
+    return IngestedFile(rid, timings, len(file_metadata.paragraphs))
+
+
+@pytest.mark.skipif(settings.benchmark != "1", reason="Benchmark not enabled")
+@pytest.mark.asyncio_cooperative
+async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_api_config):
+    """
+    This test ferforms the minimal operations too upload a file and validate that is indexed
+    with the purpose of benchmarking the ingestion process
+    """
+    benchmark_env = regional_api_config.global_config.name
+    benchmark_cluster = regional_api_config.name
+
+    def logger(msg):
+        print(f"{request.node.name} ::: {msg}")
+
+    zone = regional_api_config.zone_slug
+    auth = get_auth()
+    kb_slug = f"{regional_api_config.test_kb_slug}-benchmark"
+
+    # Make sure the kb used for this test is deleted, as the slug is reused:
+    await delete_kb_if_exists(regional_api_config, kb_slug)
+
+    # Creates a brand new kb that will be used troughout this test
+    kbid = await create_test_kb(regional_api_config, kb_slug, logger)
+
+    # Configures a nucliadb client defaulting to a specific kb, to be used
+    # to override all the sdk endpoints that automagically creates the client
+    # as this is incompatible with the cooperative tests
+
+    async_ndb = get_async_kb_ndb_client(zone, kbid, user_token=auth._config.token)
+
+    # Upload a new resource and validate that is correctly processed and stored in nuclia
+    # Also check that its index are available, by checking the amount of extracted paragraphs
+    kb = AsyncNucliaKB()
+
+    # Subscribe before uploading, so no notification is missed
+    assert settings.benchmark_repetitions >= 1, "At least one run must be measured"
+    runs: list[IngestedFile] = []
+    file_path = ASSETS_FILE_PATH / "chocolatier.html"
+    async with NotificationWaiter(async_ndb, logger=logger) as notifications:
+        if settings.benchmark_warmup:
+            logger("Warm-up run, not measured")
+            await ingest_file(kb, async_ndb, notifications, file_path, indexed_query="Michiko")
+        for run in range(settings.benchmark_repetitions):
+            logger(f"Run {run + 1} of {settings.benchmark_repetitions}")
+            runs.append(await ingest_file(kb, async_ndb, notifications, file_path, indexed_query="Michiko"))
+    ingested = runs[-1]
+    timings = {
+        step: StepRuns(timer.desc, [run.timings[step] for run in runs], warmup=settings.benchmark_warmup)
+        for step, timer in ingested.timings.items()
+    }
 
     running_versions = extract_versions(
         ["nucliadb-writer", "nucliadb-ingest", "nidx", "processing", "processing-slow"],
@@ -300,7 +292,7 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
         json.dump(
             {
                 "kbid": kbid,
-                "rid": resource.id,
+                "rid": ingested.rid,
                 "grafana_url": regional_api_config.global_config.grafana_url,
                 "tempo_datasource_id": regional_api_config.global_config.tempo_datasource_id,
             },
@@ -309,10 +301,7 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
 
     # store timings
     with Path(f"{benchmark_env}__{benchmark_cluster}__timings.json").open("w") as f:
-        json_timings = {
-            timer_name: {"elapsed": f"{timer.elapsed:.3f}", "desc": timer.desc}
-            for timer_name, timer in timings.items()
-        }
+        json_timings = {timer_name: timer.to_json() for timer_name, timer in timings.items()}
         json.dump(json_timings, f)
 
     push_timings_to_prometheus(
@@ -322,7 +311,147 @@ async def test_benchmark_kb_ingestion(request: pytest.FixtureRequest, regional_a
         benchmark_type="ingestion",
         cluster=benchmark_cluster,
         extra_labels={f"version_{component}": version for component, version in running_versions.items()},
+        quantiles={step: step_runs.stats() for step, step_runs in timings.items()} if len(runs) > 1 else None,
     )
 
     # Delete the kb as a final step
     await delete_test_kb(regional_api_config, kbid, kb_slug, logger)
+
+
+# Quantiles of the stage durations reported by the load benchmark
+LOAD_QUANTILES = (50, 95, 99)
+
+
+@dataclasses.dataclass
+class LoadLevel:
+    """Ingestion of `documents` files, `concurrency` of them at a time."""
+
+    concurrency: int
+    documents: int
+    # Seconds since the first upload started until the last file could be searched
+    elapsed: float
+    paragraphs: int
+    # Timers of each file, by stage
+    stages: dict[str, list[Timer]]
+
+    @property
+    def files_per_second(self) -> float:
+        return self.documents / self.elapsed
+
+    @property
+    def paragraphs_per_second(self) -> float:
+        return self.paragraphs / self.elapsed
+
+    def quantiles(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: {f"p{p}": percentile([timer.elapsed for timer in timers], p) for p in LOAD_QUANTILES}
+            for stage, timers in self.stages.items()
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "documents": self.documents,
+            "elapsed": f"{self.elapsed:.3f}",
+            "paragraphs": self.paragraphs,
+            "files_per_second": f"{self.files_per_second:.3f}",
+            "paragraphs_per_second": f"{self.paragraphs_per_second:.3f}",
+            "stages": {
+                stage: {
+                    **{quantile: f"{value:.3f}" for quantile, value in quantiles.items()},
+                    "retries": sum(timer.retries for timer in self.stages[stage]),
+                }
+                for stage, quantiles in self.quantiles().items()
+            },
+        }
+
+
+async def ingest_concurrently(
+    kb: AsyncNucliaKB,
+    ndb: AsyncNucliaDBClient,
+    notifications: NotificationWaiter,
+    concurrency: int,
+    documents: int,
+) -> LoadLevel:
+    """Ingest `documents` copies of the benchmark file, keeping `concurrency` of them in flight (uploading,
+    processing or indexing) at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ingest_one() -> IngestedFile:
+        async with semaphore:
+            return await ingest_file(
+                kb,
+                ndb,
+                notifications,
+                ASSETS_FILE_PATH / "chocolatier.html",
+                indexed_query="Michiko",
+                schedule_key=f":load{concurrency}",
+            )
+
+    start = monotonic()
+    ingested = await asyncio.gather(*(ingest_one() for _ in range(documents)))
+    elapsed = monotonic() - start
+    return LoadLevel(
+        concurrency=concurrency,
+        documents=documents,
+        elapsed=elapsed,
+        paragraphs=sum(file.paragraphs for file in ingested),
+        stages={stage: [file.timings[stage] for file in ingested] for stage in ingestion_timings()},
+    )
+
+
+@pytest.mark.skipif(settings.benchmark_load != "1", reason="Load benchmark not enabled")
+@pytest.mark.asyncio_cooperative
+async def test_benchmark_kb_ingestion_load(request: pytest.FixtureRequest, regional_api_config):
+    """
+    Ingest files into a fresh KB at each of the `BENCHMARK_LOAD_CONCURRENCY` levels, to benchmark the
+    ingestion throughput, and how each stage degrades, under load
+    """
+    benchmark_env = regional_api_config.global_config.name
+    benchmark_cluster = regional_api_config.name
+
+    def logger(msg):
+        print(f"{request.node.name} ::: {msg}")
+
+    zone = regional_api_config.zone_slug
+    auth = get_auth()
+    kb_slug = f"{regional_api_config.test_kb_slug}-benchmark-load"
+    await delete_kb_if_exists(regional_api_config, kb_slug)
+    kbid = await create_test_kb(regional_api_config, kb_slug, logger)
+    async_ndb = get_async_kb_ndb_client(zone, kbid, user_token=auth._config.token)
+    kb = AsyncNucliaKB()
+
+    levels = []
+    # A single subscription serves the waits of all files
+    async with NotificationWaiter(async_ndb, logger=lambda msg: None) as notifications:
+        for concurrency in settings.benchmark_load_concurrency:
+            # Every level gets to have as many files in flight as its concurrency
+            documents = max(settings.benchmark_load_documents, concurrency)
+            level = await ingest_concurrently(kb, async_ndb, notifications, concurrency, documents)
+            logger(
+                f"concurrency={concurrency}: {level.files_per_second:.3f} files/s,"
+                f" {level.paragraphs_per_second:.3f} paragraphs/s, {level.quantiles()}"
+            )
+            levels.append(level)
+
+    with Path(f"{benchmark_env}__{benchmark_cluster}__load.json").open("w") as f:
+        json.dump({str(level.concurrency): level.to_json() for level in levels}, f)
+
+    for level in levels:
+        push_timings_to_prometheus(
+            timings={},
+            job_name="daily_benchmark",
+            instance=f"{GHA_RUN_ID}",
+            benchmark_type="ingestion_load",
+            cluster=benchmark_cluster,
+            extra_labels={"concurrency": str(level.concurrency)},
+            grouping_key={
+                "benchmark_type": "ingestion_load",
+                "cluster": benchmark_cluster,
+                "concurrency": str(level.concurrency),
+            },
+            quantiles=level.quantiles(),
+            throughput={"files": level.files_per_second, "paragraphs": level.paragraphs_per_second},
+        )
+
+    await delete_test_kb(regional_api_config, kbid, kb_slug, logger)
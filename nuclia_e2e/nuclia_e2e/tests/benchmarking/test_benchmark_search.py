@@ -0,0 +1,156 @@
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia.data import get_auth
+from nuclia.lib.kb import AsyncNucliaDBClient
+from nuclia.sdk.kb import AsyncNucliaKB
+from nuclia_e2e.benchmark import LatencySamples
+from nuclia_e2e.benchmark import push_timings_to_prometheus
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.settings import settings
+from nuclia_e2e.tests.test_kb_features import FINANCIAL_EXPORT_SEMANTIC_MODEL
+from nuclia_e2e.tests.test_kb_features import run_test_import_kb
+from nuclia_e2e.utils import create_test_kb
+from nuclia_e2e.utils import delete_kb_if_exists
+from nuclia_e2e.utils import delete_test_kb
+from nuclia_e2e.utils import get_async_kb_ndb_client
+from nuclia_e2e.utils import wait_for
+from pathlib import Path
+from time import monotonic
+from typing import Any
+
+import asyncio
+import json
+import pytest
+
+# About the resources of the financial export (disney, hp and vaccines)
+SEARCH_QUERIES = [
+    "Disney earnings",
+    "HP printers and PCs sales",
+    "vaccine approval",
+    "streaming subscribers growth",
+    "quarterly revenue forecast",
+]
+FIND_FEATURES = [
+    ["keyword"],
+    ["semantic"],
+    ["keyword", "semantic"],
+    ["keyword", "semantic", "relations"],
+]
+# Asks are much slower and more expensive, so only the usual combinations
+ASK_FEATURES = [
+    ["keyword", "semantic"],
+    ["keyword", "semantic", "relations"],
+]
+
+
+async def measure(
+    call: Callable[[str], Awaitable[Any]], rounds: int, concurrency: int, logger: Callable[[str], None]
+) -> LatencySamples:
+    """Time `rounds` calls for each of `SEARCH_QUERIES`, `concurrency` of them at a time.
+
+    Calls are not retried, failed ones are counted as errors and left out of the latencies.
+    """
+    samples = LatencySamples()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(query: str) -> None:
+        async with semaphore:
+            start = monotonic()
+            try:
+                await call(query)
+            except Exception as exc:
+                if not samples.errors:
+                    logger(f"First error of the benchmarked calls: {exc!r}")
+                samples.errors += 1
+                return
+            samples.latencies.append(monotonic() - start)
+
+    await asyncio.gather(*(timed(query) for _ in range(rounds) for query in SEARCH_QUERIES))
+    return samples
+
+
+async def wait_until_searchable(kb: AsyncNucliaKB, ndb: AsyncNucliaDBClient, logger: Callable[[str], None]):
+    async def imported_resources_are_indexed() -> tuple[bool, Any]:
+        result = await kb.search.find(ndb=ndb, features=["keyword"], reranker="noop", query="Disney")
+        return len(result.resources) > 0, None
+
+    success, _ = await wait_for(
+        imported_resources_are_indexed,
+        max_wait=120,
+        schedule=ExponentialJitter(initial=1, max_interval=10),
+        logger=logger,
+    )
+    assert success, "Imported resources not indexed in time"
+
+
+@pytest.mark.skipif(settings.benchmark_search != "1", reason="Search benchmark not enabled")
+@pytest.mark.asyncio_cooperative
+async def test_benchmark_search(request: pytest.FixtureRequest, regional_api_config):
+    """
+    Fire a fixed set of queries against a KB with the financial export, many times at a fixed concurrency,
+    and record the latency distribution of find and ask by combination of features
+    """
+    benchmark_env = regional_api_config.global_config.name
+    benchmark_cluster = regional_api_config.name
+
+    def logger(msg):
+        print(f"{request.node.name} ::: {msg}")
+
+    zone = regional_api_config.zone_slug
+    auth = get_auth()
+    kb_slug = f"{regional_api_config.test_kb_slug}-benchmark-search"
+    await delete_kb_if_exists(regional_api_config, kb_slug)
+    kbid = await create_test_kb(
+        regional_api_config, kb_slug, logger, semantic_model=FINANCIAL_EXPORT_SEMANTIC_MODEL
+    )
+    async_ndb = get_async_kb_ndb_client(zone, kbid, user_token=auth._config.token)
+    kb = AsyncNucliaKB()
+
+    await run_test_import_kb(regional_api_config, async_ndb, logger)
+    await wait_until_searchable(kb, async_ndb, logger)
+    # Retries would hide failures and add to the latencies
+    benchmarked_ndb = get_async_kb_ndb_client(zone, kbid, user_token=auth._config.token, retried=False)
+
+    concurrency = settings.benchmark_search_concurrency
+    results: dict[str, LatencySamples] = {}
+    for features in FIND_FEATURES:
+
+        async def find(query: str, features: list[str] = features) -> None:
+            await kb.search.find(ndb=benchmarked_ndb, features=features, query=query)
+
+        step = f"find:{'+'.join(features)}"
+        results[step] = await measure(find, settings.benchmark_find_rounds, concurrency, logger)
+        logger(f"{step}: {results[step].to_json()}")
+
+    for features in ASK_FEATURES:
+
+        async def ask(query: str, features: list[str] = features) -> None:
+            await kb.search.ask(ndb=benchmarked_ndb, features=features, query=query)
+
+        step = f"ask:{'+'.join(features)}"
+        results[step] = await measure(ask, settings.benchmark_ask_rounds, concurrency, logger)
+        logger(f"{step}: {results[step].to_json()}")
+
+    with Path(f"{benchmark_env}__{benchmark_cluster}__search.json").open("w") as f:
+        json.dump(
+            {
+                "concurrency": concurrency,
+                "queries": len(SEARCH_QUERIES),
+                "steps": {step: samples.to_json() for step, samples in results.items()},
+            },
+            f,
+        )
+
+    push_timings_to_prometheus(
+        timings={},
+        job_name="daily_benchmark",
+        instance=f"{settings.gha_run_id}",
+        benchmark_type="search",
+        cluster=benchmark_cluster,
+        extra_labels={"concurrency": str(concurrency)},
+        grouping_key={"benchmark_type": "search", "cluster": benchmark_cluster},
+        quantiles={step: samples.quantiles() for step, samples in results.items()},
+        histograms={step: samples.latencies for step, samples in results.items()},
+    )
+
+    await delete_test_kb(regional_api_config, kbid, kb_slug, logger)
@@ -0,0 +1,171 @@
+from collections.abc import Awaitable
+from collections.abc import Callable
+from nuclia.data import get_auth
+from nuclia.lib.kb import AsyncNucliaDBClient
+from nuclia.lib.nua import AsyncNuaClient
+from nuclia.lib.nua import CHAT_PREDICT
+from nuclia.lib.nua_responses import ChatModel
+from nuclia.lib.nua_responses import UserPrompt
+from nuclia_e2e.benchmark import push_timings_to_prometheus
+from nuclia_e2e.benchmark import StreamSamples
+from nuclia_e2e.benchmark import StreamTiming
+from nuclia_e2e.models import ALL_LLMS
+from nuclia_e2e.models import model_zone_check
+from nuclia_e2e.settings import settings
+from nuclia_e2e.tests.conftest import ZoneConfig
+from nuclia_e2e.utils import get_async_kb_ndb_client
+from nuclia_models.predict.generative_responses import GenerativeChunk
+from nucliadb_models.search import AskRequest
+from nucliadb_models.search import AskResponseItem
+from nucliadb_models.search import ChatOptions
+from pathlib import Path
+from time import monotonic
+
+import asyncio
+import json
+import pytest
+
+# Asked to the permanent KB of the zone
+ASK_QUESTION = "how to cook an omelette?"
+GENERATE_PROMPT = "Which is the capital of Catalonia? Answer with a short paragraph about it."
+
+# Models streaming at the same time, by event loop. Timings are measured under as little load from the
+# benchmark itself as the task timeout allows.
+_STREAM_SLOTS: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+async def time_ask_stream(ndb: AsyncNucliaDBClient, model: str) -> StreamTiming:
+    request = AskRequest(
+        query=ASK_QUESTION,
+        features=[ChatOptions.KEYWORD, ChatOptions.SEMANTIC],
+        generative_model=model,
+    )
+    ttft = None
+    output_tokens = None
+    start = monotonic()
+    # Returns once the response headers arrive, without reading the body
+    response = await ndb.ask(request, timeout=300)
+    ttfb = monotonic() - start
+    try:
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            item = AskResponseItem.model_validate_json(line).item
+            if item.type == "answer" and ttft is None:
+                ttft = monotonic() - start
+            elif item.type == "metadata" and item.tokens is not None:
+                output_tokens = item.tokens.output
+            elif item.type == "error":
+                raise RuntimeError(item.error)
+    finally:
+        await response.aclose()
+    return StreamTiming(ttfb, ttft, monotonic() - start, output_tokens)
+
+
+async def time_generate_stream(nc: AsyncNuaClient, model: str) -> StreamTiming:
+    body = ChatModel(
+        question="",
+        retrieval=False,
+        user_id="nuclia-e2e benchmark",
+        user_prompt=UserPrompt(prompt=GENERATE_PROMPT),
+    )
+    ttft = None
+    output_tokens = None
+    start = monotonic()
+    # `AsyncNuaClient.generate_stream` doesn't tell when the response started
+    async with nc.stream_client.stream(
+        "POST", f"{nc.url}{CHAT_PREDICT}", params={"model": model}, json=body.model_dump(), timeout=300
+    ) as response:
+        ttfb = monotonic() - start
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            chunk = GenerativeChunk.model_validate_json(line).chunk
+            if chunk.type == "text" and ttft is None:
+                ttft = monotonic() - start
+            elif chunk.type == "meta":
+                output_tokens = chunk.output_tokens
+    return StreamTiming(ttfb, ttft, monotonic() - start, output_tokens)
+
+
+async def sample_streams(
+    stream: Callable[[], Awaitable[StreamTiming]], rounds: int, logger: Callable[[str], None]
+) -> StreamSamples:
+    """Time `rounds` streams one after the other, without retrying the failed ones."""
+    samples = StreamSamples()
+    for _ in range(rounds):
+        try:
+            samples.timings.append(await stream())
+        except Exception as exc:
+            logger(f"Stream failed: {exc!r}")
+            samples.errors += 1
+    return samples
+
+
+@pytest.mark.skipif(settings.benchmark_streaming != "1", reason="Streaming benchmark not enabled")
+@pytest.mark.asyncio_cooperative
+@pytest.mark.parametrize("model", ALL_LLMS)
+async def test_benchmark_streaming(
+    request: pytest.FixtureRequest,
+    regional_api_config: ZoneConfig,
+    nua_client: AsyncNuaClient,
+    kb_id: str,
+    model: str,
+):
+    """
+    Time to first byte, time to first answer token, total time and output tokens per second of streamed
+    asks (on the permanent KB) and NUA generations, for each model available in the zone
+    """
+    model_zone_check(model, regional_api_config.name)
+    assert regional_api_config.global_config is not None
+    benchmark_env = regional_api_config.global_config.name
+    benchmark_cluster = regional_api_config.name
+
+    def logger(msg):
+        print(f"{request.node.name} ::: {msg}")
+
+    auth = get_auth()
+    # Retries would hide failed streams and add to their timings
+    async_ndb = get_async_kb_ndb_client(
+        regional_api_config.zone_slug, kb_id, user_token=auth._config.token, retried=False
+    )
+    rounds = settings.benchmark_streaming_rounds
+    slots = _STREAM_SLOTS.setdefault(
+        asyncio.get_running_loop(), asyncio.Semaphore(settings.benchmark_streaming_concurrency)
+    )
+    async with slots:
+        results = {
+            "ask": await sample_streams(lambda: time_ask_stream(async_ndb, model), rounds, logger),
+            "generate": await sample_streams(lambda: time_generate_stream(nua_client, model), rounds, logger),
+        }
+    for endpoint, samples in results.items():
+        logger(f"{endpoint}: {samples.to_json()}")
+
+    with Path(f"{benchmark_env}__{benchmark_cluster}__{model}__streaming.json").open("w") as f:
+        json.dump({endpoint: samples.to_json() for endpoint, samples in results.items()}, f)
+
+    medians = {endpoint: samples.medians() for endpoint, samples in results.items()}
+    push_timings_to_prometheus(
+        timings={},
+        job_name="daily_benchmark",
+        instance=f"{settings.gha_run_id}",
+        benchmark_type="streaming",
+        cluster=benchmark_cluster,
+        extra_labels={"model": model},
+        grouping_key={"benchmark_type": "streaming", "cluster": benchmark_cluster, "model": model},
+        quantiles={
+            f"{endpoint}:{metric}": {"p50": value}
+            for endpoint, endpoint_medians in medians.items()
+            for metric, value in endpoint_medians.items()
+            if metric != "tokens_per_second"
+        },
+        throughput={
+            f"{endpoint}_tokens": endpoint_medians["tokens_per_second"]
+            for endpoint, endpoint_medians in medians.items()
+            if "tokens_per_second" in endpoint_medians
+        },
+    )
+    assert any(samples.timings for samples in results.values()), "All streams failed"
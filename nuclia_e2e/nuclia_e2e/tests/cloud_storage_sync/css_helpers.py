@@ -1,11 +1,15 @@
 """Helpers for interacting with the Cloud Storage Sync (CSS) service."""
 
+from nuclia_e2e.jsoncodec import loads
+from nuclia_e2e.polling import ExponentialJitter
+
 import aiohttp
 import logging
 
 logger = logging.getLogger(__name__)
 
-JOB_POLL_INTERVAL = 5  # seconds between job status checks
+# Sync jobs usually take tens of seconds, start checking soon and back off up to 15s between checks
+JOB_POLL_SCHEDULE = ExponentialJitter(initial=1, max_interval=15)
 JOB_POLL_TIMEOUT = 300  # max seconds to wait for a sync job to complete
 
 
@@ -19,7 +23,7 @@ async def list_sync_configs(
     url = f"{zone_url}/api/v1/kb/{kb_id}/sync_configs"
     resp = await session.get(url, headers=auth_headers)
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data.get("items", data) if isinstance(data, dict) else data
 
 
@@ -74,7 +78,7 @@ async def create_sync_config(
         json=payload,
     )
     resp.raise_for_status()
-    return await resp.json()
+    return await resp.json(loads=loads)
 
 
 async def delete_sync_config(
@@ -102,7 +106,7 @@ async def trigger_sync(
     url = f"{zone_url}/api/v1/kb/{kb_id}/sync_config/{config_id}/sync"
     resp = await session.post(url, headers=auth_headers)
     resp.raise_for_status()
-    return await resp.json()
+    return await resp.json(loads=loads)
 
 
 async def get_latest_job(
@@ -116,7 +120,7 @@ async def get_latest_job(
     url = f"{zone_url}/api/v1/kb/{kb_id}/sync_config/{config_id}/jobs"
     resp = await session.get(url, headers=auth_headers, params={"limit": "1"})
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     items = data.get("items", [])
     return items[0] if items else None
 
@@ -139,7 +143,7 @@ async def get_job_logs(
             params["cursor"] = str(cursor)
         resp = await session.get(url, headers=auth_headers, params=params)
         resp.raise_for_status()
-        data = await resp.json()
+        data = await resp.json(loads=loads)
         logs.extend(data.get("items", []))
         cursor = data.get("next_cursor")
         if cursor is None:
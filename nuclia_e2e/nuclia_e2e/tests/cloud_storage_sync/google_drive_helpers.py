@@ -1,10 +1,11 @@
 """Helpers for interacting with the Google Drive API."""
 
+from nuclia_e2e.jsoncodec import dumps
+from nuclia_e2e.jsoncodec import loads
 from nuclia_e2e.settings import settings
 from pathlib import Path
 
 import aiohttp
-import json
 
 
 async def refresh_token(session: aiohttp.ClientSession) -> str:
@@ -19,7 +20,7 @@ async def refresh_token(session: aiohttp.ClientSession) -> str:
         },
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["access_token"]
 
 
@@ -43,7 +44,7 @@ async def create_folder(
         },
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["id"]
 
 
@@ -60,7 +61,7 @@ async def create_file(
     body = (
         f"--{boundary}\r\n"
         f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
-        f"{json.dumps(metadata)}\r\n"
+        f"{dumps(metadata)}\r\n"
         f"--{boundary}\r\n"
         f"Content-Type: text/plain\r\n\r\n"
         f"{content}\r\n"
@@ -75,7 +76,7 @@ async def create_file(
         data=body.encode(),
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["id"]
 
 
@@ -223,7 +224,7 @@ async def list_files_in_folder(
             params=params,
         )
         resp.raise_for_status()
-        data = await resp.json()
+        data = await resp.json(loads=loads)
         for f in data.get("files", []):
             if f["mimeType"] == "application/vnd.google-apps.folder":
                 sub_files = await list_files_in_folder(session, access_token, f["id"])
@@ -1,5 +1,7 @@
 """Helpers for interacting with NucliaDB resources."""
 
+from nuclia_e2e.jsoncodec import loads
+
 import aiohttp
 
 
@@ -20,7 +22,7 @@ async def get_resource_by_slug(
     if resp.status == 404:
         return None
     resp.raise_for_status()
-    return await resp.json()
+    return await resp.json(loads=loads)
 
 
 async def delete_resource_by_slug(
@@ -1,5 +1,6 @@
 """Helpers for interacting with OneDrive via the Microsoft Graph API."""
 
+from nuclia_e2e.jsoncodec import loads
 from nuclia_e2e.settings import settings
 from pathlib import Path
 
@@ -39,7 +40,7 @@ async def refresh_token(session: aiohttp.ClientSession) -> str:
         },
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["access_token"]
 
 
@@ -50,7 +51,7 @@ async def get_root_item_id(session: aiohttp.ClientSession, access_token: str) ->
         headers={"Authorization": f"Bearer {access_token}"},
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["id"]
 
 
@@ -74,7 +75,7 @@ async def create_folder(
         },
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["id"]
 
 
@@ -95,7 +96,7 @@ async def create_file(
         data=content.encode(),
     )
     resp.raise_for_status()
-    data = await resp.json()
+    data = await resp.json(loads=loads)
     return data["id"]
 
 
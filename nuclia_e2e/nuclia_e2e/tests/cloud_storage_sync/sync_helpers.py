@@ -1,5 +1,6 @@
 """Shared helpers for cloud storage sync tests"""
 
+from nuclia_e2e.polling import Learned
 from nuclia_e2e.tests.cloud_storage_sync import css_helpers
 from nuclia_e2e.utils import wait_for
 
@@ -21,7 +22,7 @@ async def run_sync_and_wait(
     job_id = job["id"]
     logger.info("Triggered sync job: %s", job_id)
 
-    async def completed():
+    async def sync_job_completed():
         latest = await css_helpers.get_latest_job(session, zone_url, auth_headers, kb_id, config_id)
         if latest and latest["id"] == job_id:
             status = latest["status"]
@@ -31,9 +32,9 @@ async def run_sync_and_wait(
         return False, None
 
     success, _ = await wait_for(
-        completed,
+        sync_job_completed,
         max_wait=css_helpers.JOB_POLL_TIMEOUT,
-        interval=css_helpers.JOB_POLL_INTERVAL,
+        schedule=Learned("sync_job_completed", fallback=css_helpers.JOB_POLL_SCHEDULE),
     )
     assert success, f"Sync job {job_id} did not complete within {css_helpers.JOB_POLL_TIMEOUT}s"
     return job_id
@@ -1,14 +1,13 @@
 # On the SDK, the httpx client is instantiated in a lot of places, sometimes very deeply nested.
-# With this we can increment the timeout for all requests to minimize noise caused specially by
-# ReadTimeout and ConnectTimeout, related probably to where the tests run on GHA.
+# With this all of them get the timeouts of each kind of request, the connection limits and the transports
+# from `nuclia_e2e.transport`, to minimize noise caused specially by ReadTimeout and ConnectTimeout, related
+# probably to where the tests run on GHA.
 #
-# This patch needs to be executed first
+# This needs to be executed first
 # fmt: off
-from nuclia_e2e.tests.patch_httpx import patch_httpx; patch_httpx()  # noqa: I001,E702
+from nuclia_e2e.transport import TRANSPORT_FACTORY; TRANSPORT_FACTORY.install()  # noqa: I001,E702
 # fmt: on
 from collections.abc import AsyncIterator  # noqa: E402
-from collections.abc import Generator  # noqa: E402
-from copy import deepcopy  # noqa: E402
 from datetime import datetime  # noqa: E402
 from datetime import timedelta  # noqa: E402
 from email.header import decode_header  # noqa: E402
@@ -20,16 +19,48 @@ from nuclia.data import get_async_auth  # noqa: E402
 from nuclia.data import get_config  # noqa: E402
 from nuclia.lib.nua import AsyncNuaClient  # noqa: E402
 from nuclia.sdk.auth import AsyncNucliaAuth  # noqa: E402
+from nuclia.urls import get_global_base  # noqa: E402
+from nuclia.urls import get_regional_base  # noqa: E402
+from nuclia_e2e.clients import CLIENT_POOL  # noqa: E402
+from nuclia_e2e.clients import ClientPool  # noqa: E402
+from nuclia_e2e.clients import connection_report  # noqa: E402
+from nuclia_e2e.clients import CONNECTION_STATS  # noqa: E402
 from nuclia_e2e.data import TEST_ACCOUNT_SLUG  # noqa: E402
+from nuclia_e2e.history import BenchmarkStore  # noqa: E402
+from nuclia_e2e.jsoncodec import dumps  # noqa: E402
+from nuclia_e2e.jsoncodec import loads  # noqa: E402
+from nuclia_e2e.polling import ExponentialJitter  # noqa: E402
+from nuclia_e2e.polling import POLL_HISTORY  # noqa: E402
+from nuclia_e2e.polling import poll_report  # noqa: E402
+from nuclia_e2e.preflight import check_zone  # noqa: E402
+from nuclia_e2e.preflight import preflight_report  # noqa: E402
+from nuclia_e2e.preflight import ZONE_HEALTH  # noqa: E402
+from nuclia_e2e.preflight import ZoneHealth  # noqa: E402
+from nuclia_e2e.prewarm import HostPrewarm  # noqa: E402
+from nuclia_e2e.prewarm import prewarm_zones  # noqa: E402
+from nuclia_e2e.resilience import circuit_breaker_report  # noqa: E402
+from nuclia_e2e.resilience import hedge_report  # noqa: E402
+from nuclia_e2e.resilience import outcome_report  # noqa: E402
+from nuclia_e2e.resilience import Retriable  # noqa: E402
+from nuclia_e2e.resilience import retry_budget_report  # noqa: E402
+from nuclia_e2e.resilience import RetryPolicy  # noqa: E402
+from nuclia_e2e.resilience import with_policy  # noqa: E402
 from nuclia_e2e.settings import settings  # noqa: E402
+from nuclia_e2e.slug_index import KB_INDEX  # noqa: E402
+from nuclia_e2e.slug_index import slug_index_report  # noqa: E402
+from nuclia_e2e.telemetry import attribute_to_tests  # noqa: E402
+from nuclia_e2e.telemetry import RUN_TELEMETRY  # noqa: E402
+from nuclia_e2e.temp_keys import temp_key_report  # noqa: E402
+from nuclia_e2e.temp_keys import TEMP_KEYS  # noqa: E402
+from nuclia_e2e.temp_keys import TempKeyProvider  # noqa: E402
 from nuclia_e2e.tests.utils import _tasks_to_delete  # noqa: E402
 from nuclia_e2e.tests.utils import clean_ask_test_tasks  # noqa: E402
 from nuclia_e2e.utils import get_async_kb_ndb_client  # noqa: E402
-from nuclia_e2e.utils import Retriable  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import IO  # noqa: E402
 
 import aiohttp  # noqa: E402
 import asyncio  # noqa: E402
-import backoff  # noqa: E402
 import dataclasses  # noqa: E402
 import email  # noqa: E402
 import imaplib  # noqa: E402
@@ -42,13 +73,14 @@ import re  # noqa: E402
 import string  # noqa: E402
 import sys  # noqa: E402
 import tempfile  # noqa: E402
+import time  # noqa: E402
 
 TEST_ENV = settings.test_env.lower()
 GRAFANA_URL = settings.grafana_url
 TEMPO_DATASOURCE_ID = "P95F6455D1776E941"  # is the same one on progress and our clusters
 
 
-@dataclasses.dataclass(slots=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class GlobalConfig:
     name: str
     base_domain: str
@@ -62,7 +94,7 @@ class GlobalConfig:
     tempo_datasource_id: str
 
 
-@dataclasses.dataclass(slots=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class ZoneConfig:
     name: str
     zone_slug: str
@@ -245,13 +277,13 @@ class GlobalAPI:
         headers = {"X-STF-VALIDATION": self.recaptcha}
         async with self.session.post(url, json=payload, headers=headers) as response:
             response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=loads)
 
     async def finalize_signup(self, signup_token):
         url = f"{self.base_url}/api/auth/magic?token={signup_token}"
         async with self.session.post(url) as response:
             response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=loads)
 
     def set_access_token(self, access_token):
         self.access_token = access_token
@@ -270,21 +302,22 @@ class GlobalAPI:
             url, json={"slug": slug, "title": slug}, headers=self.auth_headers
         ) as response:
             response.raise_for_status()
-            return (await response.json())["id"]
+            return (await response.json(loads=loads))["id"]
 
     async def get_usage(self, account_id, kb_id, from_date, to_date):
         params = f"from={from_date}&to={to_date}&knowledgebox={kb_id}"
         url = f"{self.base_url}/api/v1/account/{account_id}/usage?{params}"
         async with self.session.get(url, headers=self.root_auth_headers) as response:
             response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=loads)
 
 
 class RegionalAPI:
-    def __init__(self, base_url, access_token, session: aiohttp.ClientSession):
+    def __init__(self, base_url, access_token, session: aiohttp.ClientSession, zone: str | None = None):
         self.base_url = base_url
         self.access_token = access_token
         self.session = session
+        self.zone = zone
 
     @property
     def auth_headers(self):
@@ -295,7 +328,7 @@ class RegionalAPI:
     async def get_kb_sa(self, account: str, kbid: str) -> list[dict[str, str]]:
         url = f"{self.base_url}/api/v1/account/{account}/kb/{kbid}/service_accounts"
         async with self.session.get(url, headers=self.auth_headers) as response:
-            data = await response.json()
+            data = await response.json(loads=loads)
             return [{"id": sa["id"], "title": sa["title"]} for sa in data]
 
     async def create_service_account(
@@ -305,7 +338,7 @@ class RegionalAPI:
         async with self.session.post(
             url, headers=self.auth_headers, json={"title": service_account_name, "role": role}
         ) as response:
-            data = await response.json()
+            data = await response.json(loads=loads)
             return data
 
     async def create_service_account_key(self, account: str, kbid: str, sa_id: str, ttl=60 * 60 * 24) -> str:
@@ -314,7 +347,7 @@ class RegionalAPI:
         async with self.session.post(
             url, headers=self.auth_headers, json={"expires": expires.strftime("%Y-%m-%dT%H:%M:%SZ")}
         ) as response:
-            data = await response.json()
+            data = await response.json(loads=loads)
             return data["token"]
 
     async def create_service_account_temp_key(self, sa_token: str, security_groups: list[str] | None) -> str:
@@ -324,9 +357,16 @@ class RegionalAPI:
         async with self.session.post(
             url, headers={"x-nuclia-serviceaccount": f"Bearer {sa_token}"}, json=payload
         ) as response:
-            data = await response.json()
+            data = await response.json(loads=loads)
             return data["token"]
 
+    async def is_service_account_key_accepted(self, kbid: str, sa_token: str) -> bool:
+        url = f"{self.base_url}/api/v1/kb/{kbid}"
+        async with self.session.get(
+            url, headers={"x-nuclia-serviceaccount": f"Bearer {sa_token}"}
+        ) as response:
+            return response.status == 200
+
     async def delete_service_account_by_name(
         self, account: str, kbid: str, service_account_name: str
     ) -> str | None:
@@ -354,14 +394,16 @@ class RegionalAPI:
         url = f"{self.base_url}/api/v1/kb/{kb_id}/configuration"
         async with self.session.get(url, headers=self.auth_headers) as response:
             response.raise_for_status()
-            return await response.json()
-
-    @backoff.on_exception(
-        backoff.expo,
-        aiohttp.ClientResponseError,
-        max_tries=6,
-        max_time=120,
-        giveup=lambda exc: not (isinstance(exc, aiohttp.ClientResponseError) and exc.status == 429),
+            return await response.json(loads=loads)
+
+    @with_policy(
+        RetryPolicy(
+            "rao_creation",
+            retry_on=lambda exc: isinstance(exc, aiohttp.ClientResponseError) and exc.status == 429,
+            max_attempts=6,
+            max_delay=120,
+            schedule=ExponentialJitter(initial=1, max_interval=60),
+        )
     )
     async def create_rao(self, account_id: str, slug: str, mode: str = "agent_no_memory") -> dict:
         url = f"{self.base_url}/api/v1/account/{account_id}/kbs"
@@ -375,7 +417,7 @@ class RegionalAPI:
             headers=self.auth_headers,
         ) as response:
             response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=loads)
 
     async def rao(
         self,
@@ -390,7 +432,78 @@ class RegionalAPI:
             method, url, json=payload, headers=self.auth_headers, params=params
         ) as response:
             response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=loads)
+
+
+# When the session started (conftest is imported first), so only the benchmark results written by it are
+# recorded to the history
+_SESSION_START = time.time()
+
+
+def pytest_sessionstart(session: pytest.Session):
+    if settings.poll_history_path:
+        POLL_HISTORY.load(Path(settings.poll_history_path))
+
+
+def pytest_sessionfinish(session: pytest.Session, exitstatus: int):
+    NUCLIA_SESSION.close()
+    if settings.poll_history_path:
+        POLL_HISTORY.dump(Path(settings.poll_history_path))
+    if session.config.option.collectonly:
+        return
+    RUN_TELEMETRY.sections["connections"] = {
+        "http2": settings.http2,
+        "hosts": connection_report(),
+    }
+    if TEMP_KEYS.stats.minted:
+        RUN_TELEMETRY.sections["temp_keys"] = TEMP_KEYS.stats.to_json()
+        for stat, value in TEMP_KEYS.stats.to_json().items():
+            if stat.startswith(("mint_", "propagation_")):
+                metric, _, quantile = stat.rpartition("_")
+                RUN_TELEMETRY.set_gauge(
+                    f"e2e_temp_key_{metric}_seconds",
+                    f"Seconds to {metric} temporary service account keys",
+                    value,
+                    quantile=quantile,
+                )
+    if settings.benchmark_history_path:
+        record_benchmark_history(Path(settings.benchmark_history_path))
+    if settings.run_report_path:
+        RUN_TELEMETRY.write(Path(settings.run_report_path))
+    if settings.run_report_push:
+        try:
+            RUN_TELEMETRY.push(settings.prometheus_pushgateway, job="e2e_run", instance=settings.gha_run_id)
+        except Exception as exc:
+            print(f"Could not push the run report to {settings.prometheus_pushgateway}: {exc!r}")
+
+
+def record_benchmark_history(path: Path):
+    with BenchmarkStore(path) as store:
+        # Benchmarks write their results to the working directory
+        recorded = store.record_results(
+            Path.cwd(), settings.gha_run_id, since=_SESSION_START, recursive=False
+        )
+    for env, cluster, benchmark in recorded:
+        print(f"Benchmark {benchmark} results of {env}/{cluster} recorded to {path}")
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus: int, config: pytest.Config):
+    sections = {
+        "wait_for polls": poll_report(),
+        "retries": [*outcome_report(), *retry_budget_report(), *circuit_breaker_report()],
+        f"connections ({'HTTP/2' if settings.http2 else 'HTTP/1.1'})": [
+            f"{host}: {stats}" for host, stats in sorted(CONNECTION_STATS.items())
+        ],
+        "hedged requests": hedge_report(),
+        "slug index": slug_index_report(),
+        "temporary service account keys": temp_key_report(),
+        "preflight": preflight_report(),
+    }
+    for title, report in sections.items():
+        if report:
+            terminalreporter.section(title)
+            for line in report:
+                terminalreporter.write_line(line)
 
 
 @pytest.fixture(autouse=True)
@@ -399,13 +512,61 @@ def set_logger_level():
     logger.setLevel(logging.CRITICAL)
 
 
+@pytest.fixture(scope="session", autouse=True)
+async def client_pool() -> AsyncIterator[ClientPool]:
+    """
+    Close the clients shared by the tests once all of them are done.
+    """
+    yield CLIENT_POOL
+    print(f"Closing pooled clients: {CLIENT_POOL}")
+    await CLIENT_POOL.aclose()
+    await TRANSPORT_FACTORY.aclose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def prewarm_connections(client_pool: ClientPool) -> dict[str, list[HostPrewarm]]:
+    """
+    Open connections to the global API and the regional API of every zone before tests start, so they don't
+    pay the handshakes. Their cost is reported on its own.
+    """
+    if settings.prewarm_connections <= 0:
+        return {}
+    base_domain = TEST_CLUSTER.global_config.base_domain
+    urls_by_zone = {
+        "global": [f"https://{base_domain}", get_global_base(base_domain)],
+        # NUA is served from the regional hosts too
+        **{zone.zone_slug: [get_regional_base(zone.zone_slug, base_domain)] for zone in TEST_CLUSTER.zones},
+    }
+    results = await prewarm_zones(urls_by_zone, settings.prewarm_connections)
+    RUN_TELEMETRY.sections["prewarm"] = {
+        zone: [host.to_json() for host in hosts] for zone, hosts in results.items()
+    }
+    for zone, hosts in results.items():
+        for host in hosts:
+            print(f"Prewarmed {host.url} ({zone}): {host.to_json()}")
+            RUN_TELEMETRY.set_gauge(
+                "e2e_prewarm_handshake_seconds",
+                "Time spent on TCP and TLS handshakes warming up connections at session start",
+                host.handshake,
+                zone=zone,
+                url=host.url,
+            )
+            RUN_TELEMETRY.set_gauge(
+                "e2e_prewarm_dns_seconds",
+                "Time spent resolving host names at session start",
+                host.dns,
+                zone=zone,
+                url=host.url,
+            )
+    return results
+
+
 @pytest.fixture
-async def aiohttp_session():
+async def aiohttp_session() -> aiohttp.ClientSession:
     """
-    Create a shared aiohttp session for the entire test session.
+    Provide the aiohttp session shared by the entire test session.
     """
-    async with aiohttp.ClientSession() as session:
-        yield session
+    return CLIENT_POOL.aiohttp_session()
 
 
 @pytest.fixture
@@ -430,39 +591,183 @@ async def regional_api(aiohttp_session, global_api_config, regional_api_config):
         nuclia.REGIONAL.format(region=regional_api_config.zone_slug),
         global_api_config.permanent_account_owner_pat_token,
         aiohttp_session,
+        zone=regional_api_config.zone_slug,
     )
 
 
+class NucliaSession:
+    """
+    SDK configuration and authentication shared by all tests. The URLs and config file are set up once per
+    session and the user token is validated once, instead of for every test, and each zone gets a single
+    immutable `ZoneConfig`.
+    """
+
+    def __init__(self, cluster: ClusterConfig):
+        self.cluster = cluster
+        self._config_file: IO[bytes] | None = None
+        self._zones: dict[str, ZoneConfig] = {}
+        self._locks: dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+
+    def global_config(self) -> GlobalConfig:
+        global_config = self.cluster.global_config
+        if self._config_file is None:
+            nuclia.BASE_DOMAIN = global_config.base_domain
+            # regenerate all urls based on the new base domain
+            nuclia.CLOUD_ID = nuclia.BASE_DOMAIN
+            nuclia.REGIONAL = nuclia._regional_template(nuclia.BASE_DOMAIN)
+            nuclia.OAUTH_BASE = nuclia.get_oauth_base(nuclia.BASE_DOMAIN)
+            nuclia.GLOBAL_BASE = nuclia.get_global_base(nuclia.BASE_DOMAIN)
+            os.environ["TESTING"] = "True"
+            self._config_file = tempfile.NamedTemporaryFile()  # noqa: SIM115
+            self._config_file.write(b"{}")
+            self._config_file.flush()
+            set_config_file(self._config_file.name)
+        return global_config
+
+    async def zone_config(self, zone: ZoneConfig) -> ZoneConfig:
+        global_config = self.global_config()
+        if zone.name not in self._zones:
+            async with self._locks.setdefault(asyncio.get_running_loop(), asyncio.Lock()):
+                if not self._zones:
+                    await get_async_auth().set_user_token(global_config.permanent_account_owner_pat_token)
+                    get_config().set_default_account(global_config.permanent_account_slug)
+                # Store a reference for convenience
+                self._zones.setdefault(zone.name, dataclasses.replace(zone, global_config=global_config))
+        # The SDK config is shared by all tests, so with many zones the default one is just the last set.
+        # Tests pass the zone explicitly, this only avoids rewriting the config file when it didn't change.
+        config = get_config()
+        if config.get_default_zone() != zone.zone_slug:
+            config.set_default_zone(zone.zone_slug)
+        return self._zones[zone.name]
+
+    def close(self) -> None:
+        if self._config_file is not None:
+            self._config_file.close()
+            self._config_file = None
+            reset_config_file()
+
+
+NUCLIA_SESSION = NucliaSession(TEST_CLUSTER)
+
+
 @pytest.fixture
-def global_api_config() -> Generator[GlobalConfig, None, None]:
-    global_config = TEST_CLUSTER.global_config
-    nuclia.BASE_DOMAIN = global_config.base_domain
-    # regenerate all urls based on the new base domain
-    nuclia.CLOUD_ID = nuclia.BASE_DOMAIN
-    nuclia.REGIONAL = nuclia._regional_template(nuclia.BASE_DOMAIN)
-    nuclia.OAUTH_BASE = nuclia.get_oauth_base(nuclia.BASE_DOMAIN)
-    nuclia.GLOBAL_BASE = nuclia.get_global_base(nuclia.BASE_DOMAIN)
-    os.environ["TESTING"] = "True"
-    with tempfile.NamedTemporaryFile() as temp_file:
-        temp_file.write(b"{}")
-        temp_file.flush()
-        set_config_file(temp_file.name)
-        yield global_config
-        reset_config_file()
+def global_api_config() -> GlobalConfig:
+    return NUCLIA_SESSION.global_config()
 
 
-@pytest.fixture(params=[pytest.param(zone, id=zone.name) for zone in TEST_CLUSTER.zones])
-async def regional_api_config(request: pytest.FixtureRequest, global_api_config: GlobalConfig) -> ZoneConfig:
-    zone_config: ZoneConfig = deepcopy(request.param)
-    auth = get_async_auth()
-    config = get_config()
-    await auth.set_user_token(global_api_config.permanent_account_owner_pat_token)
-    config.set_default_account(global_api_config.permanent_account_slug)
-    config.set_default_zone(zone_config.zone_slug)
-    # Store a reference for convenience
-    zone_config.global_config = global_api_config
+# Tests of each zone, to skip or fail if the zone fails the preflight
+_PREFLIGHT_ITEMS: dict[str, list[pytest.Item]] = {}
+
 
-    return zone_config
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]):
+    # Attribute the retries and waits of each test to it in the run report
+    attribute_to_tests(items)
+    _PREFLIGHT_ITEMS.clear()
+    if settings.preflight == "off" or config.option.collectonly:
+        return
+    for item in items:
+        callspec = getattr(item, "callspec", None)
+        zone = callspec.params.get("regional_api_config") if callspec is not None else None
+        if zone is not None:
+            _PREFLIGHT_ITEMS.setdefault(zone.name, []).append(item)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session: pytest.Session):
+    """
+    Probe the zones of the collected tests before any of them starts, and mark the tests of unhealthy zones
+    to be skipped or failed right away. It must happen before pytest-asyncio-cooperative turns tests into
+    tasks: a skip or failure raised from a fixture is not reported as such.
+    """
+    if not _PREFLIGHT_ITEMS:
+        return
+    zones = [zone for zone in TEST_CLUSTER.zones if zone.name in _PREFLIGHT_ITEMS]
+    results = asyncio.run(preflight(zones))
+    for health in results:
+        ZONE_HEALTH[health.zone] = health
+        print(f"Preflight of {health.zone}: {health.to_json()}")
+        record_preflight(health)
+        if health.healthy:
+            continue
+        reason = f"Zone {health.zone} failed the preflight: {health.reason}"
+        for item in _PREFLIGHT_ITEMS[health.zone]:
+            if settings.preflight == "fail":
+                fail_right_away(item, reason)
+            else:
+                item.add_marker(pytest.mark.skip(reason=reason))
+    RUN_TELEMETRY.sections["preflight"] = {health.zone: health.to_json() for health in results}
+
+
+async def preflight(zones: list[ZoneConfig]) -> list[ZoneHealth]:
+    global_config = NUCLIA_SESSION.global_config()
+
+    def permanent_kbid(zone: ZoneConfig):
+        async def kbid() -> str | None:
+            zone_config = await NUCLIA_SESSION.zone_config(zone)
+            if zone_config.permanent_kb_id:
+                return zone_config.permanent_kb_id
+            return await KB_INDEX.get(
+                zone.zone_slug, global_config.permanent_account_id, zone.permanent_kb_slug
+            )
+
+        return kbid
+
+    try:
+        return await asyncio.gather(
+            *(
+                check_zone(
+                    zone.name,
+                    get_regional_base(zone.zone_slug, global_config.base_domain),
+                    global_config.permanent_account_id,
+                    global_config.permanent_account_owner_pat_token,
+                    zone.permanent_nua_key,
+                    permanent_kbid(zone),
+                )
+                for zone in zones
+            )
+        )
+    finally:
+        # The loop is closed right after, tests get their own clients and connections
+        await CLIENT_POOL.aclose()
+        await TRANSPORT_FACTORY.aclose()
+
+
+def record_preflight(health: ZoneHealth):
+    RUN_TELEMETRY.set_gauge(
+        "e2e_preflight_healthy",
+        "Whether all the key services of a zone answered the preflight probes",
+        float(health.healthy),
+        zone=health.zone,
+    )
+    for probe in health.probes:
+        RUN_TELEMETRY.set_gauge(
+            "e2e_preflight_latency_seconds",
+            "Latency of the preflight probe of each service of a zone",
+            probe.latency,
+            zone=health.zone,
+            service=probe.service,
+        )
+    if settings.benchmark == "1":
+        # Next to the benchmark timings, see generate_summary.py
+        with Path(f"{NUCLIA_SESSION.global_config().name}__{health.zone}__preflight.json").open("w") as f:
+            f.write(dumps(health.to_json()))
+
+
+def fail_right_away(item: pytest.Item, reason: str):
+    """Run `item` as a regular test that fails with `reason`, without setting up its fixtures."""
+
+    def runtest():
+        pytest.fail(reason, pytrace=False)
+
+    item.own_markers = [marker for marker in item.own_markers if marker.name != "asyncio_cooperative"]
+    item.fixturenames = []  # type: ignore[attr-defined]
+    item.runtest = runtest  # type: ignore[method-assign]
+
+
+@pytest.fixture(params=[pytest.param(zone, id=zone.name) for zone in TEST_CLUSTER.zones])
+async def regional_api_config(request: pytest.FixtureRequest) -> ZoneConfig:
+    return await NUCLIA_SESSION.zone_config(request.param)
 
 
 async def resolve_permanent_kb_id(zone_config: ZoneConfig) -> str:
@@ -470,23 +775,16 @@ async def resolve_permanent_kb_id(zone_config: ZoneConfig) -> str:
         return zone_config.permanent_kb_id
     assert zone_config.global_config is not None
 
-    auth = get_async_auth()
     account_id = zone_config.global_config.permanent_account_id
-    try:
-        knowledge_boxes = await auth.kbs(account_id, zone=zone_config.zone_slug)
-    except TypeError:
-        knowledge_boxes = [kb for kb in await auth.kbs(account_id) if kb.region == zone_config.zone_slug]
-
-    kbs = {kb.slug: kb.id for kb in knowledge_boxes if kb.slug is not None}
-    kb_id = kbs.get(zone_config.permanent_kb_slug)
+    kb_id = await KB_INDEX.get(zone_config.zone_slug, account_id, zone_config.permanent_kb_slug)
     if kb_id is None:
+        kbs = await KB_INDEX.fetch(zone_config.zone_slug, account_id)
         available_slugs = ", ".join(sorted(kbs)) or "<none>"
         pytest.fail(
             f"Permanent KB '{zone_config.permanent_kb_slug}' was not found in "
             f"account '{account_id}' for zone '{zone_config.zone_slug}'. "
             f"Available KB slugs: {available_slugs}"
         )
-    zone_config.permanent_kb_id = kb_id
     return kb_id
 
 
@@ -581,6 +879,15 @@ async def cleanup_test_account(global_api: GlobalAPI):
     await global_api.manager.delete_account(TEST_ACCOUNT_SLUG)
 
 
+@pytest.fixture(scope="session")
+async def temp_keys() -> AsyncIterator[TempKeyProvider]:
+    """
+    Temporary service account keys, refreshed in the background until the tests using them are done.
+    """
+    yield TEMP_KEYS
+    await TEMP_KEYS.aclose()
+
+
 @pytest.fixture
 async def clean_kb_sa(
     request: pytest.FixtureRequest, regional_api_config, regional_api: RegionalAPI, kb_id: str
@@ -596,12 +903,15 @@ async def clean_kb_sa(
 
 @pytest.fixture
 async def nua_client(regional_api_config) -> AsyncNuaClient:
-    nc = AsyncNuaClient(
-        region=nuclia.REGIONAL.format(region=regional_api_config.zone_slug),
-        account=regional_api_config.global_config.permanent_account_id,
-        token=regional_api_config.permanent_nua_key,
-    )
-    return Retriable.wrap_async(nc)
+    zone = regional_api_config.zone_slug
+    account = regional_api_config.global_config.permanent_account_id
+    token = regional_api_config.permanent_nua_key
+
+    def build() -> AsyncNuaClient:
+        nc = AsyncNuaClient(region=nuclia.REGIONAL.format(region=zone), account=account, token=token)
+        return Retriable.wrap_async(nc, zone=zone)
+
+    return CLIENT_POOL.get(("nua", zone, account, token), build)
 
 
 @pytest.fixture
@@ -4,6 +4,9 @@ from collections.abc import Callable
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from nuclia.lib.nua import AsyncNuaClient
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.resilience import RetryPolicy
+from nuclia_e2e.resilience import with_policy
 from nuclia_e2e.tests.conftest import GRAFANA_URL
 from nuclia_e2e.tests.conftest import TEST_ENV
 from nuclia_e2e.utils import get_asset_file_path
@@ -185,33 +188,34 @@ async def wait_for_task_completion(
         await asyncio.sleep(20)
 
 
+TASK_OUTPUT_POLICY = RetryPolicy(
+    "task_output",
+    retry_on=(AssertionError,),
+    max_attempts=10,
+    schedule=Fixed(5),
+)
+
+
 async def validate_task_output(client: aiohttp.ClientSession, validation: Callable[[BrokerMessage], None]):
-    max_retries = 10
-    last_retry_exc = None
-    for _ in range(max_retries):
-        try:
-            resp = await client.post("/api/v2/processing/pull", json={"limit": 1})
-            assert resp.status == 200, await resp.text()
-            pull_response = await resp.json()
-            messages = pull_response.get("messages", [])
-            assert len(messages) > 0, "No payload received"
-            assert len(messages) == 1, f"Only one payload expected, got {len(messages)}"
-
-            message = BrokerMessage()
-            message.ParseFromString(base64.b64decode(messages[0]["payload"]))
-            validation(message)
-
-        except AssertionError as exc:
-            last_retry_exc = exc
-            await asyncio.sleep(5)
-            continue
-        else:
-            # No exception on the last retry, we're good!
-            return
-
-    # if we exceeded retries and we're here, last one failed
-    if last_retry_exc is not None:
-        pytest.fail(f"Failed to validate task output ater {max_retries}. Last error was: {last_retry_exc!r}")
+    @with_policy(TASK_OUTPUT_POLICY)
+    async def pull_and_validate():
+        resp = await client.post("/api/v2/processing/pull", json={"limit": 1})
+        assert resp.status == 200, await resp.text()
+        pull_response = await resp.json()
+        messages = pull_response.get("messages", [])
+        assert len(messages) > 0, "No payload received"
+        assert len(messages) == 1, f"Only one payload expected, got {len(messages)}"
+
+        message = BrokerMessage()
+        message.ParseFromString(base64.b64decode(messages[0]["payload"]))
+        validation(message)
+
+    try:
+        await pull_and_validate()
+    except AssertionError as exc:
+        pytest.fail(
+            f"Failed to validate task output ater {TASK_OUTPUT_POLICY.max_attempts}. Last error was: {exc!r}"
+        )
 
 
 LABEL_OPERATION_IDENT = "label-operation-ident-1"
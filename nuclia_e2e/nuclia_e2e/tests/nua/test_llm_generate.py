@@ -19,7 +19,7 @@ async def test_llm_generate(nua_client: AsyncNuaClient, model: str, regional_api
     model_zone_check(model, regional_api_config.name)
     np = AsyncNucliaPredict()
 
-    @make_retry_async(attempts=3, delay=10, exceptions=(AssertionError,))
+    @make_retry_async(attempts=3, delay=10, exceptions=(AssertionError,), zone=regional_api_config.zone_slug)
     async def test_nua_generate():
         generated = await np.generate("Which is the capital of Catalonia?", model=model, nc=nua_client)
         assert "Barcelona" in generated.answer
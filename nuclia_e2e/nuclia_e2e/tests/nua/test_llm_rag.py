@@ -20,7 +20,7 @@ async def test_llm_rag(nua_client: AsyncNuaClient, model: str, regional_api_conf
     model_zone_check(model, regional_api_config.name)
     np = AsyncNucliaPredict()
 
-    @make_retry_async(attempts=3, delay=10, exceptions=(AssertionError,))
+    @make_retry_async(attempts=3, delay=10, exceptions=(AssertionError,), zone=regional_api_config.zone_slug)
     async def retryable_block():
         generated = await np.rag(
             question="Which is the CEO of Nuclia?",
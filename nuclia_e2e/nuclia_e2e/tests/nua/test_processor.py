@@ -1,8 +1,9 @@
 from nuclia.lib.nua import AsyncNuaClient
 from nuclia.sdk.process import AsyncNucliaProcessing
+from nuclia_e2e.polling import Fixed
 from nuclia_e2e.utils import get_asset_file_path
+from nuclia_e2e.utils import wait_for
 
-import asyncio
 import pytest
 
 #
@@ -21,14 +22,13 @@ EXTRA_PROCESSING_TIME_FACTOR = 1.5
 
 
 async def wait_for_scheduling(processing_id: str, client: AsyncNuaClient, timeout: int = 200):
-    count = timeout
-    status = await client.processing_id_status(processing_id)
-    while status.scheduled is False and count > 0:
+    async def processing_is_scheduled() -> tuple[bool, None]:
         status = await client.processing_id_status(processing_id)
-        await asyncio.sleep(1)
-        count -= 1
+        return status.scheduled is not False, None
+
     # don't wait for finishing if has not been scheduled on time
-    return status.scheduled
+    scheduled, _ = await wait_for(processing_is_scheduled, max_wait=timeout, schedule=Fixed(1))
+    return scheduled
 
 
 @pytest.mark.asyncio_cooperative
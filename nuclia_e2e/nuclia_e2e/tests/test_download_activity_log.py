@@ -1,6 +1,7 @@
 from datetime import datetime
 from nuclia.data import get_auth
 from nuclia.sdk.kb import AsyncNucliaKB
+from nuclia_e2e.jsoncodec import loads
 from nuclia_e2e.tests.conftest import EmailUtil
 from nuclia_e2e.tests.conftest import ZoneConfig
 from nuclia_e2e.utils import get_async_kb_ndb_client
@@ -14,7 +15,6 @@ from urllib.parse import urlunparse
 
 import aiohttp
 import asyncio
-import json
 import pytest
 import re
 
@@ -27,7 +27,7 @@ async def fetch_ndjson_async(url: str):
     async with aiohttp.ClientSession() as session, session.get(url) as response:
         data = []
         async for line in response.content:
-            data.append(json.loads(line.decode("utf-8")))
+            data.append(loads(line))
 
         return data
 
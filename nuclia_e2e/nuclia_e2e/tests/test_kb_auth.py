@@ -1,18 +1,25 @@
 from nuclia.lib.kb import AsyncNucliaDBClient
 from nuclia.sdk.kb import AsyncNucliaKB
 from nuclia.sdk.search import AskAnswer
+from nuclia_e2e.temp_keys import TempKeyProvider
 from nuclia_e2e.utils import get_async_kb_ndb_client
 from nucliadb_models.search import AskRequest
 from nucliadb_models.search import ChatOptions
 from nucliadb_models.search import RequestSecurity
 from nucliadb_models.search import RerankerName
 
+import asyncio
 import pytest
 
 
 @pytest.mark.asyncio_cooperative
 async def test_kb_auth(
-    request: pytest.FixtureRequest, regional_api_config, regional_api, clean_kb_sa, kb_id: str
+    request: pytest.FixtureRequest,
+    regional_api_config,
+    regional_api,
+    clean_kb_sa,
+    kb_id: str,
+    temp_keys: TempKeyProvider,
 ):
     """
     Tests the different authorizations we have available to access the nucliadb namespace
@@ -35,6 +42,19 @@ async def test_kb_auth(
 
     async_ndb = get_async_kb_ndb_client(zone, kbid, service_account_token=new_sa_key)
 
+    async def is_accepted(temp_key: str) -> bool:
+        return await regional_api.is_service_account_key_accepted(kbid, temp_key)
+
+    async def get_sa_temp_client(security_groups: list[str] | None) -> AsyncNucliaDBClient:
+        # Temporal keys have a 10 seconds ttl, the provider keeps them fresh
+        temp_key = await temp_keys.get(
+            new_sa_key, security_groups, regional_api.create_service_account_temp_key, probe=is_accepted
+        )
+        return get_async_kb_ndb_client(zone, kbid, service_account_token=temp_key)
+
+    # Mint the temporal keys used below up front, off the critical path of the asks
+    await asyncio.gather(get_sa_temp_client(None), get_sa_temp_client(["apprentices"]))
+
     async def security_groups_test_ask(
         client: AsyncNucliaDBClient, question: str, security_groups: list[str] | None
     ) -> AskAnswer:
@@ -63,9 +83,7 @@ async def test_kb_auth(
     assert answer.status == "success"
 
     # Temporal SA key with no explicit security, should allow the question
-    # Recreating the key and client each time, as it has a 10 seconds ttl
-    new_sa_temp_key = await regional_api.create_service_account_temp_key(new_sa_key, security_groups=None)
-    async_ndb_sa_temp = get_async_kb_ndb_client(zone, kbid, service_account_token=new_sa_temp_key)
+    async_ndb_sa_temp = await get_sa_temp_client(security_groups=None)
     answer = await security_groups_test_ask(async_ndb_sa_temp, secured_question, security_groups=None)
     assert answer.status == "success"
 
@@ -74,10 +92,6 @@ async def test_kb_auth(
     assert answer.status == "no_context"
 
     # Temporal SA key with key security (injected via authorizer), should allow the question
-    # Recreating the key and client each time, as it has a 10 seconds ttl
-    new_sa_temp_key = await regional_api.create_service_account_temp_key(
-        new_sa_key, security_groups=["apprentices"]
-    )
-    async_ndb_sa_temp = get_async_kb_ndb_client(zone, kbid, service_account_token=new_sa_temp_key)
+    async_ndb_sa_temp = await get_sa_temp_client(security_groups=["apprentices"])
     answer = await security_groups_test_ask(async_ndb_sa_temp, secured_question, security_groups=None)
     assert answer.status == "no_context"
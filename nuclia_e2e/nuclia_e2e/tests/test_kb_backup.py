@@ -3,24 +3,26 @@ from nuclia import sdk
 from nuclia.data import get_async_auth
 from nuclia.sdk.kbs import AsyncNucliaKBS
 from nuclia.sdk.search import AsyncNucliaSearch
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.resilience import RetryPolicy
+from nuclia_e2e.resilience import with_policy
 from nuclia_e2e.tests.conftest import ZoneConfig
 from nuclia_e2e.tests.utils import as_default_generative_model_for_kb
+from nuclia_e2e.utils import delete_kb_if_exists
 from nuclia_e2e.utils import get_async_kb_ndb_client
-from nuclia_e2e.utils import get_kbid_from_slug
 from nuclia_e2e.utils import wait_for
 from nuclia_models.accounts.backups import BackupCreate
 from nuclia_models.accounts.backups import BackupResponse
 from nuclia_models.accounts.backups import BackupRestore
 from nucliadb_models.search import CatalogResponse
 
-import backoff
 import pytest
 import uuid
 
 Logger = Callable[[str], None]
 
 
-def is_kb_creation_in_progress(exc: Exception) -> bool:
+def is_kb_creation_in_progress(exc: BaseException) -> bool:
     if not exc.args or not isinstance(exc.args[0], dict):
         return False
     error = exc.args[0]
@@ -29,12 +31,14 @@ def is_kb_creation_in_progress(exc: Exception) -> bool:
     )
 
 
-@backoff.on_exception(
-    backoff.constant,
-    Exception,
-    interval=5,
-    max_time=60,
-    giveup=lambda exc: not is_kb_creation_in_progress(exc),
+@with_policy(
+    RetryPolicy(
+        "kb_restore",
+        retry_on=is_kb_creation_in_progress,
+        max_attempts=13,
+        max_delay=60,
+        schedule=Fixed(5),
+    )
 )
 async def restore_backup_when_creation_slot_is_available(
     backup_id: uuid.UUID,
@@ -78,9 +82,7 @@ async def test_kb_backup(request: pytest.FixtureRequest, regional_api_config: Zo
     new_kb_slug = f"{regional_api_config.test_kb_slug}-test_kb_backup"
 
     # Make sure the kb used for this test is deleted, as the slug is reused:
-    old_kbid = await get_kbid_from_slug(regional_api_config.zone_slug, new_kb_slug)
-    if old_kbid is not None:
-        await AsyncNucliaKBS().delete(zone=regional_api_config.zone_slug, id=old_kbid)
+    await delete_kb_if_exists(regional_api_config, new_kb_slug)
 
     # Restore Backup
     new_kb = await restore_backup_when_creation_slot_is_available(
@@ -8,11 +8,19 @@ from nuclia.data import get_auth
 from nuclia.lib.kb import AsyncNucliaDBClient
 from nuclia.sdk.kb import AsyncNucliaKB
 from nuclia.sdk.kbs import AsyncNucliaKBS
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.polling import Learned
+from nuclia_e2e.resilience import EVENTUAL_CONSISTENCY_POLICY
+from nuclia_e2e.resilience import RetryPolicy
+from nuclia_e2e.resilience import with_policy
+from nuclia_e2e.slug_index import KB_INDEX
 from nuclia_e2e.tests.conftest import GlobalAPI
 from nuclia_e2e.tests.conftest import ZoneConfig
 from nuclia_e2e.tests.utils import has_generated_field
+from nuclia_e2e.tests.utils import KBStatePoller
 from nuclia_e2e.utils import ASSETS_FILE_PATH
 from nuclia_e2e.utils import create_test_kb
+from nuclia_e2e.utils import delete_kb_if_exists
 from nuclia_e2e.utils import get_async_kb_ndb_client
 from nuclia_e2e.utils import get_kbid_from_slug
 from nuclia_e2e.utils import wait_for
@@ -42,14 +50,13 @@ from nucliadb_models.graph.requests import GraphNodesSearchRequest
 from nucliadb_models.graph.requests import GraphRelationsSearchRequest
 from nucliadb_models.graph.requests import GraphSearchRequest
 from nucliadb_models.metadata import ResourceProcessingStatus
+from nucliadb_models.resource import Resource
 from nucliadb_models.search import Image
-from nucliadb_sdk.v2.exceptions import ClientError
 from nucliadb_sdk.v2.exceptions import NotFoundError
 from textwrap import dedent
 from typing import Any
 
 import asyncio
-import backoff
 import base64
 import httpx
 import pytest
@@ -82,7 +89,12 @@ async def run_test_upload_and_process(regional_api_config, ndb: AsyncNucliaDBCli
 
         return condition
 
-    success, _ = await wait_for(resource_is_processed(rid), max_wait=180, interval=10, logger=logger)
+    success, _ = await wait_for(
+        resource_is_processed(rid),
+        max_wait=180,
+        schedule=Learned("resource_is_processed", fallback=ExponentialJitter(initial=2, max_interval=10)),
+        logger=logger,
+    )
     assert success, "File was not processed in time, PROCESSED status not found in resource"
 
     # Wait for resource to be indexed by searching for a resource based on a content that just
@@ -95,22 +107,28 @@ async def run_test_upload_and_process(regional_api_config, ndb: AsyncNucliaDBCli
 
         return condition
 
-    success, _ = await wait_for(resource_is_indexed(rid), logger=logger, max_wait=120, interval=1)
+    success, _ = await wait_for(
+        resource_is_indexed(rid), logger=logger, max_wait=120, schedule=ExponentialJitter(max_interval=5)
+    )
     assert success, "File was not indexed in time, not enough paragraphs found on resource"
 
 
+IMPORT_START_POLICY = RetryPolicy(
+    "import_start",
+    retry_on=(httpx.ReadError, httpx.ConnectError, httpx.RemoteProtocolError, httpx.ReadTimeout),
+    max_attempts=4,
+    max_delay=60,
+    schedule=ExponentialJitter(initial=1, max_interval=10),
+)
+
+
 async def run_test_import_kb(regional_api_config, ndb: AsyncNucliaDBClient, logger: Logger):
     """
     Imports a kb with three resources and some labelsets already created
     """
     kb = AsyncNucliaKB()
 
-    @backoff.on_exception(
-        backoff.expo,
-        (httpx.ReadError, httpx.ConnectError, httpx.RemoteProtocolError, httpx.ReadTimeout),
-        max_tries=4,
-        max_time=60,
-    )
+    @with_policy(IMPORT_START_POLICY, zone=regional_api_config.zone_slug)
     async def _start_import():
         return await kb.imports.start(path=f"{ASSETS_FILE_PATH}/e2e.financial.mini.export", ndb=ndb)
 
@@ -130,7 +148,10 @@ async def run_test_import_kb(regional_api_config, ndb: AsyncNucliaDBClient, logg
         return condition
 
     success, _ = await wait_for(
-        resources_are_imported(["disney", "hp", "vaccines"]), max_wait=120, logger=logger
+        resources_are_imported(["disney", "hp", "vaccines"]),
+        max_wait=120,
+        schedule=ExponentialJitter(initial=1, max_interval=10),
+        logger=logger,
     )
     assert success, "Expected imported resources not found"
 
@@ -163,7 +184,7 @@ async def run_test_da_ask_worker(regional_api_config, ndb: AsyncNucliaDBClient,
 
 
 async def run_test_check_da_ask_output(
-    regional_api_config, ask_task_id: str, ndb: AsyncNucliaDBClient, logger: Logger
+    regional_api_config, ask_task_id: str, ndb: AsyncNucliaDBClient, poller: KBStatePoller, logger: Logger
 ):
     kb = AsyncNucliaKB()
 
@@ -178,24 +199,15 @@ async def run_test_check_da_ask_output(
     # `destination` field in the AskOperation above: `da-{destination}`
     expected_field_id_prefix = "da-customsummary"
 
-    def resources_have_generated_fields(resource_slugs):
-        @wraps(resources_have_generated_fields)
-        async def condition() -> tuple[bool, Any]:
-            resources_have_field = await asyncio.gather(
-                *[
-                    has_generated_field(ndb, kb, resource_slug, expected_field_id_prefix)
-                    for resource_slug in resource_slugs
-                ]
-            )
-            result = all(resources_have_field)
-            return (result, None)
-
-        return condition
+    def all_have_field(resources: dict[str, Resource | None]) -> tuple[bool, None]:
+        return (all(has_generated_field(res, expected_field_id_prefix) for res in resources.values()), None)
 
     success, _ = await wait_for(
-        condition=resources_have_generated_fields(resource_slugs),
+        condition=poller.condition("resources_have_generated_fields", resource_slugs, all_have_field),
         max_wait=5 * 60,  # 5 minutes
-        interval=20,
+        schedule=Learned(
+            "resources_have_generated_fields", fallback=ExponentialJitter(initial=5, max_interval=20)
+        ),
         logger=logger,
     )
     assert success, f"Expected generated text fields not found in resources. task_id: {ask_task_id}"
@@ -207,24 +219,19 @@ async def run_test_check_da_ask_output(
         cleanup=True,
     )
 
-    def generated_fields_deleted_from_resources(resource_slugs):
-        @wraps(generated_fields_deleted_from_resources)
-        async def condition() -> tuple[bool, Any]:
-            resources_have_field = await asyncio.gather(
-                *[
-                    has_generated_field(ndb, kb, resource_slug, expected_field_id_prefix)
-                    for resource_slug in resource_slugs
-                ]
-            )
-            result = not any(resources_have_field)
-            return (result, None)
-
-        return condition
+    def none_has_field(resources: dict[str, Resource | None]) -> tuple[bool, None]:
+        return (
+            not any(has_generated_field(res, expected_field_id_prefix) for res in resources.values()),
+            None,
+        )
 
     success, _ = await wait_for(
-        condition=generated_fields_deleted_from_resources(resource_slugs),
+        condition=poller.condition("generated_fields_deleted_from_resources", resource_slugs, none_has_field),
         max_wait=5 * 60,  # 5 minutes
-        interval=20,
+        schedule=Learned(
+            "generated_fields_deleted_from_resources",
+            fallback=ExponentialJitter(initial=5, max_interval=20),
+        ),
         logger=logger,
     )
     assert success, f"Generated fields have not been deleted from resources. task_id: {ask_task_id}"
@@ -274,9 +281,9 @@ async def run_test_create_da_labeller(regional_api_config, ndb: AsyncNucliaDBCli
     )
 
 
-async def run_test_check_da_labeller_output(regional_api_config, ndb: AsyncNucliaDBClient, logger: Logger):
-    kb = AsyncNucliaKB()
-
+async def run_test_check_da_labeller_output(
+    regional_api_config, ndb: AsyncNucliaDBClient, poller: KBStatePoller, logger: Logger
+):
     expected_resource_labels = [
         ("disney", ("topic", "MEDIA")),
         ("hp", ("topic", "TECH")),
@@ -285,13 +292,11 @@ async def run_test_check_da_labeller_output(regional_api_config, ndb: AsyncNucli
     ]
 
     def resources_are_labelled(expected):
-        @wraps(resources_are_labelled)
-        async def condition() -> tuple[bool, Any]:
+        def predicate(resources: dict[str, Resource | None]) -> tuple[bool, Any]:
             result = False
             for resource_slug, (labelset, label) in expected:
-                try:
-                    res = await kb.resource.get(slug=resource_slug, show=["extracted"], ndb=ndb)
-                except NotFoundError:
+                res = resources[resource_slug]
+                if res is None or res.computedmetadata is None:
                     # some resource may still be missing from nucliadb, let's wait more
                     continue
                 for fc in res.computedmetadata.field_classifications:
@@ -321,9 +326,14 @@ async def run_test_check_da_labeller_output(regional_api_config, ndb: AsyncNucli
                         return (False, None)
             return (result, None)
 
-        return condition
+        slugs = [resource_slug for resource_slug, _ in expected]
+        return poller.condition("resources_are_labelled", slugs, predicate)
 
-    success, _ = await wait_for(resources_are_labelled(expected_resource_labels), logger=logger)
+    success, _ = await wait_for(
+        resources_are_labelled(expected_resource_labels),
+        schedule=ExponentialJitter(initial=2, max_interval=10),
+        logger=logger,
+    )
     assert success, "Expected computed labels not found in resources"
 
 
@@ -399,33 +409,31 @@ async def run_test_create_da_labeller_with_label_filter(
 
 
 async def run_test_check_da_labeller_with_label_filter_output(
-    regional_api_config, ndb: AsyncNucliaDBClient, logger: Logger
+    regional_api_config, ndb: AsyncNucliaDBClient, poller: KBStatePoller, logger: Logger
 ):
-    kb = AsyncNucliaKB()
-
     def filtered_resource_is_labelled():
-        @wraps(filtered_resource_is_labelled)
-        async def condition() -> tuple[bool, None]:
-            async def resource_augmented(slug: str) -> bool:
-                try:
-                    res = await kb.resource.get(slug=slug, show=["extracted"], ndb=ndb)
-                except NotFoundError:
-                    # some resource may still be missing from nucliadb, let's wait more
-                    return False
-                for fc in res.computedmetadata.field_classifications:
-                    if not (fc.field.field_type.name == "TEXT" and fc.field.field == "article"):
-                        continue
-                    computed_labels = [(cl.labelset, cl.label) for cl in fc.classifications]
-                    return ("topic-filtered", "CLIMBING") in computed_labels
+        def resource_augmented(res: Resource | None) -> bool:
+            if res is None or res.computedmetadata is None:
+                # some resource may still be missing from nucliadb, let's wait more
                 return False
+            for fc in res.computedmetadata.field_classifications:
+                if not (fc.field.field_type.name == "TEXT" and fc.field.field == "article"):
+                    continue
+                computed_labels = [(cl.labelset, cl.label) for cl in fc.classifications]
+                return ("topic-filtered", "CLIMBING") in computed_labels
+            return False
 
-            labeled_resource_augmented = await resource_augmented("climbing-with-label")
-            unlabeled_resource_augmented = await resource_augmented("climbing-without-label")
+        def predicate(resources: dict[str, Resource | None]) -> tuple[bool, None]:
+            labeled_resource_augmented = resource_augmented(resources["climbing-with-label"])
+            unlabeled_resource_augmented = resource_augmented(resources["climbing-without-label"])
             return (labeled_resource_augmented and not unlabeled_resource_augmented, None)
 
-        return condition
+        slugs = ["climbing-with-label", "climbing-without-label"]
+        return poller.condition("filtered_resource_is_labelled", slugs, predicate)
 
-    success = await wait_for(filtered_resource_is_labelled(), logger=logger)
+    success = await wait_for(
+        filtered_resource_is_labelled(), schedule=ExponentialJitter(initial=2, max_interval=10), logger=logger
+    )
     assert success, "Expected computed label not found in filtered resource"
 
 
@@ -492,7 +500,12 @@ async def run_test_check_embedding_model_migration(ndb: AsyncNucliaDBClient, tas
         return condition
 
     success, search_returned_results = await wait_for(
-        new_embedding_model_available(), max_wait=200, logger=logger
+        new_embedding_model_available(),
+        max_wait=200,
+        schedule=Learned(
+            "new_embedding_model_available", fallback=ExponentialJitter(initial=2, max_interval=10)
+        ),
+        logger=logger,
     )
     assert success is True, "embedding migration task did not finish on time"
     assert (
@@ -500,7 +513,7 @@ async def run_test_check_embedding_model_migration(ndb: AsyncNucliaDBClient, tas
     ), "expected to be able to search with the new embedding model but nucliadb didn't return resources"
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_find(ndb: AsyncNucliaDBClient):
     kb = AsyncNucliaKB()
 
@@ -518,7 +531,7 @@ async def run_test_find(ndb: AsyncNucliaDBClient):
     assert first_resource.slug == "chocolatier"
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_graph(ndb: AsyncNucliaDBClient, kbid: str):
     paths = await ndb.ndb.graph_search(
         kbid=kbid,
@@ -551,7 +564,7 @@ async def run_test_graph(ndb: AsyncNucliaDBClient, kbid: str):
     assert len(relations.relations) > 0
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_ask(ndb: AsyncNucliaDBClient):
     kb = AsyncNucliaKB()
 
@@ -599,7 +612,7 @@ async def run_test_ask(ndb: AsyncNucliaDBClient):
     assert "14" in ask_more_result.answer.decode().lower()
 
 
-@backoff.on_exception(backoff.constant, (AssertionError, ClientError), max_tries=5, interval=5)
+@with_policy(EVENTUAL_CONSISTENCY_POLICY)
 async def run_test_ask_query_image(ndb: AsyncNucliaDBClient):
     kb = AsyncNucliaKB()
     image_path = f"{ASSETS_FILE_PATH}/cocoabeans.png"
@@ -668,7 +681,12 @@ async def run_test_activity_log(regional_api_config, ndb, logger):
 
         return condition
 
-    success, logs = await wait_for(activity_log_is_stored(), max_wait=180, logger=logger)
+    success, logs = await wait_for(
+        activity_log_is_stored(),
+        max_wait=180,
+        schedule=ExponentialJitter(initial=2, max_interval=15),
+        logger=logger,
+    )
     assert success, "Activity logs didn't get stored in time"
 
     def search_log_is_stored():
@@ -689,7 +707,12 @@ async def run_test_activity_log(regional_api_config, ndb, logger):
 
         return condition
 
-    success, _ = await wait_for(search_log_is_stored(), max_wait=180, logger=logger)
+    success, _ = await wait_for(
+        search_log_is_stored(),
+        max_wait=180,
+        schedule=ExponentialJitter(initial=2, max_interval=15),
+        logger=logger,
+    )
     assert success, "Search activity log didn't get stored in time"
 
 
@@ -715,7 +738,12 @@ async def run_test_remi_query(regional_api_config, ndb, logger):
 
         return condition
 
-    success, _ = await wait_for(remi_data_is_computed(), max_wait=180, logger=logger)
+    success, _ = await wait_for(
+        remi_data_is_computed(),
+        max_wait=180,
+        schedule=ExponentialJitter(initial=2, max_interval=15),
+        logger=logger,
+    )
     assert success, "Remi scores didn't get computed in time"
 
 
@@ -747,7 +775,10 @@ async def run_test_tokens_on_activity_log(
         return condition
 
     success, activity_log_nuclia_tokens = await wait_for(
-        nuclia_tokens_calculated_on_activity_log(), max_wait=300, logger=logger
+        nuclia_tokens_calculated_on_activity_log(),
+        max_wait=300,
+        schedule=ExponentialJitter(initial=5, max_interval=20),
+        logger=logger,
     )
     assert success, "Nuclia tokens were not added to activity log event on time"
     assert activity_log_nuclia_tokens > 0
@@ -776,18 +807,24 @@ async def run_test_tokens_on_accounting(global_api: GlobalAPI, account: str, kbi
         return condition
 
     success, accouting_nuclia_tokens = await wait_for(
-        nuclia_tokens_stored_on_accounting(), max_wait=600, interval=10, logger=logger
+        nuclia_tokens_stored_on_accounting(),
+        max_wait=600,
+        schedule=ExponentialJitter(initial=5, max_interval=30),
+        logger=logger,
     )
     assert success, "Nuclia tokens were not received by accounting on time"
     return accouting_nuclia_tokens
 
 
 async def run_test_kb_deletion(regional_api_config, kbid, kb_slug, logger):
+    zone = regional_api_config.zone_slug
+    account = regional_api_config.global_config.permanent_account_id
     kbs = AsyncNucliaKBS()
     logger("deleting " + kbid)
-    await kbs.delete(zone=regional_api_config.zone_slug, id=kbid)
+    await kbs.delete(zone=zone, id=kbid)
+    KB_INDEX.discard(zone, account, kb_slug)
 
-    kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
+    kbid = await get_kbid_from_slug(zone, kb_slug, account, fresh=True)
     assert kbid is None
 
 
@@ -814,9 +851,7 @@ async def test_kb_features(request: pytest.FixtureRequest, regional_api_config):
     kb_slug = f"{regional_api_config.test_kb_slug}-test_kb_features"
 
     # Make sure the kb used for this test is deleted, as the slug is reused:
-    old_kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
-    if old_kbid is not None:
-        await AsyncNucliaKBS().delete(zone=regional_api_config.zone_slug, id=old_kbid)
+    await delete_kb_if_exists(regional_api_config, kb_slug)
 
     # Creates a brand new kb that will be used troughout this test
     kbid = await create_test_kb(
@@ -861,14 +896,18 @@ async def test_kb_features(request: pytest.FixtureRequest, regional_api_config):
     # This /find and /ask requests are crafted so they trigger all the existing calls to predict features
     # We wait until find succeeds to run the ask tests to maximize the chances that all indexes will be
     # available and so minimize the llm costs retrying
+    # All the checks waiting on resources state share the same poller, so they are served from one snapshot
+    # of the KB per tick instead of fetching the same resources each one on its own
+    poller = KBStatePoller(async_ndb)
     await asyncio.gather(
-        run_test_check_da_labeller_output(regional_api_config, async_ndb, logger),
+        run_test_check_da_labeller_output(regional_api_config, async_ndb, poller, logger),
         run_test_check_embedding_model_migration(async_ndb, embedding_migration_task_id, logger),
         run_test_find(async_ndb),
         run_test_graph(async_ndb, kbid),
-        run_test_check_da_labeller_with_label_filter_output(regional_api_config, async_ndb, logger),
-        run_test_check_da_ask_output(regional_api_config, ask_task_id, async_ndb, logger),
+        run_test_check_da_labeller_with_label_filter_output(regional_api_config, async_ndb, poller, logger),
+        run_test_check_da_ask_output(regional_api_config, ask_task_id, async_ndb, poller, logger),
     )
+    logger(f"Resources state polled {poller.fetches} times")
     await asyncio.gather(
         run_test_ask(async_ndb),
         run_test_ask_query_image(async_ndb),
@@ -909,9 +948,7 @@ async def test_kb_usage(
     kb_slug = f"{regional_api_config.test_kb_slug}-test_kb_usage"
 
     # Make sure the kb used for this test is deleted, as the slug is reused:
-    old_kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
-    if old_kbid is not None:
-        await AsyncNucliaKBS().delete(zone=regional_api_config.zone_slug, id=old_kbid)
+    await delete_kb_if_exists(regional_api_config, kb_slug)
 
     # Creates a brand new kb that will be used troughout this test
     kbid = await create_test_kb(
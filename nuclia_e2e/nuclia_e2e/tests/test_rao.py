@@ -1,5 +1,6 @@
 from nuclia.exceptions import RaoAPIException
 from nuclia.lib.agent import AsyncAgentClient
+from nuclia_e2e.slug_index import AGENT_INDEX
 from nuclia_e2e.tests.conftest import RegionalAPI
 from nuclia_e2e.tests.conftest import ZoneConfig
 from nuclia_e2e.utils import delete_test_agent
@@ -29,6 +30,7 @@ async def create_rao_with_agents(
     agent_id = (await regional_api.create_rao(account_id=account, slug=slug, mode="agent"))["id"]
     # Check it got created
     assert agent_id is not None
+    AGENT_INDEX.put(regional_api_config.zone_slug, account, slug, agent_id)
     assert regional_api_config.global_config is not None
     api_url = f"https://{regional_api_config.zone_slug}.{regional_api_config.global_config.base_domain}/api"
     account = regional_api_config.global_config.permanent_account_id
@@ -134,13 +136,13 @@ async def test_rao_basic(
     6. Delete the session
     """
     test_slug = f"{regional_api_config.test_kb_slug}-rao-e2e-test"
+    assert regional_api_config.global_config is not None
+    account = regional_api_config.global_config.permanent_account_id
     # Cleanup any previous test RAO
-    agent_id = await get_agent_from_slug(regional_api_config.zone_slug, test_slug)
+    agent_id = await get_agent_from_slug(regional_api_config.zone_slug, test_slug, account)
     if agent_id is not None:
         await delete_test_agent(regional_api_config, agent_id=agent_id, agent_slug=test_slug)
-    assert regional_api_config.global_config is not None
 
-    account = regional_api_config.global_config.permanent_account_id
     agent_id = await create_rao_with_agents(regional_api, regional_api_config, test_slug, account, kb_id)
 
     try:
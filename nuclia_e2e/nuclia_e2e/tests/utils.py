@@ -1,9 +1,15 @@
 from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterable
 from nuclia import get_regional_url
 from nuclia import sdk
 from nuclia.lib.kb import AsyncNucliaDBClient
 from nuclia.sdk.auth import AsyncNucliaAuth
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.polling import Learned
 from nuclia_e2e.utils import get_async_kb_ndb_client
+from nuclia_e2e.utils import wait_for
 from nuclia_models.worker.proto import ApplyTo
 from nuclia_models.worker.proto import AskOperation
 from nuclia_models.worker.proto import Filter
@@ -14,15 +20,20 @@ from nuclia_models.worker.tasks import DataAugmentation
 from nuclia_models.worker.tasks import TaskName
 from nuclia_models.worker.tasks import TaskResponse
 from nucliadb_models import TextField
+from nucliadb_models.resource import Resource
 from nucliadb_sdk.v2.exceptions import NotFoundError
 from pytest_asyncio_cooperative import Lock  # type: ignore[import-untyped]
+from time import monotonic
+from typing import ClassVar
+from typing import TypeVar
 
 import asyncio
 import contextlib
-import time
 import traceback
 import uuid
 
+T = TypeVar("T")
+
 locks: dict[str, Lock] = {}
 
 # Global variable to know which tasks were created in this test
@@ -88,30 +99,88 @@ async def as_default_generative_model_for_kb(
                 await kb.update_configuration(ndb=ndb, generative_model=previous_generative_model)
 
 
-async def has_generated_field(
-    ndb: AsyncNucliaDBClient,
-    kb: sdk.AsyncNucliaKB,
-    resource_slug: str,
-    expected_field_id_prefix: str,
-) -> bool:
+def has_generated_field(resource: Resource | None, expected_field_id_prefix: str) -> bool:
     """
     Check if the resource has the extracted text for the generated field.
     """
-    try:
-        res = await kb.resource.get(slug=resource_slug, show=["values", "extracted"], ndb=ndb)
-    except NotFoundError:
+    if resource is None or resource.data is None or resource.data.texts is None:
         # some resource may still be missing from nucliadb, let's wait more
         return False
-    try:
-        for fid, data in res.data.texts.items():
-            if fid.startswith(expected_field_id_prefix) and data.extracted.text.text is not None:
-                return True
-    except (TypeError, AttributeError):
-        # If the resource does not have the expected structure, let's wait more
-        return False
-    else:
-        # If we reach here, it means the field was not found
-        return False
+    for fid, data in resource.data.texts.items():
+        extracted = data.extracted.text if data.extracted is not None else None
+        if fid.startswith(expected_field_id_prefix) and extracted is not None and extracted.text is not None:
+            return True
+    # If we reach here, it means the field was not found
+    return False
+
+
+class KBStatePoller:
+    """
+    Shares the state of a KB's resources between all the conditions waiting on it concurrently.
+
+    Instead of every waiter fetching the same resources on its own schedule, waiters ask for a snapshot of
+    the slugs they care about. The poller fetches all watched slugs at once and hands the same snapshot to
+    everyone asking for it within `max_age` seconds, so the request volume doesn't grow with the number of
+    concurrent waiters.
+    """
+
+    SHOW: ClassVar[list[str]] = ["basic", "values", "extracted"]
+
+    def __init__(self, ndb: AsyncNucliaDBClient, max_age: float = 5):
+        self.ndb = ndb
+        self.max_age = max_age
+        self.fetches = 0
+        self._kb = sdk.AsyncNucliaKB()
+        self._slugs: set[str] = set()
+        self._snapshot: dict[str, Resource | None] = {}
+        self._fetched_at = float("-inf")
+        self._refreshing: asyncio.Task | None = None
+
+    async def snapshot(self, slugs: Iterable[str]) -> dict[str, Resource | None]:
+        slugs = list(slugs)
+        self._slugs.update(slugs)
+        stale = monotonic() - self._fetched_at > self.max_age
+        if stale or any(slug not in self._snapshot for slug in slugs):
+            await self._refresh()
+        return {slug: self._snapshot.get(slug) for slug in slugs}
+
+    def condition(
+        self,
+        name: str,
+        slugs: Iterable[str],
+        predicate: Callable[[dict[str, Resource | None]], tuple[bool, T]],
+    ) -> Callable[[], Awaitable[tuple[bool, T]]]:
+        """Build a `wait_for` condition named `name` that evaluates `predicate` on the shared snapshot."""
+        slugs = list(slugs)
+
+        async def condition() -> tuple[bool, T]:
+            return predicate(await self.snapshot(slugs))
+
+        condition.__name__ = name
+        return condition
+
+    async def _refresh(self) -> None:
+        # Waiters arriving while a fetch is in flight reuse it instead of starting their own
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._fetch(sorted(self._slugs)))
+        refreshing = self._refreshing
+        try:
+            await asyncio.shield(refreshing)
+        finally:
+            if self._refreshing is refreshing and refreshing.done():
+                self._refreshing = None
+
+    async def _fetch(self, slugs: list[str]) -> None:
+        resources = await asyncio.gather(*[self._get(slug) for slug in slugs])
+        self.fetches += 1
+        self._snapshot = dict(zip(slugs, resources, strict=True))
+        self._fetched_at = monotonic()
+
+    async def _get(self, slug: str) -> Resource | None:
+        try:
+            return await self._kb.resource.get(slug=slug, show=self.SHOW, ndb=self.ndb)
+        except NotFoundError:
+            return None
 
 
 async def create_omelette_resource(ndb: AsyncNucliaDBClient):
@@ -122,17 +191,18 @@ async def create_omelette_resource(ndb: AsyncNucliaDBClient):
         slug=slug,
         texts={"omelette": TextField(body="To cook an omelette, you need to crack the egg.")},
     )
-    max_wait_seconds: int = 300
-    start = time.time()
-    processed = False
-    while (time.time() - start) < max_wait_seconds:
-        resource = await kb.resource.get(slug=slug, show=["values"])
+
+    async def omelette_is_processed() -> tuple[bool, None]:
+        resource = await kb.resource.get(slug=slug, show=["values"], ndb=ndb)
         status = resource.data.texts["omelette"].status
-        if status == "PROCESSED":
-            processed = True
-            break
         print(status)
-        await asyncio.sleep(5)
+        return status == "PROCESSED", None
+
+    processed, _ = await wait_for(
+        omelette_is_processed,
+        max_wait=300,
+        schedule=Learned("omelette_is_processed", fallback=ExponentialJitter(initial=1, max_interval=10)),
+    )
     assert processed, "Resource not processed in time"
 
 
@@ -0,0 +1,208 @@
+"""How every httpx client of the e2e is configured: timeouts, connection limits, HTTP version and transports.
+
+The SDK instantiates httpx clients in a lot of places, sometimes very deeply nested, so `TransportFactory`
+is installed as the default of `httpx.AsyncClient` (see `TransportFactory.install`) instead of being passed
+around. Our own helpers can get their clients from `TRANSPORT_FACTORY.async_client` too.
+
+Each request gets the timeouts of its operation class (search, upload, stream, poll, or default), taken from
+`E2ESettings`, unless it was given explicit timeouts when built.
+
+Clients built without their own transport options share a connection pool per host, so connections opened
+by any client (or warmed up at the start of the session, see `nuclia_e2e.prewarm`) are reused by all the
+others talking to the same host.
+"""
+
+from enum import Enum
+from importlib.util import find_spec
+from nuclia_e2e.clients import ConnectionTracingTransport
+from nuclia_e2e.resilience import CircuitBreakerTransport
+from nuclia_e2e.resilience import HedgingTransport
+from nuclia_e2e.settings import E2ESettings
+from nuclia_e2e.settings import HttpTimeouts
+from nuclia_e2e.settings import settings
+from typing import Any
+
+import asyncio
+import httpx
+import re
+
+
+class OperationClass(str, Enum):
+    SEARCH = "search"
+    UPLOAD = "upload"
+    STREAM = "stream"
+    POLL = "poll"
+    DEFAULT = "default"
+
+
+# Operation class of the requests, by method (None for any) and url path, first match wins. Any other GET
+# is a poll.
+OPERATION_CLASSES: list[tuple[OperationClass, str | None, re.Pattern[str]]] = [
+    (OperationClass.STREAM, None, re.compile(r"/(ask|notifications|chat)$")),
+    (OperationClass.STREAM, "GET", re.compile(r"/(download|export)(/|$)")),
+    (OperationClass.UPLOAD, None, re.compile(r"/(upload|tusupload|import)(/|$)")),
+    (OperationClass.UPLOAD, "POST", re.compile(r"/processing/(push|upload)$")),
+    (OperationClass.SEARCH, None, re.compile(r"/(find|search|suggest|catalog|graph)$")),
+]
+
+
+def operation_class(request: httpx.Request) -> OperationClass:
+    for operation, method, pattern in OPERATION_CLASSES:
+        if (method is None or request.method == method) and pattern.search(request.url.path):
+            return operation
+    return OperationClass.POLL if request.method == "GET" else OperationClass.DEFAULT
+
+
+class OperationTimeoutTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport to give each request the timeouts of its operation class.
+
+    Requests built with explicit timeouts, that is, other than the ones of the client, keep them.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        client_timeout: httpx.Timeout,
+        timeouts: dict[OperationClass, httpx.Timeout],
+    ):
+        self._transport = transport
+        self._client_timeout = client_timeout.as_dict()
+        self._timeouts = {operation: timeout.as_dict() for operation, timeout in timeouts.items()}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.extensions.get("timeout") == self._client_timeout:
+            request.extensions["timeout"] = self._timeouts[operation_class(request)]
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class SharedPoolTransport(httpx.AsyncBaseTransport):
+    """Sends requests through the connection pool of their host, shared by all clients of the event loop."""
+
+    def __init__(self, factory: "TransportFactory"):
+        self._factory = factory
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._factory.host_pool(request.url).handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # Pools outlive the clients using them, they're closed with `TransportFactory.aclose`
+        pass
+
+
+# Arguments that configure the transport of a client. Clients given any of them keep their own transport.
+_TRANSPORT_ARGS = ("transport", "verify", "cert", "proxy", "mounts", "limits", "http1", "http2", "trust_env")
+
+
+def _timeout(timeouts: HttpTimeouts) -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=timeouts.connect, read=timeouts.read, write=timeouts.write, pool=timeouts.pool
+    )
+
+
+def _is_shareable(kwargs: dict[str, Any]) -> bool:
+    return all(kwargs.get(arg) is None for arg in _TRANSPORT_ARGS)
+
+
+class TransportFactory:
+    def __init__(self, config: E2ESettings):
+        if config.http2 and find_spec("h2") is None:
+            err_msg = "HTTP2 needs the h2 package, install the http2 extra"
+            raise RuntimeError(err_msg)
+        self.config = config
+        self.timeouts = {
+            operation: _timeout(getattr(config, f"http_timeout_{operation.value}"))
+            for operation in OperationClass
+        }
+        self._original_init: Any = None
+        # Connection pools by event loop, scheme, host and port
+        self._pools: dict[
+            tuple[asyncio.AbstractEventLoop, bytes, bytes, int | None], httpx.AsyncHTTPTransport
+        ] = {}
+
+    def limits(self) -> httpx.Limits:
+        # Only for the clients that can't use the shared pools, each bounded on its own
+        return httpx.Limits(
+            max_connections=self.config.client_max_connections,
+            max_keepalive_connections=self.config.client_max_keepalive_connections,
+            keepalive_expiry=self.config.client_keepalive_expiry,
+        )
+
+    def shared_limits(self) -> httpx.Limits:
+        """Limits of the pool of a host shared by all the clients of the loop, so by the whole session."""
+        max_connections = self.config.shared_pool_max_connections
+        if self.config.benchmark_load == "1":
+            # Files in flight at the highest level must not queue for a connection behind the other tests
+            max_connections = max(
+                max_connections,
+                max(self.config.benchmark_load_concurrency) + self.config.client_max_connections,
+            )
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=self.config.shared_pool_max_keepalive_connections,
+            keepalive_expiry=self.config.client_keepalive_expiry,
+        )
+
+    def host_pool(self, url: httpx.URL) -> httpx.AsyncHTTPTransport:
+        """Connection pool to the host of `url`, shared by all the clients used in the running loop."""
+        key = (asyncio.get_running_loop(), url.raw_scheme, url.raw_host, url.port)
+        if key not in self._pools:
+            self._pools[key] = httpx.AsyncHTTPTransport(limits=self.shared_limits(), http2=self.config.http2)
+        return self._pools[key]
+
+    async def aclose(self) -> None:
+        """Close the connection pools of the running loop."""
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self._pools if key[0] is loop]:
+            await self._pools.pop(key).aclose()
+
+    def client_kwargs(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+        """Arguments of an httpx client, with our defaults for whatever was not given."""
+        kwargs = dict(kwargs)
+        kwargs.setdefault("timeout", self.timeouts[OperationClass.DEFAULT])
+        kwargs.setdefault("limits", self.limits())
+        # Many requests to the same host share a single connection, instead of one connection each
+        if self.config.http2:
+            kwargs.setdefault("http2", True)
+        return kwargs
+
+    def wrap(
+        self, transport: httpx.AsyncBaseTransport, client_timeout: httpx.Timeout, *, shared: bool = False
+    ) -> httpx.AsyncBaseTransport:
+        """Add our transports on top of the one of a client, or of the shared pools if `shared`."""
+        if shared:
+            transport = SharedPoolTransport(self)
+        # Fail fast on calls to endpoints that are known to be down, and hedge slow idempotent reads. Each
+        # hedged request goes through the breaker, and is measured, on its own.
+        return HedgingTransport(
+            CircuitBreakerTransport(
+                OperationTimeoutTransport(
+                    ConnectionTracingTransport(transport), client_timeout, self.timeouts
+                )
+            )
+        )
+
+    def async_client(self, **kwargs: Any) -> httpx.AsyncClient:
+        if self._original_init is not None:
+            return httpx.AsyncClient(**kwargs)
+        client = httpx.AsyncClient(**self.client_kwargs(kwargs))
+        client._transport = self.wrap(client._transport, client.timeout, shared=_is_shareable(kwargs))
+        return client
+
+    def install(self) -> None:
+        """Make every `httpx.AsyncClient` built from now on, including the ones of the SDK, come from here."""
+        if self._original_init is not None:
+            return
+        original_init = self._original_init = httpx.AsyncClient.__init__
+        factory = self
+
+        def init(client: httpx.AsyncClient, *args: Any, **kwargs: Any) -> None:
+            original_init(client, *args, **factory.client_kwargs(kwargs))
+            client._transport = factory.wrap(client._transport, client.timeout, shared=_is_shareable(kwargs))
+
+        httpx.AsyncClient.__init__ = init  # type: ignore[method-assign,assignment]
+
+
+TRANSPORT_FACTORY = TransportFactory(settings)
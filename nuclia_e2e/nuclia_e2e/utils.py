@@ -1,34 +1,32 @@
 from collections.abc import Awaitable
 from collections.abc import Callable
 from contextlib import contextmanager
-from functools import wraps
 from nuclia.exceptions import NuaAPIException
 from nuclia.lib.kb import AsyncNucliaDBClient
 from nuclia.lib.kb import Environment
 from nuclia.lib.kb import NucliaDBClient
-from nuclia.sdk.agents import AsyncNucliaAgents
 from nuclia.sdk.kbs import AsyncNucliaKBS
+from nuclia_e2e.clients import CLIENT_POOL
+from nuclia_e2e.polling import DEFAULT_SCHEDULE
+from nuclia_e2e.polling import ExponentialJitter
+from nuclia_e2e.polling import Fixed
+from nuclia_e2e.polling import poll_deadline
+from nuclia_e2e.polling import POLL_HISTORY
+from nuclia_e2e.polling import PollSchedule
+from nuclia_e2e.polling import PollStats
+from nuclia_e2e.polling import record_poll_stats
+from nuclia_e2e.resilience import Retriable
+from nuclia_e2e.resilience import RetryPolicy
+from nuclia_e2e.resilience import with_policy
+from nuclia_e2e.slug_index import AGENT_INDEX
+from nuclia_e2e.slug_index import KB_INDEX
 from pathlib import Path
-from tenacity import retry
-from tenacity import retry_if_exception
-from tenacity import retry_if_exception_type
-from tenacity import RetryCallState
-from tenacity import stop_after_attempt
-from tenacity import wait_fixed
-from tenacity import wait_random
 from time import monotonic
-from typing import cast
-from typing import ClassVar
-from typing import Generic
 from typing import TypeVar
 
 import asyncio
 import httpx
-import inspect
-import nucliadb_sdk
 import pytest
-import re
-import requests
 
 ASSETS_FILE_PATH = Path(__file__).parent.joinpath("assets")
 NUCLIADB_KB_ENDPOINT = "/api/v1/kb/{kb}"
@@ -63,68 +61,108 @@ def skip_on_provider_transient_error():
         raise
 
 
-@retry(
-    stop=stop_after_attempt(5),
-    wait=wait_random(2, 10),
-    retry=retry_if_exception(_is_kb_creation_rate_limited),
-    reraise=True,
+KB_CREATION_POLICY = RetryPolicy(
+    "kb_creation",
+    retry_on=_is_kb_creation_rate_limited,
+    max_attempts=5,
+    schedule=ExponentialJitter(initial=2, max_interval=10, jitter=0.5),
 )
+
+
+@with_policy(KB_CREATION_POLICY)
 async def create_test_kb(
     regional_api_config, kb_slug, logger: Logger = print, semantic_model: str | None = None
 ) -> str:
+    zone = regional_api_config.zone_slug
+    account = regional_api_config.global_config.permanent_account_id
     kbs = AsyncNucliaKBS()
     new_kb = await kbs.add(
-        zone=regional_api_config.zone_slug,
+        zone=zone,
         slug=kb_slug,
         learning_configuration={"semantic_model": semantic_model} if semantic_model is not None else None,
     )
 
-    kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
+    kbid = await get_kbid_from_slug(zone, kb_slug, account, fresh=True)
     assert kbid is not None
+    KB_INDEX.put(zone, account, kb_slug, kbid)
     logger(f"Created kb {new_kb['id']}")
     return kbid
 
 
 async def delete_test_kb(regional_api_config, kbid, kb_slug, logger=print):
+    zone = regional_api_config.zone_slug
+    account = regional_api_config.global_config.permanent_account_id
     kbs = AsyncNucliaKBS()
     logger(f"Deleting kb {kbid}")
-    await kbs.delete(zone=regional_api_config.zone_slug, id=kbid)
+    await kbs.delete(zone=zone, id=kbid)
+    KB_INDEX.discard(zone, account, kb_slug)
 
-    kbid = await get_kbid_from_slug(regional_api_config.zone_slug, kb_slug)
+    kbid = await get_kbid_from_slug(zone, kb_slug, account, fresh=True)
     assert kbid is None
 
 
+async def delete_kb_if_exists(regional_api_config, kb_slug, logger: Logger = print) -> None:
+    """Delete the KB left by a previous run of a test that reuses its slug, if any."""
+    zone = regional_api_config.zone_slug
+    account = regional_api_config.global_config.permanent_account_id
+    old_kbid = await get_kbid_from_slug(zone, kb_slug, account)
+    if old_kbid is not None:
+        logger(f"Deleting kb {old_kbid} left by a previous run")
+        await AsyncNucliaKBS().delete(zone=zone, id=old_kbid)
+        KB_INDEX.discard(zone, account, kb_slug)
+
+
 async def wait_for(
     condition: Callable[[], Awaitable[tuple[bool, T]]],
     max_wait: float = 60,
-    interval: float = 5,
+    interval: float | None = None,
     logger: Logger = print,
+    schedule: PollSchedule | None = None,
 ) -> tuple[bool, T]:
+    """Poll `condition` until it succeeds or the deadline is reached.
+
+    The deadline is `max_wait` seconds from now, or the one of the enclosing wait (see
+    `nuclia_e2e.polling.poll_deadline`) if it's earlier. Sleeps between polls are decided by `schedule`,
+    `interval` is kept as a shortcut for a fixed schedule.
+    """
     func_name = condition.__name__
-    logger(f"start wait_for '{func_name}', max_wait={max_wait}s")
+    if schedule is None:
+        schedule = Fixed(interval) if interval is not None else DEFAULT_SCHEDULE
+    stats = PollStats(waits=1)
     start = monotonic()
-    success, data = await condition()
-    while not success and monotonic() - start < max_wait:
-        await asyncio.sleep(interval)
+    with poll_deadline(max_wait) as deadline:
+        logger(f"start wait_for '{func_name}', max_wait={deadline - start:.1f}s")
         success, data = await condition()
-    logger(f"wait_for '{func_name}' success={success} in {monotonic() - start} seconds")
+        stats.polls += 1
+        while not success and (remaining := deadline - monotonic()) > 0:
+            delay = min(schedule.next_delay(stats.polls, monotonic() - start), remaining)
+            await asyncio.sleep(delay)
+            stats.slept += delay
+            success, data = await condition()
+            stats.polls += 1
+    stats.elapsed = monotonic() - start
+    if success:
+        POLL_HISTORY.record(func_name, stats.elapsed)
+    record_poll_stats(func_name, stats)
+    logger(f"wait_for '{func_name}' success={success} in {stats.elapsed} seconds ({stats})")
     return success, data
 
 
-async def get_kbid_from_slug(zone: str, slug: str) -> str | None:
-    kbs = AsyncNucliaKBS()
-    all_kbs = await kbs.list()
-    kbids_by_slug = {kb.slug: kb.id for kb in all_kbs}
-    kbid = kbids_by_slug.get(slug)
-    return kbid
+async def get_kbid_from_slug(zone: str, slug: str, account: str, *, fresh: bool = False) -> str | None:
+    """Id of the KB of `account` in `zone` with `slug`, from the session index unless `fresh`.
 
+    Reads that verify a KB was just created or deleted must be `fresh`.
+    """
+    if fresh:
+        return (await KB_INDEX.fetch(zone, account)).get(slug)
+    return await KB_INDEX.get(zone, account, slug)
 
-async def get_agent_from_slug(zone: str, slug: str) -> str | None:
-    agents = AsyncNucliaAgents()
-    all_agents = await agents.list()
-    agentids_by_slug = {agent.slug: agent.id for agent in all_agents}
-    agentid = agentids_by_slug.get(slug)
-    return agentid
+
+async def get_agent_from_slug(zone: str, slug: str, account: str, *, fresh: bool = False) -> str | None:
+    """Id of the agent of `account` in `zone` with `slug`, from the session index unless `fresh`."""
+    if fresh:
+        return (await AGENT_INDEX.fetch(zone, account)).get(slug)
+    return await AGENT_INDEX.get(zone, account, slug)
 
 
 async def delete_test_agent(regional_api_config, agent_id, agent_slug, logger=print):
@@ -132,93 +170,9 @@ async def delete_test_agent(regional_api_config, agent_id, agent_slug, logger=pr
     agents = AsyncNucliaKBS()
     logger(f"Deleting agent {agent_id}")
     await agents.delete(zone=regional_api_config.zone_slug, id=agent_id)
-
-
-class Retriable(Generic[T]):
-    RETRIABLE_STATUS_CODES: ClassVar[set[int]] = {429, 502, 503, 504, 512}
-
-    def __init__(self, client: T, is_async: bool):  # noqa: FBT001
-        self._client = client
-        self._is_async = is_async
-        self.max_attempts = 24
-
-    def __getattr__(self, name: str):
-        attr = getattr(self._client, name)
-
-        if callable(attr) and not name.startswith("_"):
-            if self._is_async and inspect.iscoroutinefunction(attr):
-                return self._wrap_async(attr, name)
-            if not self._is_async and not inspect.iscoroutinefunction(attr):
-                return self._wrap_sync(attr, name)
-        return attr
-
-    def _wrap_sync(self, func: Callable, func_name: str):
-        @wraps(func)
-        @self._retry_on_transient_errors(func_name)
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
-
-        return wrapper
-
-    def _wrap_async(self, func: Callable, func_name: str):
-        @wraps(func)
-        @self._retry_on_transient_errors(func_name)
-        async def wrapper(*args, **kwargs):
-            return await func(*args, **kwargs)
-
-        return wrapper
-
-    def _retry_on_transient_errors(self, func_name: str):
-        def log_before_sleep(retry_state: RetryCallState):
-            attempt = retry_state.attempt_number
-            assert retry_state.outcome is not None
-            exc = retry_state.outcome.exception()
-            print(
-                f"[Retry #{attempt}/{self.max_attempts}] "
-                f"Retrying '{func_name}' due to {type(exc).__name__}: {exc}"
-            )
-
-        # Wait up to 2 minutes,
-        return retry(
-            stop=stop_after_attempt(self.max_attempts),
-            wait=wait_fixed(5),
-            retry=retry_if_exception(lambda exc: self._is_transient_exception(exc, func_name)),
-            before_sleep=log_before_sleep,
-            reraise=True,
-        )
-
-    def _is_transient_exception(self, exc: BaseException, func_name: str) -> bool:
-        if isinstance(exc, httpx.HTTPStatusError):
-            return exc.response.status_code in self.RETRIABLE_STATUS_CODES
-
-        if isinstance(exc, requests.HTTPError) and exc.response is not None:
-            return exc.response.status_code in self.RETRIABLE_STATUS_CODES
-
-        if isinstance(exc, NuaAPIException):
-            return getattr(exc, "code", None) in self.RETRIABLE_STATUS_CODES
-
-        # This is hacky, would be better to fix the nuclia.py to return a better exception, but i didn't want
-        # to mess with the sdk that has been raising those exceptions for long, only for the tests...
-        if isinstance(exc, RuntimeError | nucliadb_sdk.v2.exceptions.UnknownError):
-            codes = "|".join(map(str, self.RETRIABLE_STATUS_CODES))
-            match = re.search(rf"[^\d]({codes})[^\d]", str(exc))
-            return match is not None
-
-        # Maybe this is not transient, but as we cannot see for sue the source of this errors, probably always
-        # some networking, we'll retry anyway, if it does all retries, then probably there's something pretty
-        # broken
-        if isinstance(exc, httpx.ReadError | httpx.RemoteProtocolError):  # noqa: SIM103
-            return True
-
-        return False
-
-    @classmethod
-    def wrap_sync(cls, client: T) -> T:
-        return cast("T", cls(client, is_async=False))
-
-    @classmethod
-    def wrap_async(cls, client: T) -> T:
-        return cast("T", cls(client, is_async=True))
+    AGENT_INDEX.discard(
+        regional_api_config.zone_slug, regional_api_config.global_config.permanent_account_id, agent_slug
+    )
 
 
 def get_async_kb_ndb_client(
@@ -226,7 +180,11 @@ def get_async_kb_ndb_client(
     kbid: str,
     user_token: str | None = None,
     service_account_token: str | None = None,
+    *,
+    retried: bool = True,
 ) -> AsyncNucliaDBClient:
+    """Shared client of a KB, whose calls are retried with their `RetryPolicy` unless not `retried` (e.g. to
+    benchmark them)."""
     from nuclia import REGIONAL
 
     assert any((user_token, service_account_token)), "One of user_token or service_account_token must be set"
@@ -242,8 +200,12 @@ def get_async_kb_ndb_client(
     elif service_account_token is not None:
         auth_params["api_key"] = service_account_token
 
-    ndb = AsyncNucliaDBClient(environment=Environment.CLOUD, url=kb_base_url, region=zone, **auth_params)
-    return Retriable.wrap_async(ndb)
+    def build() -> AsyncNucliaDBClient:
+        ndb = AsyncNucliaDBClient(environment=Environment.CLOUD, url=kb_base_url, region=zone, **auth_params)
+        return Retriable.wrap_async(ndb, zone=zone) if retried else ndb
+
+    # Clients are shared for the whole session, so they reuse their connections
+    return CLIENT_POOL.get(("nucliadb", zone, kbid, user_token, service_account_token, retried), build)
 
 
 def get_sync_kb_ndb_client(
@@ -269,29 +231,14 @@ def get_sync_kb_ndb_client(
         auth_params["api_key"] = service_account_token
 
     ndb = NucliaDBClient(environment=Environment.CLOUD, url=kb_base_url, region=zone, **auth_params)
-    return Retriable.wrap_sync(ndb)
-
-
-def make_retry_async(attempts=3, delay=10, exceptions=None):
-    def _log_before_sleep(retry_state: RetryCallState):
-        assert retry_state.fn is not None
-        fn_name = retry_state.fn.__name__
-        attempt_number = retry_state.attempt_number
-        assert retry_state.outcome is not None
-        exception = retry_state.outcome.exception()
-        print(
-            f"[Retry] Attempt {attempt_number} for function '{fn_name}'"
-            f" due to {type(exception).__name__}: {exception}"
-        )
-
-    kwargs = {
-        "stop": stop_after_attempt(attempts),
-        "wait": wait_fixed(delay),
-        "before_sleep": _log_before_sleep,
-        "reraise": True,
-    }
-
-    if exceptions:
-        kwargs["retry"] = retry_if_exception_type(tuple(exceptions))
-
-    return retry(**kwargs)
+    return Retriable.wrap_sync(ndb, zone=zone)
+
+
+def make_retry_async(attempts=3, delay=10, exceptions=None, zone: str | None = None):
+    policy = RetryPolicy(
+        "retry_block",
+        retry_on=tuple(exceptions) if exceptions else (Exception,),
+        max_attempts=attempts,
+        schedule=Fixed(delay),
+    )
+    return with_policy(policy, zone)